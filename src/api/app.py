@@ -1,11 +1,30 @@
-from fastapi import FastAPI
-from .prediction_ep import predict_ats, predict_resp, Prediction
-from .offer_ep import get_offer
+from typing import List
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+from .prediction_ep import predict_ats, predict_ats_batch, predict_resp, predict_resp_batch, Prediction
+from .offer_ep import get_offer, get_offer_batch
+from .score_ep import score_batch, score_member, score_stream
 from .member_features import MemberFeatures
 
 app = FastAPI()
 
 
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse that answers while the request body is still arriving.
+
+    StreamingResponse watches for a disconnect by reading the request channel, which would take
+    the chunks of a body still being read away from it. Reading the body notices a disconnect
+    instead, as the ClientDisconnect raised by request.stream().
+    """
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except ClientDisconnect:
+            return
+
+
 @app.get("/")
 async def ping():
     return {"msg": "pong"}
@@ -24,3 +43,34 @@ async def predict_resp_ep(member_features: MemberFeatures):
 @app.post("/offer/assign")
 async def assign_offer_ep(prediction: Prediction):
     return get_offer(prediction)
+
+
+@app.post("/ml/ats/predict/batch")
+async def predict_ats_batch_ep(members_features: List[MemberFeatures]):
+    return predict_ats_batch(members_features)
+
+
+@app.post("/ml/resp/predict/batch")
+async def predict_resp_batch_ep(members_features: List[MemberFeatures]):
+    return predict_resp_batch(members_features)
+
+
+@app.post("/offer/assign/batch")
+async def assign_offer_batch_ep(predictions: List[Prediction]):
+    return get_offer_batch(predictions)
+
+
+@app.post("/offer/score")
+async def score_ep(member_features: MemberFeatures):
+    return score_member(member_features)
+
+
+@app.post("/offer/score/batch")
+async def score_batch_ep(members_features: List[MemberFeatures]):
+    return score_batch(members_features)
+
+
+@app.post("/offer/score/stream")
+async def score_stream_ep(request: Request):
+    """Takes NDJSON members and streams back one NDJSON line per member, in order, scoring each chunk of the body as it arrives."""
+    return DuplexStreamingResponse(score_stream(request.stream()), media_type="application/x-ndjson")
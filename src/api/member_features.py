@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import polars as pl
 
 
 class MemberFeatures(BaseModel):
@@ -11,3 +12,13 @@ class MemberFeatures(BaseModel):
     PCT_GIFT_TRANSACTIONS: Optional[float] = None
     PCT_REDEEM_TRANSACTIONS: Optional[float] = None
     DAYS_SINCE_LAST_TRANSACTION: Optional[int] = None
+
+
+MEMBER_FEATURES_SCHEMA = {
+    name: pl.Int64 if name == "DAYS_SINCE_LAST_TRANSACTION" else pl.Float64
+    for name in MemberFeatures.model_fields
+}
+
+
+def member_features_frame(members_features: List[MemberFeatures]) -> pl.DataFrame:
+    return pl.DataFrame([member.model_dump() for member in members_features], schema=MEMBER_FEATURES_SCHEMA)
@@ -1,4 +1,6 @@
 from .prediction_ep import Prediction
+from typing import List
+import polars as pl
 
 
 def get_offer(prediction: Prediction) -> dict:
@@ -7,3 +9,22 @@ def get_offer(prediction: Prediction) -> dict:
     else:
         result = "OFFER_1"
     return {"offer": result}
+
+
+def offer_expr(ats: pl.Expr, resp: pl.Expr) -> pl.Expr:
+    """Vectorised equivalent of get_offer. Rows missing a prediction get no offer."""
+    product = ats * resp
+    return (
+        pl.when(product.is_null()).then(pl.lit(None, dtype=pl.String))
+        .when(product >= 200).then(pl.lit("OFFER_2"))
+        .otherwise(pl.lit("OFFER_1"))
+    )
+
+
+def get_offer_batch(predictions: List[Prediction]) -> dict:
+    predictions_df = pl.DataFrame(
+        [prediction.model_dump() for prediction in predictions],
+        schema={"ats_prediction": pl.Float64, "resp_prediction": pl.Float64}
+    )
+    offers = predictions_df.select(offer_expr(pl.col("ats_prediction"), pl.col("resp_prediction")))
+    return {"offers": offers.to_series().to_list()}
@@ -1,5 +1,7 @@
-from .member_features import MemberFeatures
+from .member_features import MemberFeatures, member_features_frame
 from pydantic import BaseModel
+from typing import List
+import polars as pl
 
 
 class Prediction(BaseModel):
@@ -35,3 +37,43 @@ def predict_resp(member_features: MemberFeatures) -> dict:
     day_weight = 1 / (member_features.DAYS_SINCE_LAST_TRANSACTION + 1)
     product = product_weight * revenue_weight * day_weight
     return {"prediction": min(0.9, 1000 * product)}
+
+
+def ats_prediction_expr() -> pl.Expr:
+    """Vectorised equivalent of predict_ats over MemberFeatures columns."""
+    expected_volume = (
+        pl.col("LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT") * 0.7
+        + pl.col("AVG_POINTS_BOUGHT") * 0.3
+    )
+    weight = (
+        pl.col("PCT_BUY_TRANSACTIONS")
+        + pl.col("PCT_GIFT_TRANSACTIONS")
+        - pl.col("PCT_REDEEM_TRANSACTIONS")
+    ).clip(lower_bound=0)
+    return (expected_volume * weight).abs()
+
+
+def resp_prediction_expr() -> pl.Expr:
+    """Vectorised equivalent of predict_resp over MemberFeatures columns."""
+    product_weight = (
+        pl.col("PCT_BUY_TRANSACTIONS") * 0.4
+        + pl.col("PCT_GIFT_TRANSACTIONS") * 0.3
+        + pl.col("PCT_REDEEM_TRANSACTIONS") * 0.3
+    )
+    revenue_weight = (
+        pl.col("AVG_REVENUE_USD") * 0.3
+        + pl.col("LAST_3_TRANSACTIONS_AVG_REVENUE_USD") * 0.7
+    ) / 100
+    day_weight = 1 / (pl.col("DAYS_SINCE_LAST_TRANSACTION") + 1)
+    product = product_weight * revenue_weight * day_weight
+    return (1000 * product).clip(upper_bound=0.9)
+
+
+def predict_ats_batch(members_features: List[MemberFeatures]) -> dict:
+    predictions = member_features_frame(members_features).select(ats_prediction_expr())
+    return {"predictions": predictions.to_series().to_list()}
+
+
+def predict_resp_batch(members_features: List[MemberFeatures]) -> dict:
+    predictions = member_features_frame(members_features).select(resp_prediction_expr())
+    return {"predictions": predictions.to_series().to_list()}
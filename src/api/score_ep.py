@@ -0,0 +1,59 @@
+from .member_features import MemberFeatures, member_features_frame
+from .offer_ep import get_offer, offer_expr
+from .prediction_ep import Prediction, ats_prediction_expr, predict_ats, predict_resp, resp_prediction_expr
+from pydantic import ValidationError
+from typing import AsyncIterable, AsyncIterator, List
+import json
+import polars as pl
+
+
+SCORE_DTYPE = pl.Struct({"ats_prediction": pl.Float64, "resp_prediction": pl.Float64, "offer": pl.String})
+
+
+def score_member(member_features: MemberFeatures) -> dict:
+    """ATS and RESP predictions of a member with the offer they lead to, in one answer."""
+    ats_prediction = predict_ats(member_features)["prediction"]
+    resp_prediction = predict_resp(member_features)["prediction"]
+    offer = get_offer(Prediction(ats_prediction=ats_prediction, resp_prediction=resp_prediction))["offer"]
+    return {"score": {"ats_prediction": ats_prediction, "resp_prediction": resp_prediction, "offer": offer}}
+
+
+def score_expr() -> pl.Expr:
+    """Vectorised equivalent of score_member over MemberFeatures columns, as a struct of SCORE_DTYPE."""
+    ats_prediction, resp_prediction = ats_prediction_expr(), resp_prediction_expr()
+    return pl.struct(
+        ats_prediction.alias("ats_prediction"),
+        resp_prediction.alias("resp_prediction"),
+        offer_expr(ats_prediction, resp_prediction).alias("offer")
+    )
+
+
+def score_batch(members_features: List[MemberFeatures]) -> dict:
+    scores = member_features_frame(members_features).select(score_expr())
+    return {"scores": scores.to_series().to_list()}
+
+
+def _score_lines(lines: List[bytes]) -> bytes:
+    """Answers NDJSON members with one line each, in order: their score, or the reason they are invalid."""
+    members, errors = [], {}
+    for index, line in enumerate(lines):
+        try:
+            members.append(MemberFeatures.model_validate_json(line))
+        except ValidationError as e:
+            errors[index] = e.errors(include_url=False, include_context=False)
+    scores = iter(score_batch(members)["scores"] if members else [])
+    answers = [{"detail": errors[index]} if index in errors else {"score": next(scores)} for index in range(len(lines))]
+    return "".join(json.dumps(answer) + "\n" for answer in answers).encode()
+
+
+async def score_stream(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Scores a stream of NDJSON members as it arrives, answering the complete lines of each chunk together."""
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            yield _score_lines(lines)
+    if pending.strip():
+        yield _score_lines([pending])
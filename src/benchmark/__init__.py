@@ -0,0 +1,11 @@
+from .data_generator import generate_member_data
+from .stub_api import StubApi
+from .runner import BenchmarkCase, compare_results, run_benchmarks
+
+__all__ = [
+    'generate_member_data',
+    'StubApi',
+    'BenchmarkCase',
+    'compare_results',
+    'run_benchmarks'
+]
@@ -0,0 +1,55 @@
+import polars as pl
+from faker import Faker
+
+TRANSACTION_TYPES = ["buy", "redeem", "gift"]
+FIRST_TRANSACTION_TS = 1546560000  # 2019-01-04 00:00:00 UTC
+TRANSACTION_SPAN_SECONDS = 5 * 365 * 24 * 3600
+
+
+def generate_member_ids(member_count: int, seed: int = 0) -> pl.Series:
+    """Distinct 8 digit hexadecimal member ids, as in member_data.csv."""
+    fake = Faker()
+    fake.seed_instance(seed)
+    # Faker's seeded random source is used directly since its per-value providers take
+    # tens of microseconds each, which is minutes for millions of members
+    return pl.Series("memberId", [f"{value:08X}" for value in fake.random.sample(range(2 ** 32), member_count)])
+
+
+def _member_rows(member_ids: pl.Series, start: int, end: int, seed: int) -> pl.DataFrame:
+    def draw(column: int) -> pl.Expr:
+        return pl.col("row").hash(seed=seed, seed_1=column)
+
+    transaction_type = pl.lit(pl.Series(TRANSACTION_TYPES)).get(draw(3) % 3)
+    points = (draw(4) % 100 + 1).cast(pl.Int64) * 100
+    has_transaction = draw(1) % 1000 >= 23
+    return (
+        pl.DataFrame({"row": pl.int_range(start, end, dtype=pl.UInt64, eager=True)})
+        .select(
+            memberId=pl.when(draw(0) % 1000 >= 2).then(pl.lit(member_ids).get(draw(5) % len(member_ids))),
+            lastTransactionUtcTs=pl.when(has_transaction).then(
+                pl.from_epoch((FIRST_TRANSACTION_TS + draw(2) % TRANSACTION_SPAN_SECONDS).cast(pl.Int64)).dt.strftime("%Y-%m-%d %H:%M:%S")
+            ),
+            lastTransactionType=pl.when(has_transaction).then(transaction_type),
+            lastTransactionPointsBought=pl.when(has_transaction).then(pl.when(transaction_type == "redeem").then(-points).otherwise(points)),
+            lastTransactionRevenueUSD=pl.when(has_transaction).then(
+                pl.when(transaction_type == "redeem").then(0.0).otherwise(points / (1400 + draw(6) % 7 * 100))
+            ),
+        )
+    )
+
+
+def generate_member_data(output_file: str, row_count: int, rows_per_member: float = 4.4, seed: int = 0, chunk_size: int = 1000000) -> str:
+    """Writes a synthetic member_data.csv of row_count transactions.
+
+    The shape follows the sample file: about rows_per_member rows per member, 2.3% of
+    rows without a transaction, 0.2% without a member id, buys and gifts costing 1400
+    to 2000 points per USD and redeems earning no revenue. The same seed gives the same
+    file for a given Polars version.
+    """
+    member_ids = generate_member_ids(max(1, int(row_count / rows_per_member)), seed)
+    with open(output_file, "w") as f:
+        for start in range(0, row_count, chunk_size):
+            _member_rows(member_ids, start, min(row_count, start + chunk_size), seed).write_csv(f, include_header=start == 0)
+        if row_count == 0:
+            _member_rows(member_ids, 0, 0, seed).write_csv(f)
+    return output_file
@@ -0,0 +1,197 @@
+import bisect
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+import polars as pl
+from src.workflow_management import WorkFlowFactory
+from src.workflow_management.profiling import peak_rss
+from .data_generator import generate_member_data
+from .stub_api import StubApi
+
+logger = logging.getLogger(__name__)
+
+MEGABYTE = 1024 * 1024
+
+
+@dataclass
+class BenchmarkCase:
+    """One end-to-end OfferWorkFlow run over rows synthetic transactions.
+
+    latency, latency_jitter and error_rate are injected by the stub API; config holds
+    OfferWorkFlowConfig fields that override the benchmark defaults.
+    """
+    rows: int
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+    config: Dict = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        """Key of the case in results and baselines, so cases differing in the injected latency or errors are compared separately."""
+        return f"rows={self.rows},latency={self.latency},jitter={self.latency_jitter},error_rate={self.error_rate}"
+
+
+class MemorySampler:
+    """Samples the resident set size of this process on a background thread."""
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[Tuple[float, int]] = []
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="MemorySampler", daemon=True)
+
+    @staticmethod
+    def current_rss() -> Optional[int]:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _sample(self) -> None:
+        while not self._stop_event.is_set():
+            rss = self.current_rss()
+            if rss is None:
+                return
+            self.samples.append((time.perf_counter(), rss))
+            self._stop_event.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def peak_between(self, start: float, end: float) -> Optional[int]:
+        """Largest sample taken between start and end, or the last one before start for spans shorter than the interval."""
+        sample_times = [sample_time for sample_time, _ in self.samples]
+        first = max(0, bisect.bisect_left(sample_times, start) - 1)
+        last = bisect.bisect_right(sample_times, end)
+        return max((rss for _, rss in self.samples[first:max(last, first + 1)]), default=None)
+
+
+def _megabytes(byte_count: Optional[int]) -> Optional[float]:
+    return None if byte_count is None else round(byte_count / MEGABYTE, 1)
+
+
+def run_workflow(config_path: str) -> Dict:
+    """Runs OfferWorkFlow from a config file and returns its per-stage figures, including peak memory.
+
+    Meant to run in a fresh process so that peak memory only covers this workflow.
+    """
+    sampler = MemorySampler()
+    sampler.start()
+    try:
+        workflow = WorkFlowFactory.create_workflow("OfferWorkFlow", config_path)
+        workflow.start()
+    finally:
+        sampler.stop()
+
+    with open(workflow.config.performance_output_path) as f:
+        summary = json.load(f)
+
+    task_manager = workflow.task_manager
+    stages = {}
+    for task_name, task_summary in summary["tasks"].items():
+        stage = {key: task_summary.get(key) for key in ("execution_time (sec)", "throughput (item/sec)", "processed_item_count", "item_failure_count", "wait_time (sec)")}
+        if "requests" in task_summary and "latency (sec)" in task_summary["requests"]:
+            stage["latency (sec)"] = task_summary["requests"]["latency (sec)"]
+        timing = task_manager.task_timings.get(task_name, {})
+        if "start" in timing:
+            stage["peak_rss (MB)"] = _megabytes(sampler.peak_between(task_manager.clock_start + timing["start"], task_manager.clock_start + timing.get("end", timing["start"])))
+        stages[task_name] = stage
+
+    return {
+        "total_execution_time (sec)": summary["total_execution_time (sec)"],
+        "peak_rss (MB)": _megabytes(peak_rss()),
+        "stages": stages
+    }
+
+
+def run_case(case: BenchmarkCase, work_dir: str) -> Dict:
+    """Generates the case's input (reused across runs), serves the stub API and runs the workflow in a child process."""
+    os.makedirs(work_dir, exist_ok=True)
+    csv_path = os.path.join(work_dir, f"member_data_{case.rows}_{case.seed}.csv")
+    if not os.path.exists(csv_path):
+        logger.info(f"Generating {case.rows} rows into {csv_path}")
+        generate_member_data(csv_path, case.rows, seed=case.seed)
+
+    with StubApi(case.latency, case.latency_jitter, case.error_rate, case.seed) as api:
+        config = {
+            "name": f"Benchmark {case.name}",
+            "description": "OfferWorkFlow benchmark against the stub API",
+            "csv_path": csv_path,
+            "ats_url": f"{api.url}/ml/ats/predict",
+            "resp_url": f"{api.url}/ml/resp/predict",
+            "offer_url": f"{api.url}/offer/assign",
+            "result_output_path": os.path.join(work_dir, f"result_{case.name}.csv"),
+            "performance_output_path": os.path.join(work_dir, f"performance_{case.name}.json"),
+        }
+        config.update(case.config)
+        config_path = os.path.join(work_dir, f"config_{case.name}.json")
+        with open(config_path, "w") as f:
+            json.dump(config, f, indent=4)
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = executor.submit(run_workflow, config_path).result()
+
+    return {
+        "name": case.name,
+        "case": asdict(case),
+        "api_requests": api.request_count,
+        "api_injected_errors": api.error_count,
+        **result
+    }
+
+
+def run_benchmarks(cases: List[BenchmarkCase], work_dir: str) -> Dict:
+    return {
+        "UTC_time_of_completion": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "environment": {"python": platform.python_version(), "polars": pl.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "runs": [run_case(case, work_dir) for case in cases]
+    }
+
+
+def _compare(regressions: List[str], label: str, value: Optional[float], baseline_value: Optional[float], tolerance: float, min_value: float = 0.0) -> None:
+    """Flags value if it exceeds baseline_value by more than tolerance, ignoring figures below min_value."""
+    if value is None or baseline_value is None or max(value, baseline_value) < min_value:
+        return
+    if value > baseline_value * (1 + tolerance):
+        regressions.append(f"{label}: {value:.4g} vs baseline {baseline_value:.4g} (+{(value / baseline_value - 1) * 100 if baseline_value else float('inf'):.0f}%)")
+
+
+def compare_results(results: Dict, baseline: Dict, tolerance: float = 0.1, min_seconds: float = 0.05) -> List[str]:
+    """Lists the figures of results worse than those of the baseline run of the same name by more than tolerance.
+
+    Times, request latency percentiles and peak memory are compared per run and stage.
+    Times under min_seconds are ignored as noise, and so are runs missing from the baseline.
+    """
+    baseline_runs = {run["name"]: run for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        baseline_run = baseline_runs.get(run["name"])
+        if baseline_run is None:
+            continue
+        _compare(regressions, f"{run['name']} total time", run["total_execution_time (sec)"], baseline_run["total_execution_time (sec)"], tolerance, min_seconds)
+        _compare(regressions, f"{run['name']} peak memory", run["peak_rss (MB)"], baseline_run["peak_rss (MB)"], tolerance)
+        for stage_name, stage in run["stages"].items():
+            baseline_stage = baseline_run["stages"].get(stage_name)
+            if baseline_stage is None:
+                continue
+            label = f"{run['name']} {stage_name}"
+            _compare(regressions, f"{label} time", stage["execution_time (sec)"], baseline_stage["execution_time (sec)"], tolerance, min_seconds)
+            _compare(regressions, f"{label} failures", stage["item_failure_count"], baseline_stage["item_failure_count"], 0, 1)
+            _compare(regressions, f"{label} peak memory", stage.get("peak_rss (MB)"), baseline_stage.get("peak_rss (MB)"), tolerance)
+            for percentile in ("p95", "p99"):
+                _compare(regressions, f"{label} {percentile} latency", stage.get("latency (sec)", {}).get(percentile),
+                         baseline_stage.get("latency (sec)", {}).get(percentile), tolerance, min_seconds / 10)
+    return regressions
@@ -0,0 +1,115 @@
+import asyncio
+import random
+import socket
+import threading
+from typing import Callable, List, Optional
+from aiohttp import web
+from pydantic import BaseModel, ValidationError
+from src.api.member_features import MemberFeatures
+from src.api.offer_ep import get_offer, get_offer_batch
+from src.api.prediction_ep import Prediction, predict_ats, predict_ats_batch, predict_resp, predict_resp_batch
+from src.api.score_ep import score_batch, score_member, score_stream
+
+
+class StubApi:
+    """Stand-in for the services of src/api/app.py, served by aiohttp on a thread of the calling process.
+
+    Requests are answered by the same functions as the real service, and invalid bodies get
+    a 422 as from FastAPI. Each request first waits latency seconds plus an exponentially
+    distributed extra with mean latency_jitter, then fails with a 503 with probability
+    error_rate.
+    """
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    async def _delay_or_fail(self) -> Optional[web.Response]:
+        """Waits out the latency of a request, then answers the injected errors."""
+        self.request_count += 1
+        delay = self.latency + (self.random.expovariate(1 / self.latency_jitter) if self.latency_jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.error_count += 1
+            return web.json_response({"detail": "Injected error"}, status=503)
+        return None
+
+    def _endpoint(self, model: type, handler: Callable, batch: bool = False):
+        async def handle(request: web.Request) -> web.Response:
+            error_response = await self._delay_or_fail()
+            if error_response is not None:
+                return error_response
+            body = await request.json()
+            try:
+                payload: List[BaseModel] = [model(**row) for row in body] if batch else model(**body)
+            except ValidationError as e:
+                return web.json_response({"detail": e.errors(include_url=False)}, status=422)
+            return web.json_response(handler(payload))
+        return handle
+
+    async def _score_stream(self, request: web.Request) -> web.StreamResponse:
+        error_response = await self._delay_or_fail()
+        if error_response is not None:
+            return error_response
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        async for lines in score_stream(request.content.iter_any()):
+            await response.write(lines)
+        await response.write_eof()
+        return response
+
+    async def _ping(self, request: web.Request) -> web.Response:
+        return web.json_response({"msg": "pong"})
+
+    def _create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self._ping)
+        app.router.add_post("/ml/ats/predict", self._endpoint(MemberFeatures, predict_ats))
+        app.router.add_post("/ml/resp/predict", self._endpoint(MemberFeatures, predict_resp))
+        app.router.add_post("/offer/assign", self._endpoint(Prediction, get_offer))
+        app.router.add_post("/ml/ats/predict/batch", self._endpoint(MemberFeatures, predict_ats_batch, batch=True))
+        app.router.add_post("/ml/resp/predict/batch", self._endpoint(MemberFeatures, predict_resp_batch, batch=True))
+        app.router.add_post("/offer/assign/batch", self._endpoint(Prediction, get_offer_batch, batch=True))
+        app.router.add_post("/offer/score", self._endpoint(MemberFeatures, score_member))
+        app.router.add_post("/offer/score/batch", self._endpoint(MemberFeatures, score_batch, batch=True))
+        app.router.add_post("/offer/score/stream", self._score_stream)
+        return app
+
+    def start(self, port: Optional[int] = None) -> str:
+        """Starts serving on localhost and returns the base url."""
+        if port is None:
+            with socket.socket() as probe:
+                probe.bind(("127.0.0.1", 0))
+                port = probe.getsockname()[1]
+        self._loop = asyncio.new_event_loop()
+        self._runner = web.AppRunner(self._create_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        self._loop.run_until_complete(web.TCPSite(self._runner, "127.0.0.1", port).start())
+        self._thread = threading.Thread(target=self._loop.run_forever, name="StubApi", daemon=True)
+        self._thread.start()
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self) -> "StubApi":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,44 @@
+import argparse
+import json
+import logging
+import sys
+from .benchmark import BenchmarkCase, compare_results, run_benchmarks
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs OfferWorkFlow end to end on synthetic data against a local stub of the API")
+    parser.add_argument("--rows", help="Input sizes to benchmark, in transactions", type=int, nargs="+", default=[10000])
+    parser.add_argument("--latency", help="Injected latency per request, in seconds", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", help="Mean of an exponentially distributed extra latency per request, in seconds", type=float, default=0.0)
+    parser.add_argument("--error-rate", help="Share of requests answered with a 503", type=float, default=0.0)
+    parser.add_argument("--seed", help="Seed of the synthetic data, latency and errors", type=int, default=0)
+    parser.add_argument("--config", help="JSON file of OfferWorkFlowConfig fields overriding the benchmark's", type=str)
+    parser.add_argument("--work-dir", help="Directory for generated inputs and workflow outputs", type=str, default="benchmark_data")
+    parser.add_argument("--output", help="Results JSON path", type=str, default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against", type=str)
+    parser.add_argument("--tolerance", help="Relative slowdown or growth flagged as a regression", type=float, default=0.1)
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    cases = [BenchmarkCase(rows, args.latency, args.latency_jitter, args.error_rate, args.seed, config) for rows in args.rows]
+    results = run_benchmarks(cases, args.work_dir)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    logger.info(f"Benchmark results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            logger.warning(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info("No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
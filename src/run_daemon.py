@@ -0,0 +1,26 @@
+import argparse
+import logging
+import threading
+from .workflow_management import WorkFlowDaemon
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves workflow runs from a long-lived process with warm thread and connection pools")
+    parser.add_argument("--host", help="Interface to listen on", type=str, default="127.0.0.1")
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8100)
+    parser.add_argument("--max-workers", help="Task threads shared by all runs", type=int)
+    parser.add_argument("--max-concurrent-runs", help="Runs executed at the same time", type=int, default=4)
+    parser.add_argument("--http-connection-limit", help="Open connections shared by all runs", type=int, default=100)
+    parser.add_argument("--http-connection-limit-per-host", help="Open connections per host, 0 for no limit", type=int, default=0)
+    args = parser.parse_args()
+
+    with WorkFlowDaemon(args.max_workers, args.max_concurrent_runs, args.http_connection_limit, args.http_connection_limit_per_host) as workflow_daemon:
+        workflow_daemon.start(args.host, args.port)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            logger.info("Workflow daemon shutting down")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import argparse
 import logging
-from .workflow_management import WorkFlowFactory
+# The workflow modules are imported on first use, after the arguments are parsed
+from . import workflow_management
 
 logger = logging.getLogger(__name__)
 
@@ -9,9 +10,15 @@ def main():
         parser = argparse.ArgumentParser(description="Workflow Manager")
         parser.add_argument("--workflow", help="Workflow type", type=str, default="OfferWorkFlow")
         parser.add_argument("--config", help="Workflow JSON Config Path", type=str, default="default_workflow_config.json")
+        parser.add_argument("--shard-worker", help="Run shards of the sharded run in this shared directory instead", type=str)
         args = parser.parse_args()
+
+        if args.shard_worker:
+            shard_count = workflow_management.run_shard_worker(args.shard_worker)
+            logger.info(f"Ran {shard_count} shards of {args.shard_worker}")
+            return
         
-        workflow = WorkFlowFactory.create_workflow(args.workflow, args.config)
+        workflow = workflow_management.WorkFlowFactory.create_workflow(args.workflow, args.config)
 
         workflow.start()
     except Exception as e:
@@ -1,12 +1,24 @@
 from datetime import datetime, timezone
+import io
+import json
 import logging
-from typing import List, Tuple
+import os
+import shutil
+import time
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
 import polars as pl
 from pydantic import BaseModel
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+MEMBER_STATE_MANIFEST = "state.json"
+PENDING_MEMBER_STATE_MANIFEST = "state.pending.json"
+_MEMBER_STATE_TOTALS = ["TRANSACTION_COUNT", "POINTS_BOUGHT_SUM", "REVENUE_USD_SUM", "BUY_COUNT", "GIFT_COUNT", "REDEEM_COUNT"]
+_MEMBER_STATE_LAST_3 = ["LAST_3_TS", "LAST_3_POINTS_BOUGHT", "LAST_3_REVENUE_USD"]
+RESULT_FILE_FORMATS = ("csv", "parquet", "ipc")
+SCORE_FIELDS = ("ats_prediction", "resp_prediction", "offer")
+
 def extract_task(file_path: str) -> Tuple[pl.DataFrame, int, int]:
     df = pl.read_csv(file_path)
     return df, len(df), 0
@@ -38,7 +50,8 @@ def transform_task(extracted_data: pl.DataFrame) -> Tuple[pl.DataFrame, int, int
                 .alias("PCT_BUY_TRANSACTIONS")
     ])
 
-    member_time_sorted_df = date_time_converted_df.sort(by=["memberId", "LAST_TRANSACTION_TS"], descending=[False, False])
+    # Transactions at the same time keep their file order, so the last of them count as the latest
+    member_time_sorted_df = date_time_converted_df.sort(by=["memberId", "LAST_TRANSACTION_TS"], descending=[False, False], maintain_order=True)
 
     current_day = datetime.now(timezone.utc)
     member_aggregated_df_last_3 = member_time_sorted_df.group_by("memberId").agg([
@@ -53,13 +66,266 @@ def transform_task(extracted_data: pl.DataFrame) -> Tuple[pl.DataFrame, int, int
 
     return transformed_df, len(transformed_df), 0
     
-def combiner_task(*results, output_format: type[BaseModel]) -> Tuple[List, int, int]:
+def member_features_query(transactions: pl.LazyFrame) -> pl.LazyFrame:
+    """Query plan computing the same member features as transform_task in a single grouped aggregation."""
+    current_day = datetime.now(timezone.utc)
+    # Ties on the timestamp are broken by file order, as in transform_task
+    latest_3 = ["LAST_TRANSACTION_TS", "ROW_INDEX"]
+    return transactions.with_row_index("ROW_INDEX").drop_nulls().with_columns(
+        pl.col("lastTransactionUtcTs").str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S").alias("LAST_TRANSACTION_TS")
+    ).group_by("memberId").agg([
+        pl.col("lastTransactionPointsBought").top_k_by(latest_3, 3).mean().alias("LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT"),
+        pl.col("lastTransactionRevenueUSD").top_k_by(latest_3, 3).mean().alias("LAST_3_TRANSACTIONS_AVG_REVENUE_USD"),
+        (pl.lit(current_day).cast(pl.Datetime) - pl.col("LAST_TRANSACTION_TS").max()).dt.total_days().alias("DAYS_SINCE_LAST_TRANSACTION"),
+        (pl.col("lastTransactionPointsBought").sum() / pl.len()).alias("AVG_POINTS_BOUGHT"),
+        (pl.col("lastTransactionRevenueUSD").sum() / pl.len()).alias("AVG_REVENUE_USD"),
+        ((pl.col("lastTransactionType") == "gift").sum() / pl.len()).alias("PCT_GIFT_TRANSACTIONS"),
+        ((pl.col("lastTransactionType") == "redeem").sum() / pl.len()).alias("PCT_REDEEM_TRANSACTIONS"),
+        ((pl.col("lastTransactionType") == "buy").sum() / pl.len()).alias("PCT_BUY_TRANSACTIONS")
+    ])
+
+def lazy_transform_task(extracted_data: pl.DataFrame | pl.LazyFrame, streaming: bool = False) -> Tuple[pl.DataFrame, int, int]:
+    transformed_df = member_features_query(extracted_data.lazy()).collect(engine="streaming" if streaming else "auto")
+    return transformed_df, len(transformed_df), 0
+
+def lazy_extract_transform_task(file_path: str, streaming: bool = False) -> Tuple[pl.DataFrame, int, int]:
+    """Extract and Transform as one optimised query plan over the CSV; with streaming, inputs larger than memory are processed in chunks."""
+    transformed_df = member_features_query(pl.scan_csv(file_path)).collect(engine="streaming" if streaming else "auto")
+    return transformed_df, len(transformed_df), 0
+
+def _read_member_state_manifest(state_dir: str, manifest_name: str = MEMBER_STATE_MANIFEST) -> dict:
+    manifest_path = os.path.join(state_dir, manifest_name)
+    if not os.path.exists(manifest_path):
+        return {"source_offset": 0, "members_file": None}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def _write_member_state_manifest(state_dir: str, manifest_name: str, manifest: dict) -> None:
+    manifest_path = os.path.join(state_dir, manifest_name)
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+def _remove_uncommitted_member_state(state_dir: str, manifest: dict) -> None:
+    """Deletes what runs that failed before committing staged: the pending manifest and member state files other than the committed one."""
+    for file_name in os.listdir(state_dir):
+        staged_members = file_name.startswith("members-") and file_name.endswith(".ipc") and file_name != manifest["members_file"]
+        if staged_members or file_name.startswith(PENDING_MEMBER_STATE_MANIFEST):
+            os.remove(os.path.join(state_dir, file_name))
+
+def incremental_extract_task(file_path: str, state_dir: str) -> Tuple[pl.DataFrame, int, int]:
+    """Reads only the rows appended to file_path since the member state was last committed."""
+    os.makedirs(state_dir, exist_ok=True)
+    manifest = _read_member_state_manifest(state_dir)
+    _remove_uncommitted_member_state(state_dir, manifest)
+    source_offset = manifest["source_offset"]
+
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        if os.fstat(f.fileno()).st_size < source_offset:
+            raise ValueError(f"{file_path} is smaller than when its member state was committed, delete {state_dir} to rebuild it")
+        f.seek(max(source_offset, len(header)))
+        appended = f.read()
+
+    # A row still being written has no trailing newline yet and is left for the next run
+    appended = appended[:appended.rfind(b"\n") + 1]
+    new_offset = max(source_offset, len(header)) + len(appended)
+    _write_member_state_manifest(state_dir, PENDING_MEMBER_STATE_MANIFEST, {**manifest, "source_offset": new_offset})
+
+    df = pl.read_csv(io.BytesIO(header + appended), schema_overrides={"memberId": pl.String})
+    return df, len(df), 0
+
+def incremental_transform_task(extracted_data: pl.DataFrame, state_dir: str) -> Tuple[pl.DataFrame, int, int]:
+    """Folds newly extracted rows into the per-member state and computes the features of the members they touch.
+
+    The updated state is staged and only replaces the committed one in commit_member_state_task.
+    """
+    manifest = _read_member_state_manifest(state_dir, PENDING_MEMBER_STATE_MANIFEST)
+
+    new_rows_df = extracted_data.drop_nulls().with_columns(
+        pl.col("lastTransactionUtcTs").str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S").alias("LAST_TRANSACTION_TS")
+    )
+    new_state_df = new_rows_df.group_by("memberId").agg([
+        pl.len().cast(pl.Int64).alias("TRANSACTION_COUNT"),
+        pl.col("lastTransactionPointsBought").cast(pl.Float64).sum().alias("POINTS_BOUGHT_SUM"),
+        pl.col("lastTransactionRevenueUSD").cast(pl.Float64).sum().alias("REVENUE_USD_SUM"),
+        (pl.col("lastTransactionType") == "buy").sum().cast(pl.Int64).alias("BUY_COUNT"),
+        (pl.col("lastTransactionType") == "gift").sum().cast(pl.Int64).alias("GIFT_COUNT"),
+        (pl.col("lastTransactionType") == "redeem").sum().cast(pl.Int64).alias("REDEEM_COUNT"),
+        pl.col("LAST_TRANSACTION_TS").sort().tail(3).alias("LAST_3_TS"),
+        pl.col("lastTransactionPointsBought").cast(pl.Float64).sort_by("LAST_TRANSACTION_TS", maintain_order=True).tail(3).alias("LAST_3_POINTS_BOUGHT"),
+        pl.col("lastTransactionRevenueUSD").cast(pl.Float64).sort_by("LAST_TRANSACTION_TS", maintain_order=True).tail(3).alias("LAST_3_REVENUE_USD")
+    ])
+
+    previous_members_file = manifest["members_file"]
+    if previous_members_file is not None:
+        previous_state_df = pl.read_ipc(os.path.join(state_dir, previous_members_file), memory_map=False)
+        touched_members_df = new_state_df.select("memberId")
+        combined_state_df = pl.concat([previous_state_df.join(touched_members_df, on="memberId", how="semi"), new_state_df])
+        totals_df = combined_state_df.group_by("memberId").agg(pl.col(_MEMBER_STATE_TOTALS).sum())
+        last_3_df = combined_state_df.select("memberId", *_MEMBER_STATE_LAST_3).explode(_MEMBER_STATE_LAST_3).group_by("memberId").agg(
+            [pl.col(column).sort_by("LAST_3_TS", maintain_order=True).tail(3) for column in _MEMBER_STATE_LAST_3]
+        )
+        changed_state_df = totals_df.join(last_3_df, on="memberId").select(new_state_df.columns)
+        member_state_df = pl.concat([previous_state_df.join(touched_members_df, on="memberId", how="anti"), changed_state_df])
+    else:
+        changed_state_df = member_state_df = new_state_df
+
+    members_file = f"members-{time.time_ns()}.ipc"
+    member_state_df.write_ipc(os.path.join(state_dir, members_file))
+    _write_member_state_manifest(state_dir, PENDING_MEMBER_STATE_MANIFEST, {
+        **manifest, "members_file": members_file, "previous_members_file": previous_members_file
+    })
+
+    current_day = datetime.now(timezone.utc)
+    transformed_df = changed_state_df.select([
+        "memberId",
+        pl.col("LAST_3_POINTS_BOUGHT").list.mean().alias("LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT"),
+        pl.col("LAST_3_REVENUE_USD").list.mean().alias("LAST_3_TRANSACTIONS_AVG_REVENUE_USD"),
+        (pl.lit(current_day).cast(pl.Datetime) - pl.col("LAST_3_TS").list.last()).dt.total_days().alias("DAYS_SINCE_LAST_TRANSACTION"),
+        (pl.col("POINTS_BOUGHT_SUM") / pl.col("TRANSACTION_COUNT")).alias("AVG_POINTS_BOUGHT"),
+        (pl.col("REVENUE_USD_SUM") / pl.col("TRANSACTION_COUNT")).alias("AVG_REVENUE_USD"),
+        (pl.col("GIFT_COUNT") / pl.col("TRANSACTION_COUNT")).alias("PCT_GIFT_TRANSACTIONS"),
+        (pl.col("REDEEM_COUNT") / pl.col("TRANSACTION_COUNT")).alias("PCT_REDEEM_TRANSACTIONS"),
+        (pl.col("BUY_COUNT") / pl.col("TRANSACTION_COUNT")).alias("PCT_BUY_TRANSACTIONS")
+    ])
+
+    return transformed_df, len(transformed_df), 0
+
+def commit_member_state_task(load_result: Optional[str], state_dir: str) -> Tuple[str, int, int]:
+    """Makes the member state staged by incremental_transform_task the committed one once its results are loaded."""
+    if load_result is None:
+        raise RuntimeError("Results were not loaded, the member state is left uncommitted")
+
+    manifest = _read_member_state_manifest(state_dir, PENDING_MEMBER_STATE_MANIFEST)
+    previous_members_file = manifest.pop("previous_members_file", None)
+    _write_member_state_manifest(state_dir, MEMBER_STATE_MANIFEST, manifest)
+    os.remove(os.path.join(state_dir, PENDING_MEMBER_STATE_MANIFEST))
+
+    if previous_members_file is not None and previous_members_file != manifest["members_file"]:
+        os.remove(os.path.join(state_dir, previous_members_file))
+    return "commit", 1, 0
+
+def combiner_task(*results, output_format: type[BaseModel], key_field: Optional[str] = None) -> Tuple[Any, int, int]:
+    """Combines row-aligned results into the rows of output_format.
+
+    With key_field, the first result is the frame the others were computed from, and its
+    key_field column is carried along so that the failed rows of the next stage can be told apart.
+    """
+    keys = None
+    if key_field is not None:
+        keyed_result, *results = results
+        keys = keyed_result[key_field]
+    if all(isinstance(result, pl.Series) for result in results):
+        # Columns are joined side by side without copying their buffers
+        columns = [result.alias(field) for field, result in zip(output_format.model_fields, results)]
+        combined = pl.DataFrame(columns if keys is None else [keys, *columns])
+        return combined, combined.height, 0
     zipped_results = zip(*results)
     validated_results = [dict(zip(output_format.model_fields.keys(), values)) for values in zipped_results]
+    if keys is not None:
+        validated_results = [{key_field: key, **result} for key, result in zip(keys.to_list(), validated_results)]
     return validated_results, len(validated_results), 0
 
-def load_task(transform_result: pl.DataFrame, ats_result: List, resp_result:List, offer_result: List, output_file="output.csv") -> Tuple[str, int, int]:
+def failed_rows_task(transform_result: pl.DataFrame, failures_file: str, key_field: str = "memberId") -> Tuple[pl.DataFrame, int, int]:
+    """Rows of transform_result whose key is in the failures ledger of a previous run, for a repair run to score again."""
+    failed_keys = pl.read_csv(failures_file, columns=[key_field], schema_overrides={key_field: transform_result.schema[key_field]})[key_field]
+    failed_rows = transform_result.filter(pl.col(key_field).is_in(failed_keys))
+    logger.info(f"Repairing {failed_rows.height} rows that failed in {failures_file}")
+    return failed_rows, len(failed_rows), 0
+
+def _prediction_column(name: str, values) -> pl.Series:
+    return values.alias(name) if isinstance(values, pl.Series) else pl.Series(name, values)
+
+def _split_scores(scores) -> List:
+    """ATS, RESP and offer results from the per-row scores of the fused scoring stage, a struct Series or a list of dicts."""
+    if isinstance(scores, pl.Series):
+        return [scores.struct.field(field) for field in SCORE_FIELDS]
+    return [[None if score is None else score.get(field) for score in scores] for field in SCORE_FIELDS]
+
+def _with_predictions(transform_result: pl.DataFrame, *prediction_results) -> pl.DataFrame:
+    """Adds the ATS, RESP and offer results as columns, given one by one or as the scores of the fused scoring stage."""
+    ats_result, resp_result, offer_result = _split_scores(prediction_results[0]) if len(prediction_results) == 1 else prediction_results
+    return transform_result.with_columns(_prediction_column("ATS", ats_result), _prediction_column("RESP", resp_result), _prediction_column("OFFER", offer_result))
+
+def _check_file_format(file_format: str) -> None:
+    if file_format not in RESULT_FILE_FORMATS:
+        raise ValueError(f"Unknown result file format {file_format}, expected one of {RESULT_FILE_FORMATS}")
+
+def read_result(output_file: str, file_format: str = "csv", schema_overrides: Optional[dict] = None) -> pl.DataFrame:
+    _check_file_format(file_format)
+    if file_format == "parquet":
+        return pl.read_parquet(output_file)
+    if file_format == "ipc":
+        return pl.read_ipc(output_file, memory_map=False)
+    return pl.read_csv(output_file, schema_overrides=schema_overrides)
+
+def write_result(result: pl.DataFrame, output_file: str, file_format: str = "csv") -> None:
+    _check_file_format(file_format)
+    if file_format == "parquet":
+        result.write_parquet(output_file)
+    elif file_format == "ipc":
+        result.write_ipc(output_file)
+    else:
+        result.write_csv(output_file)
+
+def load_task(transform_result: pl.DataFrame, *prediction_results, output_file="output.csv", merge_key: Optional[str] = None,
+              file_format: str = "csv", failure_log=None, failures_file: Optional[str] = None) -> Tuple[str, int, int]:
+    """Writes the rows with their predictions to output_file, and the rows that failed to failures_file from failure_log.
+
+    With merge_key, the rows replace those of the existing file sharing their key, and the
+    ledger keeps the failures of the other rows.
+    """
     logger.info(f"Writing transformed data to {output_file}")
-    transform_result = transform_result.with_columns(pl.Series("ATS", ats_result), pl.Series("RESP", resp_result), pl.Series("OFFER", offer_result))
-    transform_result.write_csv(output_file)
-    return "load", len(transform_result), 0
\ No newline at end of file
+    scored_keys = transform_result[failure_log.key_field] if failure_log is not None else None
+    transform_result = _with_predictions(transform_result, *prediction_results)
+    item_count = len(transform_result)
+
+    if merge_key is not None and os.path.exists(output_file):
+        # Rows of the existing file are replaced by the new rows sharing their key
+        existing_result = read_result(output_file, file_format, schema_overrides={merge_key: transform_result.schema[merge_key]})
+        unchanged_result = existing_result.join(transform_result.select(merge_key), on=merge_key, how="anti")
+        transform_result = pl.concat([unchanged_result, transform_result], how="vertical_relaxed")
+
+    write_result(transform_result, output_file, file_format)
+    if failure_log is not None:
+        failure_log.save(failures_file, scored_keys.dtype, scored_keys=scored_keys if merge_key is not None else None)
+    return "load", item_count, 0
+
+def stream_load_task(transform_batches: Iterable, *prediction_batches: Iterable, output_file="output.csv",
+                     file_format: str = "csv", failure_log=None, failures_file: Optional[str] = None) -> Iterator[Tuple[str, int, int]]:
+    """Writes each batch as it arrives. Parquet and IPC batches are staged as IPC parts and merged after the last one.
+
+    The failures ledger is written after the last batch, once every upstream task has recorded its failures.
+    """
+    _check_file_format(file_format)
+    logger.info(f"Streaming transformed data to {output_file}")
+    batches = enumerate(zip(transform_batches, *prediction_batches))
+    if file_format == "csv":
+        with open(output_file, "wb") as f:
+            for index, batch in batches:
+                batch_result = _with_predictions(*batch)
+                batch_result.write_csv(f, include_header=index == 0)
+                yield "load", len(batch_result), 0
+        if failure_log is not None:
+            failure_log.save(failures_file)
+        return
+
+    parts_dir = f"{output_file}.parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    try:
+        part_files = []
+        for index, batch in batches:
+            batch_result = _with_predictions(*batch)
+            part_files.append(os.path.join(parts_dir, f"{index:08d}.ipc"))
+            batch_result.write_ipc(part_files[-1])
+            yield "load", len(batch_result), 0
+        if part_files:
+            # Memory-mapped parts are paged in while writing instead of being loaded at once
+            parts = pl.concat([pl.read_ipc(part_file, memory_map=True) for part_file in part_files], rechunk=False)
+            write_result(parts, output_file, file_format)
+            del parts
+        if failure_log is not None:
+            failure_log.save(failures_file)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
@@ -1,12 +1,23 @@
-from .workflow_factory import WorkFlowFactory
-from .workflow import OfferWorkFlow, BasicWorkFlow, PreloadedWorkFlow
-from .config import Config, OfferWorkFlowConfig
+from importlib import import_module
 
-__all__ = [
-    'WorkFlowFactory',
-    'OfferWorkFlow',
-    'BasicWorkFlow',
-    'PreloadedWorkFlow',
-    'Config',
-    'OfferWorkFlowConfig'
-]
\ No newline at end of file
+# Most modules import polars, aiohttp or pydantic, so they are only loaded when one of their names is first used
+_EXPORTS = {
+    'WorkFlowFactory': '.workflow_factory',
+    'OfferWorkFlow': '.workflow',
+    'BasicWorkFlow': '.workflow',
+    'PreloadedWorkFlow': '.workflow',
+    'ShardedWorkFlow': '.sharding',
+    'run_shard_worker': '.sharding',
+    'WorkFlowDaemon': '.daemon',
+    'TaskGraph': '.task_graph',
+    'CycleError': '.task_graph',
+    'Config': '.config',
+    'OfferWorkFlowConfig': '.config'
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
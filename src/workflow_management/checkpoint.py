@@ -0,0 +1,142 @@
+from functools import partial
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from types import CodeType
+from typing import Any, List, Optional, Tuple
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+def describe(value: Any) -> str:
+    """Stable description of a task's function or argument, used to fingerprint the task.
+
+    Functions are described by name and bytecode so that editing them invalidates their
+    checkpoints, and paths to existing files by size and modification time so that a changed
+    input file does too.
+    """
+    if isinstance(value, partial):
+        arguments = [describe(argument) for argument in value.args]
+        arguments += [f"{name}={describe(argument)}" for name, argument in sorted(value.keywords.items())]
+        return f"partial({describe(value.func)}, {', '.join(arguments)})"
+    if isinstance(value, str):
+        if os.path.isfile(value):
+            stat = os.stat(value)
+            return f"file({value}, {stat.st_size}, {stat.st_mtime_ns})"
+        return repr(value)
+    if isinstance(value, pl.Expr):
+        return value.meta.serialize(format="json")
+    if isinstance(value, (list, tuple)):
+        return f"[{', '.join(describe(item) for item in value)}]"
+    if callable(value) and hasattr(value, "__qualname__"):
+        code = getattr(getattr(value, "__func__", value), "__code__", None)
+        digest = _code_digest(code) if code is not None else ""
+        return f"{getattr(value, '__module__', '')}.{value.__qualname__}:{digest}"
+    return repr(value)
+
+def _code_digest(code: CodeType) -> str:
+    hasher = hashlib.sha256(code.co_code)
+    for constant in code.co_consts:
+        # Nested code objects repr with their memory address, so they are hashed recursively instead
+        hasher.update((_code_digest(constant) if isinstance(constant, CodeType) else repr(constant)).encode())
+    return hasher.hexdigest()[:16]
+
+def result_digest(result: Any) -> str:
+    """Digest of the content of a task result, identifying it as the input of the tasks consuming it."""
+    hasher = hashlib.sha256()
+    if isinstance(result, pl.Series):
+        result = result.to_frame()
+    if isinstance(result, pl.DataFrame):
+        hasher.update(str(result.schema).encode())
+        if result.height and result.width:
+            # Columns are hashed one by one first, since rows can't be hashed across nested types
+            row_hashes = io.BytesIO()
+            result.select(pl.all().hash(seed=0)).hash_rows(seed=0).to_frame().write_ipc(row_hashes)
+            hasher.update(row_hashes.getvalue())
+    else:
+        hasher.update(json.dumps(result, sort_keys=True, default=repr).encode())
+    return hasher.hexdigest()
+
+class CheckpointStore:
+    """Content-addressed store of task results.
+
+    A task's key hashes its fingerprint together with the digests of its dependencies' results,
+    so a task is only restored when neither it nor its inputs changed, even if an upstream task
+    that was not restored ran again.
+    """
+    def __init__(self, directory: str, salt: str = ""):
+        self.directory = directory
+        self.salt = salt
+        os.makedirs(directory, exist_ok=True)
+
+    def task_key(self, task_fingerprint: str, dependency_digests: List[str]) -> str:
+        hasher = hashlib.sha256(self.salt.encode())
+        hasher.update(task_fingerprint.encode())
+        for dependency_digest in dependency_digests:
+            hasher.update(dependency_digest.encode())
+        return hasher.hexdigest()
+
+    def load(self, key: str) -> Optional[Tuple[Any, int, int]]:
+        metadata_path = self._path(key, "json")
+        if not os.path.exists(metadata_path):
+            return None
+
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+
+        kind = metadata["kind"]
+        if kind == "json":
+            result = metadata["value"]
+        else:
+            frame = pl.read_ipc(self._path(key, "ipc"), memory_map=False)
+            if kind == "dataframe":
+                result = frame
+            elif kind == "series":
+                result = frame.to_series()
+            elif kind == "records":
+                result = frame.to_dicts()
+            else:
+                result = frame.to_series().to_list()
+        return result, metadata["result_count"], metadata["failure_count"]
+
+    def save(self, key: str, task_name: str, result: Any, result_count: int, failure_count: int) -> bool:
+        metadata = {"task": task_name, "result_count": result_count, "failure_count": failure_count, "created": time.time()}
+        try:
+            frame = None
+            if isinstance(result, pl.DataFrame):
+                metadata["kind"], frame = "dataframe", result
+            elif isinstance(result, pl.Series):
+                metadata["kind"], frame = "series", result.to_frame()
+            elif isinstance(result, list) and result and all(isinstance(item, dict) for item in result):
+                metadata["kind"], frame = "records", pl.DataFrame(result, infer_schema_length=None)
+            elif isinstance(result, list):
+                metadata["kind"], frame = "list", pl.DataFrame({"value": result}, strict=False)
+            else:
+                metadata["kind"], metadata["value"] = "json", result
+                json.dumps(result)
+
+            if frame is not None:
+                self._write_atomically(self._path(key, "ipc"), lambda path: frame.write_ipc(path))
+            # The metadata file is written last, so a checkpoint interrupted mid-way is never loaded
+            self._write_atomically(self._path(key, "json"), lambda path: self._write_json(path, metadata))
+            return True
+        except Exception as e:
+            logger.warning(f"Could not checkpoint the result of task {task_name}: {e}")
+            return False
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    @staticmethod
+    def _write_json(path: str, data: dict) -> None:
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    @staticmethod
+    def _write_atomically(path: str, write) -> None:
+        temporary_path = f"{path}.tmp"
+        write(temporary_path)
+        os.replace(temporary_path, path)
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import json
+import os
+from typing import Dict, List, Optional
 
 @dataclass
 class Config(ABC):
@@ -28,6 +30,64 @@ class OfferWorkFlowConfig(CSVConfig, ResultConfig, PerformanceConfig):
     ats_url: str
     resp_url: str     
     offer_url: str     
+    max_workers: Optional[int] = None
+    streaming: bool = False
+    stream_batch_size: int = 10000
+    stream_channel_capacity: int = 4
+    http_connection_limit: int = 100
+    http_connection_limit_per_host: int = 0
+    http_dns_cache_ttl: Optional[int] = 300
+    http_keepalive_timeout: float = 30
+    request_batch_size: Optional[int] = None
+    ats_batch_url: Optional[str] = None
+    resp_batch_url: Optional[str] = None
+    offer_batch_url: Optional[str] = None
+    ats_mode: str = "request"
+    resp_mode: str = "request"
+    offer_mode: str = "request"
+    response_cache: bool = False
+    response_cache_path: Optional[str] = None
+    response_cache_memory_entries: int = 100000
+    response_cache_disk_entries: int = 10000000
+    response_cache_ttl: Optional[float] = None
+    checkpoint_dir: Optional[str] = None
+    incremental_state_dir: Optional[str] = None
+    transform_mode: str = "eager"
+    polars_streaming: bool = False
+    task_executors: Dict[str, str] = field(default_factory=dict)
+    process_workers: Optional[int] = None
+    request_timeout: Optional[float] = None
+    request_deadline: Optional[float] = None
+    request_max_retries: int = 0
+    request_retry_backoff: float = 0.1
+    request_hedge_quantile: Optional[float] = None
+    request_max_concurrency: int = 100
+    request_adaptive_concurrency: bool = False
+    request_min_concurrency: int = 1
+    request_rate_limit: Optional[float] = None
+    request_rate_burst: Optional[float] = None
+    trace_output_path: Optional[str] = None
+    result_output_format: str = "csv"
+    shard_count: int = 1
+    shard_dir: Optional[str] = None
+    shard_workers: Optional[int] = None
+    shard_stale_after: float = 600
+    map_partitions: Optional[int] = None
+    map_partition_rows: Optional[int] = None
+    memory_budget_mb: Optional[float] = None
+    scoring_mode: str = "staged"
+    score_url: Optional[str] = None
+    spill_dir: Optional[str] = None
+    profile_tasks: List[str] = field(default_factory=list)
+    profile_memory: bool = True
+    profile_top: int = 10
+    failures_output_path: Optional[str] = None
+    repair: bool = False
+
+    @property
+    def failures_path(self) -> str:
+        """Ledger of the rows that failed, next to the results unless failures_output_path is set."""
+        return self.failures_output_path or f"{os.path.splitext(self.result_output_path)[0]}.failures.csv"
 
     @classmethod
     def from_json_file(cls, file_path: str):
@@ -42,5 +102,58 @@ class OfferWorkFlowConfig(CSVConfig, ResultConfig, PerformanceConfig):
             resp_url=data.get("resp_url"),
             offer_url=data.get("offer_url"),
             result_output_path=data.get("result_output_path"),
-            performance_output_path=data.get("performance_output_path")
+            performance_output_path=data.get("performance_output_path"),
+            max_workers=data.get("max_workers"),
+            streaming=data.get("streaming", False),
+            stream_batch_size=data.get("stream_batch_size", 10000),
+            stream_channel_capacity=data.get("stream_channel_capacity", 4),
+            http_connection_limit=data.get("http_connection_limit", 100),
+            http_connection_limit_per_host=data.get("http_connection_limit_per_host", 0),
+            http_dns_cache_ttl=data.get("http_dns_cache_ttl", 300),
+            http_keepalive_timeout=data.get("http_keepalive_timeout", 30),
+            request_batch_size=data.get("request_batch_size"),
+            ats_batch_url=data.get("ats_batch_url"),
+            resp_batch_url=data.get("resp_batch_url"),
+            offer_batch_url=data.get("offer_batch_url"),
+            ats_mode=data.get("ats_mode", "request"),
+            resp_mode=data.get("resp_mode", "request"),
+            offer_mode=data.get("offer_mode", "request"),
+            response_cache=data.get("response_cache", False),
+            response_cache_path=data.get("response_cache_path"),
+            response_cache_memory_entries=data.get("response_cache_memory_entries", 100000),
+            response_cache_disk_entries=data.get("response_cache_disk_entries", 10000000),
+            response_cache_ttl=data.get("response_cache_ttl"),
+            checkpoint_dir=data.get("checkpoint_dir"),
+            incremental_state_dir=data.get("incremental_state_dir"),
+            transform_mode=data.get("transform_mode", "eager"),
+            polars_streaming=data.get("polars_streaming", False),
+            task_executors=data.get("task_executors", {}),
+            process_workers=data.get("process_workers"),
+            request_timeout=data.get("request_timeout"),
+            request_deadline=data.get("request_deadline"),
+            request_max_retries=data.get("request_max_retries", 0),
+            request_retry_backoff=data.get("request_retry_backoff", 0.1),
+            request_hedge_quantile=data.get("request_hedge_quantile"),
+            request_max_concurrency=data.get("request_max_concurrency", 100),
+            request_adaptive_concurrency=data.get("request_adaptive_concurrency", False),
+            request_min_concurrency=data.get("request_min_concurrency", 1),
+            request_rate_limit=data.get("request_rate_limit"),
+            request_rate_burst=data.get("request_rate_burst"),
+            trace_output_path=data.get("trace_output_path"),
+            result_output_format=data.get("result_output_format", "csv"),
+            shard_count=data.get("shard_count", 1),
+            shard_dir=data.get("shard_dir"),
+            shard_workers=data.get("shard_workers"),
+            shard_stale_after=data.get("shard_stale_after", 600),
+            map_partitions=data.get("map_partitions"),
+            map_partition_rows=data.get("map_partition_rows"),
+            memory_budget_mb=data.get("memory_budget_mb"),
+            scoring_mode=data.get("scoring_mode", "staged"),
+            score_url=data.get("score_url"),
+            spill_dir=data.get("spill_dir"),
+            profile_tasks=data.get("profile_tasks", []),
+            profile_memory=data.get("profile_memory", True),
+            profile_top=data.get("profile_top", 10),
+            failures_output_path=data.get("failures_output_path"),
+            repair=data.get("repair", False)
         )
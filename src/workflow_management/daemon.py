@@ -0,0 +1,213 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from .config import Config
+from .http_client import HttpClient
+from .response_cache import ResponseCache
+from .workflow import OfferWorkFlow
+from .workflow_factory import WorkFlowFactory
+
+logger = logging.getLogger(__name__)
+
+
+class WorkFlowDaemon:
+    """Runs submitted workflows in one long-lived process, keeping what is costly to set up between runs.
+
+    Imports, loaded configs, the HTTP client and its connection pool, response caches and a
+    task thread pool of max_workers threads are shared by every run, so the pool is the worker
+    budget of all runs together. Up to max_concurrent_runs runs proceed at once, except that
+    runs of the same config file take turns since they write the same outputs.
+    """
+    def __init__(self, max_workers: Optional[int] = None, max_concurrent_runs: int = 4, http_connection_limit: int = 100,
+                 http_connection_limit_per_host: int = 0, max_finished_runs: int = 1000):
+        self.max_finished_runs = max_finished_runs
+        self.task_executor = ThreadPoolExecutor(max_workers=max_workers or min(32, (os.cpu_count() or 1) + 4), thread_name_prefix="daemon-task")
+        self.run_executor = ThreadPoolExecutor(max_workers=max_concurrent_runs, thread_name_prefix="daemon-run")
+        self.http_client = HttpClient(connection_limit=http_connection_limit, connection_limit_per_host=http_connection_limit_per_host)
+        self.runs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._done_events: Dict[str, threading.Event] = {}
+        self._configs: Dict[Tuple[str, str], Tuple[int, Config]] = {}
+        self._config_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._response_caches: Dict[Tuple, ResponseCache] = {}
+        self._lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._server_thread = None
+
+    def _load_config(self, workflow_type: str, config_path: str) -> Tuple[Tuple[str, str], Config]:
+        """Config of a file, reloaded only when the file changes."""
+        key = (workflow_type, os.path.abspath(config_path))
+        modified_time = os.stat(config_path).st_mtime_ns
+        with self._lock:
+            cached = self._configs.get(key)
+            if cached is None or cached[0] != modified_time:
+                cached = modified_time, WorkFlowFactory.load_config(workflow_type, config_path)
+                self._configs[key] = cached
+                self._config_locks.setdefault(key, threading.Lock())
+            return key, cached[1]
+
+    def _response_cache(self, config: Config) -> Optional[ResponseCache]:
+        """Response cache of a config, shared by all configs with the same cache settings so that it stays warm between runs."""
+        if not getattr(config, "response_cache", False):
+            return None
+        key = (config.response_cache_path, config.response_cache_memory_entries, config.response_cache_disk_entries, config.response_cache_ttl)
+        with self._lock:
+            if key not in self._response_caches:
+                self._response_caches[key] = OfferWorkFlow.create_response_cache(config)
+            return self._response_caches[key]
+
+    def submit(self, config_path: str, workflow_type: str = "OfferWorkFlow") -> Dict:
+        """Queues a run of the workflow in config_path and returns its record. Invalid configs raise right away."""
+        key, config = self._load_config(workflow_type, config_path)
+        run_id = uuid.uuid4().hex
+        record = {
+            "run_id": run_id,
+            "workflow": workflow_type,
+            "config_path": config_path,
+            "status": "queued",
+            "submitted_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        }
+        with self._lock:
+            self.runs[run_id] = record
+            self._done_events[run_id] = threading.Event()
+            self._forget_finished_runs()
+            submitted = dict(record)
+        self.run_executor.submit(self._run, record, key, config, time.perf_counter())
+        return submitted
+
+    def _run(self, record: Dict, key: Tuple[str, str], config: Config, submit_time: float) -> None:
+        with self._config_locks[key]:
+            start_time = time.perf_counter()
+            self._update_run(record, status="running", **{"queue_time (sec)": start_time - submit_time})
+            outcome = {}
+            try:
+                workflow = WorkFlowFactory.create_from_config(record["workflow"], config, http_client=self.http_client,
+                                                              response_cache=self._response_cache(config), executor=self.task_executor)
+                workflow.start()
+                outcome = {"status": "succeeded", "summary": workflow.get_summary()}
+            except Exception as e:
+                logger.error(f"Run {record['run_id']} of {record['config_path']} failed: {e}", exc_info=True)
+                outcome = {"status": "failed", "error": repr(e)}
+            finally:
+                self._update_run(record, **outcome, **{"run_time (sec)": time.perf_counter() - start_time})
+                self._done_events[record["run_id"]].set()
+
+    def _update_run(self, record: Dict, **fields) -> None:
+        with self._lock:
+            record.update(fields)
+
+    def _forget_finished_runs(self) -> None:
+        finished = [run_id for run_id, record in self.runs.items() if record["status"] in ("succeeded", "failed")]
+        for run_id in finished[:max(0, len(self.runs) - self.max_finished_runs)]:
+            del self.runs[run_id]
+            del self._done_events[run_id]
+
+    def get_run(self, run_id: str, timeout: Optional[float] = 0) -> Optional[Dict]:
+        """Record of a run, after waiting up to timeout seconds (None for no limit) for it to finish."""
+        with self._lock:
+            done_event = self._done_events.get(run_id)
+        if done_event is None:
+            return None
+        if timeout != 0:
+            done_event.wait(timeout)
+        with self._lock:
+            return dict(self.runs[run_id])
+
+    def list_runs(self) -> List[Dict]:
+        with self._lock:
+            return [{key: value for key, value in record.items() if key != "summary"} for record in self.runs.values()]
+
+    def start(self, host: str = "127.0.0.1", port: int = 8100) -> str:
+        """Serves the run API on a background thread and returns its base url."""
+        self.server = ThreadingHTTPServer((host, port), _DaemonRequestHandler)
+        self.server.daemon_threads = True
+        self.server.workflow_daemon = self
+        self._server_thread = threading.Thread(target=self.server.serve_forever, name="daemon-server", daemon=True)
+        self._server_thread.start()
+        url = f"http://{host}:{self.server.server_address[1]}"
+        logger.info(f"Workflow daemon listening on {url}")
+        return url
+
+    def close(self) -> None:
+        """Stops serving, waits for queued runs and releases the shared resources."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self._server_thread.join()
+            self.server = None
+        self.run_executor.shutdown()
+        self.task_executor.shutdown()
+        self.http_client.close()
+        for response_cache in self._response_caches.values():
+            response_cache.close()
+
+    def __enter__(self) -> "WorkFlowDaemon":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    """Run API of a WorkFlowDaemon.
+
+    POST /runs {"config_path": ..., "workflow": "OfferWorkFlow", "wait": false} queues a run,
+    GET /runs lists runs and GET /runs/<run_id>?wait=<seconds> returns a run with its summary.
+    """
+    def _send_json(self, status: int, body) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        workflow_daemon: WorkFlowDaemon = self.server.workflow_daemon
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if url.path == "/":
+            self._send_json(200, {"status": "ok", "runs": dict(Counter(record["status"] for record in workflow_daemon.list_runs()))})
+        elif parts == ["runs"]:
+            self._send_json(200, workflow_daemon.list_runs())
+        elif len(parts) == 2 and parts[0] == "runs":
+            try:
+                timeout = float(parse_qs(url.query).get("wait", ["0"])[0])
+            except ValueError:
+                self._send_json(400, {"detail": "wait must be a number of seconds"})
+                return
+            record = workflow_daemon.get_run(parts[1], timeout)
+            if record is None:
+                self._send_json(404, {"detail": f"Unknown run {parts[1]}"})
+            else:
+                self._send_json(200, record)
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def do_POST(self) -> None:
+        workflow_daemon: WorkFlowDaemon = self.server.workflow_daemon
+        if urlsplit(self.path).path.rstrip("/") != "/runs":
+            self._send_json(404, {"detail": "Not Found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(body, dict) or not isinstance(body.get("config_path"), str):
+                raise ValueError("The body must be a JSON object with a config_path")
+            record = workflow_daemon.submit(body["config_path"], body.get("workflow", "OfferWorkFlow"))
+        except (OSError, ValueError) as e:
+            self._send_json(400, {"detail": str(e)})
+            return
+        if body.get("wait"):
+            self._send_json(200, workflow_daemon.get_run(record["run_id"], None))
+        else:
+            self._send_json(202, record)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} {format % args}")
@@ -1,22 +1,65 @@
+import heapq
 import logging
+import os
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict
-from .task import Task
-import networkx as nx
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Collection, Dict, List, Optional
+from .metrics import chrome_trace
+from .task_graph import TaskGraph
+
+# The modules of tasks, checkpoints, spilling, process execution and profiling import polars and aiohttp,
+# so they are only loaded by the methods and modes using them, keeping the import of the DAG core fast
+if TYPE_CHECKING:
+    from .checkpoint import CheckpointStore
+    from .profiling import TaskProfile
+    from .spill import SpillStore
+    from .task import Task
 
 logger = logging.getLogger(__name__)
 
 class DAGTaskManager:
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, streaming: bool = False, stream_batch_size: int = 10000, stream_channel_capacity: int = 4,
+                 checkpoint_store: Optional["CheckpointStore"] = None, process_workers: Optional[int] = None, executor: Optional[Executor] = None,
+                 memory_budget: Optional[int] = None, spill_dir: Optional[str] = None, profile_tasks: Optional[Collection[str]] = None,
+                 profile_memory: bool = True, profile_top: int = 10):
         self.tasks = {}
-        self.dag = nx.DiGraph() 
+        self.dag = TaskGraph()
         self.results = {} 
         self.execution_time = None
+        self.max_workers = max_workers
+        self.streaming = streaming
+        self.stream_batch_size = stream_batch_size
+        self.stream_channel_capacity = stream_channel_capacity
+        self.checkpoint_store = checkpoint_store
+        self.process_workers = process_workers
+        # A shared pool bounds the tasks of every workflow using it; max_workers then only bounds this one's share
+        self.executor = executor
+        # Bytes of DataFrame and Series results to hold in memory before spilling them to spill_dir
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.spilled_tasks = set()
+        self.peak_result_size = 0
+        # Names of the tasks to profile, "*" for every task; profile_top is the number of functions and allocation sites reported
+        self.profile_tasks = set(profile_tasks or ())
+        self.profile_memory = profile_memory
+        self.profile_top = profile_top
+        self.profiles: Dict[str, "TaskProfile"] = {}
+        self.result_digests = {}
+        self.restored_tasks = set()
+        self.task_timings = {}
+        self.clock_start = time.perf_counter()
+
+    def add_task(self, task: "Task") -> None:
+        from .task import EXECUTORS, SyncTask
 
-    def add_task(self, task: Task) -> None:
         if task.name in self.tasks:
             raise ValueError(f"Task {task.name} already exists.")
+        if task.executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {task.executor} for task {task.name}.")
+        if task.executor == "process" and not isinstance(task, SyncTask):
+            raise ValueError(f"Task {task.name} can't run in a process, only SyncTasks can.")
         
         self.tasks[task.name] = task
         self.dag.add_node(task.name)
@@ -27,44 +70,279 @@ class DAGTaskManager:
                     raise ValueError(f"Dependency {dep} not found for task {task.name}.")
                 self.dag.add_edge(dep, task.name)
 
+    def critical_path_lengths(self, order: Optional[List[int]] = None) -> Dict[str, int]:
+        """Number of tasks on the longest path from each task to a sink, itself included.
+
+        order is a topological order of the task ids, computed if not given.
+        """
+        lengths = [0] * len(self.dag)
+        for node in reversed(order if order is not None else self.dag.topological_order()):
+            lengths[node] = 1 + max((lengths[successor] for successor in self.dag.successor_ids(node)), default=0)
+        return dict(zip(self.dag.names, lengths))
+
     def execute(self) -> None:
+        from .task import MapTask
+
         start_time = time.time()
+        self.task_timings = {}
+        self.profiles = {}
+        self.clock_start = time.perf_counter()
 
-        if not nx.is_directed_acyclic_graph(self.dag):
-            raise ValueError("The task dependencies form a cycle!")
+        # Raises a CycleError naming the tasks of a cycle
+        order = self.dag.topological_order()
 
-        sorted_tasks = list(nx.topological_sort(self.dag)) 
-        completed_tasks = set()
+        process_runner = None
+        if any(task.executor == "process" for task in self.tasks.values()):
+            from .process_execution import ProcessRunner
+            process_runner = ProcessRunner(max_workers=self.process_workers)
+        for task in self.tasks.values():
+            task.process_runner = process_runner if task.executor == "process" else None
 
-        with ThreadPoolExecutor() as executor:
-            futures = {}
+        try:
+            if self.streaming:
+                self._execute_streaming()
+            else:
+                self._execute_batch(order)
+        finally:
+            if process_runner is not None:
+                process_runner.close()
+            for task in self.tasks.values():
+                if isinstance(task, MapTask):
+                    task.thread_pool = None
 
-            while sorted_tasks:
-                ready_tasks = [
-                    task for task in sorted_tasks if set(self.tasks[task].dependencies).issubset(completed_tasks)
-                ]
+        self.execution_time = time.time() - start_time
 
-                if not ready_tasks:
-                    raise RuntimeError("Deadlock detected in task execution!")
+    def _execute_batch(self, order: List[int]) -> None:
+        from .spill import SpillStore, result_size
+        from .task import MapTask
 
-                for task_name in ready_tasks:
+        priorities = self.critical_path_lengths(order)
+        insertion_order = {task_name: index for index, task_name in enumerate(self.tasks)}
+        remaining_dependencies = dict(zip(self.dag.names, self.dag.in_degrees()))
+        worker_count = self.max_workers or min(32, (os.cpu_count() or 1) + 4)
+
+        # Ready tasks are ordered by longest remaining path first, ties broken by insertion order
+        ready_tasks = [
+            (-priorities[task_name], insertion_order[task_name], task_name)
+            for task_name, count in remaining_dependencies.items() if count == 0
+        ]
+        heapq.heapify(ready_tasks)
+        for _, _, task_name in ready_tasks:
+            self._mark_ready(task_name)
+        # Results are released once every task consuming them has started, except those of sink tasks
+        remaining_consumers = {task_name: len(self.dag.successor_ids(node)) for node, task_name in enumerate(self.dag.names)}
+        result_sizes = {}
+        completed_count = 0
+        self.results = {}
+        self.result_digests = {}
+        self.restored_tasks = set()
+        self.spilled_tasks = set()
+        self.peak_result_size = 0
+
+        pool = nullcontext(self.executor) if self.executor is not None else ThreadPoolExecutor(max_workers=worker_count)
+        with pool as executor, SpillStore(self.spill_dir) as spill_store:
+            for task in self.tasks.values():
+                if isinstance(task, MapTask):
+                    task.thread_pool, task.parallelism = executor, worker_count
+            running = {}
+
+            while ready_tasks or running:
+                # Only hand the pool as many tasks as it has workers so that a task becoming
+                # ready later with a longer critical path can still jump the queue
+                while ready_tasks and len(running) < worker_count:
+                    _, _, task_name = heapq.heappop(ready_tasks)
                     task = self.tasks[task_name]
-                    dependency_results = [self.results[dep] for dep in task.dependencies]
-                    futures[task_name] = executor.submit(task.execute, dependency_results)
-                    sorted_tasks.remove(task_name)
-
-                for future in as_completed(futures.values()):
-                    for task_name, f in futures.items():
-                        if f == future:
-                            self.results[task_name] = future.result()
-                            completed_tasks.add(task_name)
-                            break
-        self.execution_time = time.time() - start_time
+                    dependency_results = [self._take_result(dep, remaining_consumers, result_sizes) for dep in task.dependencies]
+                    if task.executor == "inline":
+                        running[self._execute_inline(task, dependency_results)] = task_name
+                    else:
+                        running[executor.submit(self._execute_task, task, dependency_results)] = task_name
+                    # From here on only the consumer holds its inputs, so they are freed once it finishes
+                    del dependency_results
+
+                if self.memory_budget is not None:
+                    self._spill_over_budget(spill_store, remaining_consumers, result_sizes)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    task_name = running.pop(future)
+                    self.results[task_name] = future.result()
+                    result_sizes[task_name] = result_size(self.results[task_name])
+                    self.peak_result_size = max(self.peak_result_size, sum(result_sizes.values()))
+                    completed_count += 1
+
+                    for successor in self.dag.successors(task_name):
+                        remaining_dependencies[successor] -= 1
+                        if remaining_dependencies[successor] == 0:
+                            self._mark_ready(successor)
+                            heapq.heappush(ready_tasks, (-priorities[successor], insertion_order[successor], successor))
+
+        if completed_count != len(self.tasks):
+            raise RuntimeError("Deadlock detected in task execution!")
+
+    def _take_result(self, task_name: str, remaining_consumers: Dict[str, int], result_sizes: Dict[str, int]) -> Any:
+        """Result of a task for one of its consumers, dropped by the manager and the task once the last consumer has it."""
+        from .spill import SpilledResult
+
+        result = self.results[task_name]
+        if isinstance(result, SpilledResult):
+            result = result.load()
+        remaining_consumers[task_name] -= 1
+        if remaining_consumers[task_name] == 0:
+            released = self.results.pop(task_name)
+            if isinstance(released, SpilledResult):
+                released.remove()
+            result_sizes.pop(task_name, None)
+            self.tasks[task_name].result = None
+        return result
+
+    def _spill_over_budget(self, spill_store: "SpillStore", remaining_consumers: Dict[str, int], result_sizes: Dict[str, int]) -> None:
+        """Moves the largest results still waiting for consumers to disk until the results held in memory fit the budget."""
+        held_size = sum(result_sizes.values())
+        waiting = sorted((task_name for task_name in result_sizes if remaining_consumers[task_name] and result_sizes[task_name]),
+                         key=result_sizes.get, reverse=True)
+        for task_name in waiting:
+            if held_size <= self.memory_budget:
+                break
+            start_time = time.perf_counter()
+            self.results[task_name] = spill_store.spill(self.results[task_name])
+            self.tasks[task_name].result = None
+            held_size -= result_sizes.pop(task_name)
+            self.spilled_tasks.add(task_name)
+            logger.info(f"Spilled the result of {task_name} ({self.results[task_name].size / 2**20:.1f} MB) "
+                        f"in {time.perf_counter() - start_time:.2f} sec")
+
+    def _execute_inline(self, task: "Task", dependency_results: List) -> Future:
+        """Runs a task on the scheduler thread, for tasks too cheap to be worth a hand-off to the pool."""
+        future = Future()
+        try:
+            future.set_result(self._execute_task(task, dependency_results))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self.clock_start
+
+    def _mark_ready(self, task_name: str) -> None:
+        self.task_timings[task_name] = {"ready": self._elapsed()}
+
+    def _mark_start(self, task_name: str) -> Dict:
+        timing = self.task_timings.setdefault(task_name, {"ready": self._elapsed()})
+        timing.update(start=self._elapsed(), thread=threading.current_thread().name)
+        return timing
+
+    def _profile(self, task_name: str):
+        if task_name not in self.profile_tasks and "*" not in self.profile_tasks:
+            return nullcontext()
+        from .profiling import TaskProfile
+        self.profiles[task_name] = TaskProfile(memory=self.profile_memory, top=self.profile_top)
+        return self.profiles[task_name]
+
+    def _execute_task(self, task: "Task", dependency_results: List) -> Any:
+        timing = self._mark_start(task.name)
+        try:
+            with self._profile(task.name):
+                return self._execute_or_restore(task, dependency_results)
+        finally:
+            timing["end"] = self._elapsed()
+
+    def _execute_or_restore(self, task: "Task", dependency_results: List) -> Any:
+        if self.checkpoint_store is None:
+            return task.execute(dependency_results)
+        from .checkpoint import result_digest
+
+        if not task.checkpoint:
+            result = task.execute(dependency_results)
+        else:
+            result = self._restore_or_checkpoint(task, dependency_results)
+        self.result_digests[task.name] = result_digest(result)
+        return result
+
+    def _restore_or_checkpoint(self, task: "Task", dependency_results: List) -> Any:
+        key = self.checkpoint_store.task_key(task.fingerprint(), [self.result_digests[dep] for dep in task.dependencies])
+
+        start_time = time.time()
+        checkpoint = self.checkpoint_store.load(key)
+        if checkpoint is not None:
+            task.result, task.result_count, task.failure_count = checkpoint
+            task.execution_time = time.time() - start_time
+            self.restored_tasks.add(task.name)
+            logger.info(f"Task {task.name} restored from checkpoint {key}")
+            return task.result
+
+        result = task.execute(dependency_results)
+        # Failed runs are not checkpointed so that the next run retries them
+        if result is not None and task.failure_count == 0:
+            self.checkpoint_store.save(key, task.name, result, task.result_count, task.failure_count)
+        return result
+
+    def _execute_streaming(self) -> None:
+        """Runs every task at once, passing micro-batches through bounded channels.
+
+        Tasks with a stream_func start on the first batch of their inputs; the others wait for
+        their whole input. Results are not retained since they are never materialised in full.
+        Backpressure needs a thread for every task. With fewer workers (max_workers, or a shared
+        executor whose free workers are unknown) the channels are unbounded instead: tasks are
+        submitted in insertion order, which puts producers first, so a producer never waits on a
+        consumer that has no worker yet.
+        """
+        from .streaming import Channel, StreamAborted
+
+        if self.checkpoint_store is not None:
+            logger.warning("Checkpoints are not used in streaming mode")
+
+        worker_count = self.max_workers or len(self.tasks) or 1
+        bounded = self.executor is None and worker_count >= len(self.tasks)
+        if not bounded:
+            logger.warning("Streaming without backpressure, since not every task can have a worker of its own")
+
+        abort_event = threading.Event()
+        input_channels = {task_name: [] for task_name in self.tasks}
+        output_channels = {task_name: [] for task_name in self.tasks}
+
+        for task_name, task in self.tasks.items():
+            # Tasks that collect their whole input get unbounded channels so that draining one
+            # dependency never blocks the producers of the others
+            capacity = self.stream_channel_capacity if task.stream_func is not None and bounded else 0
+            for dep in task.dependencies:
+                channel = Channel(capacity, abort_event)
+                input_channels[task_name].append(channel)
+                output_channels[dep].append(channel)
+
+        def run_task(task_name: str) -> None:
+            task = self.tasks[task_name]
+            timing = self._mark_start(task_name)
+            try:
+                with self._profile(task_name):
+                    for batch in task.stream(input_channels[task_name], self.stream_batch_size):
+                        for channel in output_channels[task_name]:
+                            channel.put(batch)
+                    for channel in output_channels[task_name]:
+                        channel.close()
+            except StreamAborted:
+                return
+            except BaseException:
+                abort_event.set()
+                raise
+            finally:
+                timing["end"] = self._elapsed()
+
+        self.results = {}
+        pool = nullcontext(self.executor) if self.executor is not None else ThreadPoolExecutor(max_workers=min(worker_count, len(self.tasks) or 1))
+        with pool as executor:
+            futures = [executor.submit(run_task, task_name) for task_name in self.tasks]
+            # A shared executor outlives the run, so every task is waited for before failures are raised
+            wait(futures)
+            for future in futures:
+                future.result()
 
     def get_summary(self) -> Dict:
         summary = {
             "tasks": {},
             "total_execution_time (sec)": self.execution_time,
+            "peak_result_size (MB)": self.peak_result_size / 2**20,
             "UTC_time_of_completion": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
         }
 
@@ -76,5 +354,24 @@ class DAGTaskManager:
                 "item_failure_count": task.failure_count,
                 "throughput (item/sec)": task.result_count / task.execution_time if task.execution_time else 0
             }
+            timing = self.task_timings.get(task_name, {})
+            if "start" in timing:
+                summary["tasks"][task_name]["wait_time (sec)"] = timing["start"] - timing["ready"]
+            if task_name in self.restored_tasks:
+                summary["tasks"][task_name]["restored_from_checkpoint"] = True
+            if task_name in self.spilled_tasks:
+                summary["tasks"][task_name]["spilled"] = True
+            if task_name in self.profiles:
+                summary["tasks"][task_name]["profile"] = self.profiles[task_name].get_stats()
+            summary["tasks"][task_name].update(task.get_metrics())
+
+        return summary
+
+    def write_profiles(self, directory: str) -> List[str]:
+        """Writes the CPU profile of every profiled task of the last run into directory, one pstats file per task."""
+        paths = [profile.dump(directory, task_name) for task_name, profile in self.profiles.items()]
+        return [path for path in paths if path is not None]
 
-        return summary
\ No newline at end of file
+    def get_trace(self) -> Dict:
+        """Chrome/Perfetto trace of the last run, viewable in chrome://tracing or ui.perfetto.dev."""
+        return chrome_trace(self.task_timings, self.get_summary()["tasks"])
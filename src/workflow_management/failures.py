@@ -0,0 +1,97 @@
+import os
+import threading
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import polars as pl
+
+
+@dataclass(frozen=True)
+class RowFailure:
+    """Why a row got no result: the error of its last attempt, and how many attempts were made."""
+    error: str
+    attempts: int = 1
+
+
+class FailureLog:
+    """Rows that failed in the tasks of a run, identified by their key_field value, shared by the tasks recording them.
+
+    Tasks record from any thread. The log is saved as a CSV ledger of key_field, task, error
+    and attempts, which a repair run reads to re-score only the failed rows.
+    """
+    def __init__(self, key_field: str):
+        self.key_field = key_field
+        self._failures: Dict[tuple, RowFailure] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        # Stable across runs, since tasks taking the log are fingerprinted with it
+        return f"FailureLog({self.key_field!r})"
+
+    def __getstate__(self) -> Dict:
+        with self._lock:
+            return {"key_field": self.key_field, "_failures": dict(self._failures)}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._failures)
+
+    def record(self, task_name: str, key: Any, failure: RowFailure) -> None:
+        with self._lock:
+            self._failures[(key, task_name)] = failure
+
+    def clear(self) -> None:
+        with self._lock:
+            self._failures = {}
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            failures = list(self._failures.items())
+        errors = {}
+        for (_, task_name), failure in failures:
+            errors.setdefault(task_name, Counter())[failure.error] += 1
+        return {
+            "failed_rows": len({key for (key, _), _ in failures}),
+            "errors": {task_name: dict(counts) for task_name, counts in errors.items()}
+        }
+
+    def to_frame(self, key_dtype: Optional[pl.DataType] = None) -> pl.DataFrame:
+        with self._lock:
+            failures = list(self._failures.items())
+        return pl.DataFrame({
+            self.key_field: pl.Series([key for (key, _), _ in failures], dtype=key_dtype),
+            "task": pl.Series([task_name for (_, task_name), _ in failures], dtype=pl.String),
+            "error": pl.Series([failure.error for _, failure in failures], dtype=pl.String),
+            "attempts": pl.Series([failure.attempts for _, failure in failures], dtype=pl.Int64)
+        })
+
+    def save(self, path: str, key_dtype: Optional[pl.DataType] = None, scored_keys: Optional[pl.Series] = None) -> None:
+        """Writes the ledger of the run to path.
+
+        A run that scored only some rows, scored_keys, passes them so that the failures the
+        ledger already holds for other rows are kept. Rows failing again add up their attempts.
+        """
+        failures = self.to_frame(key_dtype)
+        if scored_keys is not None and os.path.exists(path):
+            previous = read_failures(path, failures.schema[self.key_field])
+            rescored = pl.col(self.key_field).is_in(scored_keys)
+            failures = pl.concat([
+                previous.filter(~rescored),
+                failures.join(previous.filter(rescored).select(self.key_field, "task", pl.col("attempts").alias("previous_attempts")),
+                              on=[self.key_field, "task"], how="left")
+                        .select(self.key_field, "task", "error", pl.col("attempts") + pl.col("previous_attempts").fill_null(0))
+            ])
+        # Written aside and renamed, so a failed write never loses the previous ledger
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        failures.write_csv(temp_path)
+        os.replace(temp_path, path)
+
+
+def read_failures(path: str, key_dtype: Optional[pl.DataType] = None) -> pl.DataFrame:
+    """Ledger written by FailureLog.save, whose first column is the key."""
+    key_field = pl.read_csv(path, n_rows=0).columns[0]
+    return pl.read_csv(path, schema_overrides={key_field: key_dtype or pl.String, "task": pl.String, "error": pl.String, "attempts": pl.Int64})
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Coroutine, Dict, Optional
+from urllib.parse import urlsplit
+import aiohttp
+from .limiter import ConcurrencyLimiter
+
+logger = logging.getLogger(__name__)
+
+class HttpClient:
+    """Workflow-scoped event loop and keep-alive HTTP session shared by every RequestTask.
+
+    The loop runs on a background thread for the lifetime of the client, so tasks running on
+    different worker threads reuse the same pooled connections and DNS cache, as well as one
+    concurrency limiter per host.
+    """
+    def __init__(self, connection_limit: int = 100, connection_limit_per_host: int = 0, dns_cache_ttl: Optional[int] = 300, keepalive_timeout: float = 30):
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="http-client-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coroutine: Coroutine) -> Any:
+        """Runs a coroutine on the shared loop and blocks the calling thread until it completes."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Must be awaited from the shared loop."""
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                use_dns_cache=self.dns_cache_ttl is not None,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def limiter(self, url: str, create: Callable[[], ConcurrencyLimiter]) -> ConcurrencyLimiter:
+        """Concurrency limiter of the host of url, made by create for the first task sending to that host."""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = create()
+            return self._limiters[host]
+
+    def close(self) -> None:
+        with self._lock:
+            loop, thread, session = self._loop, self._thread, self._session
+            self._loop, self._thread, self._session = None, None, None
+            self._limiters = {}
+
+        if loop is None:
+            return
+        if session is not None:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        logger.info("HTTP client closed")
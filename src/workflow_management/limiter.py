@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+from .request_policy import LatencyWindow
+
+
+class TokenBucket:
+    """Spaces requests out to rate per second on average, letting up to burst of them through at once."""
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else 1.0)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def take(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # A token is reserved right away, so concurrent callers queue up behind each other
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class ConcurrencyLimiter:
+    """Cap on the requests in flight to one host, shared by every task sending to it, as `async with limiter:`.
+
+    The cap is max_limit unless adaptive, in which case it follows AIMD: it starts at
+    initial_limit and, after a full limit's worth of requests answered in time, doubles until
+    the first decrease and grows by one afterwards. A throttled, failed or timed out request,
+    or recent latencies above latency_tolerance times the usual (median) latency, multiply it
+    by backoff_ratio, down to min_limit. The requests in flight at a decrease were sent under
+    the old limit, so there is at most one decrease per round trip. With rate set, requests
+    also take a token from a TokenBucket before taking a slot.
+
+    Must be used from a single event loop.
+    """
+    def __init__(self, max_limit: int = 100, adaptive: bool = False, min_limit: int = 1, initial_limit: int = 10, backoff_ratio: float = 0.5,
+                 latency_tolerance: float = 2.0, rate: Optional[float] = None, burst: Optional[float] = None):
+        self.max_limit = max_limit
+        self.adaptive = adaptive
+        self.min_limit = max(1, min(min_limit, max_limit))
+        self.limit = float(max(self.min_limit, min(initial_limit, max_limit)) if adaptive else max_limit)
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.in_flight = 0
+        self.decreases = 0
+        self._slow_start = True
+        self._answered_in_time = 0
+        self._usual_latency = LatencyWindow(0.5)
+        self._recent_latency = None
+        self._last_decrease = float("-inf")
+        self._waiters = deque()
+
+    async def acquire(self) -> None:
+        if self.bucket is not None:
+            await self.bucket.take()
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # A slot handed to a cancelled waiter goes to the next one
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    async def __aenter__(self) -> "ConcurrencyLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    def _wake(self) -> None:
+        free_slots = int(self.limit) - self.in_flight
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+    def observe(self, latency: float, overloaded: bool = False) -> None:
+        """Adjusts an adaptive limit to the outcome of one request: its latency and whether the host was overloaded."""
+        if not self.adaptive:
+            return
+        if not overloaded:
+            self._usual_latency.add(latency)
+            self._recent_latency = latency if self._recent_latency is None else 0.9 * self._recent_latency + 0.1 * latency
+        usual_latency = self._usual_latency.value()
+        if overloaded or (usual_latency is not None and self._recent_latency > self.latency_tolerance * usual_latency):
+            now = time.monotonic()
+            if now - self._last_decrease >= (self._recent_latency or latency):
+                self._last_decrease = now
+                self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                self.decreases += 1
+                self._slow_start = False
+                self._answered_in_time = 0
+            return
+        self._answered_in_time += 1
+        if self._answered_in_time >= self.limit:
+            self._answered_in_time = 0
+            self.limit = min(float(self.max_limit), self.limit * 2 if self._slow_start else self.limit + 1)
+            self._wake()
@@ -0,0 +1,106 @@
+import math
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+class LatencyHistogram:
+    """Durations counted in logarithmic buckets, each growth times wider than the one before.
+
+    Recording is O(1) and memory is fixed, so every request of a run can be recorded.
+    Percentiles are read off the bucket upper bounds, so they overestimate by less than
+    growth - 1 (10% by default).
+    """
+    def __init__(self, min_value: float = 1e-6, max_value: float = 1e4, growth: float = 1.1):
+        self.min_value = min_value
+        self.log_growth = math.log(growth)
+        self.counts = [0] * (int(math.log(max_value / min_value) / self.log_growth) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        index = 0 if value <= self.min_value else min(len(self.counts) - 1, int(math.log(value / self.min_value) / self.log_growth) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Adds the durations of a histogram with the same buckets."""
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(quantile * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.max, self.min_value * math.exp(index * self.log_growth))
+        return self.max
+
+    def get_stats(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max if self.count else None
+        }
+
+
+class RequestStats:
+    """Per-request figures of a RequestTask: latency, wait for a concurrency slot, payload sizes and outcomes."""
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.outcomes = Counter()
+
+    def merge(self, other: "RequestStats") -> None:
+        self.latency.merge(other.latency)
+        self.queue_wait.merge(other.queue_wait)
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+        self.outcomes.update(other.outcomes)
+
+    def get_stats(self) -> Dict:
+        return {
+            "latency (sec)": self.latency.get_stats(),
+            "queue_wait (sec)": self.queue_wait.get_stats(),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "status_codes": dict(sorted(self.outcomes.items()))
+        }
+
+
+def chrome_trace(task_timings: Dict[str, Dict], task_args: Optional[Dict[str, Dict]] = None) -> Dict:
+    """Chrome/Perfetto trace of a run, with one slice per task on the thread it ran on.
+
+    The time a task spent ready but waiting for a worker is drawn as a separate async
+    slice so that it does not overlap the slices of the thread that ran it.
+    """
+    task_args = task_args or {}
+    events: List[Dict] = []
+    thread_ids = {}
+    for event_id, (task_name, timing) in enumerate(task_timings.items()):
+        if "start" not in timing:
+            continue
+        if timing["thread"] not in thread_ids:
+            thread_ids[timing["thread"]] = len(thread_ids) + 1
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": thread_ids[timing["thread"]], "args": {"name": timing["thread"]}})
+        end = timing.get("end", timing["start"])
+        events.append({
+            "name": task_name, "cat": "task", "ph": "X", "pid": 1, "tid": thread_ids[timing["thread"]],
+            "ts": timing["start"] * 1e6, "dur": (end - timing["start"]) * 1e6, "args": task_args.get(task_name, {})
+        })
+        if timing.get("ready") is not None and timing["start"] > timing["ready"]:
+            events.append({"name": task_name, "cat": "wait", "ph": "b", "pid": 1, "id": event_id, "ts": timing["ready"] * 1e6})
+            events.append({"name": task_name, "cat": "wait", "ph": "e", "pid": 1, "id": event_id, "ts": timing["start"] * 1e6})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from typing import Any, Callable, List, Optional, Tuple
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+_SHARED_MEMORY_DIR = "/dev/shm"
+
+class _IPCHandle:
+    """Picklable reference to a DataFrame or Series written as an uncompressed Arrow IPC file."""
+    def __init__(self, path: str, is_series: bool):
+        self.path = path
+        self.is_series = is_series
+
+def _encode(value: Any, directory: str) -> Any:
+    if isinstance(value, (pl.DataFrame, pl.Series)):
+        is_series = isinstance(value, pl.Series)
+        path = os.path.join(directory, f"{uuid.uuid4().hex}.arrow")
+        (value.to_frame() if is_series else value).write_ipc(path)
+        return _IPCHandle(path, is_series)
+    return value
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, _IPCHandle):
+        # Memory mapping hands over the buffers without copying; the mapping outlives the file's removal
+        frame = pl.read_ipc(value.path, memory_map=True)
+        os.remove(value.path)
+        return frame.to_series() if value.is_series else frame
+    return value
+
+def _run_in_child(func: Callable, encoded_arguments: List, directory: str) -> Tuple[Any, int, int]:
+    result, item_count, failure_count = func(*[_decode(argument) for argument in encoded_arguments])
+    return _encode(result, directory), item_count, failure_count
+
+class ProcessRunner:
+    """Runs task functions in a pool of worker processes, out of reach of the parent's GIL.
+
+    Polars DataFrames and Series cross the process boundary as Arrow IPC files, in shared memory
+    where available, that the other side memory-maps instead of unpickling.
+    """
+    def __init__(self, max_workers: Optional[int] = None, directory: Optional[str] = None):
+        self.max_workers = max_workers
+        self.directory = directory or (_SHARED_MEMORY_DIR if os.path.isdir(_SHARED_MEMORY_DIR) else tempfile.gettempdir())
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def run(self, func: Callable, dependency_results: List) -> Tuple[Any, int, int]:
+        with self._lock:
+            if self._pool is None:
+                # Workers are spawned rather than forked since the parent runs other threads, such as the HTTP client loop
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+        encoded_arguments = [_encode(result, self.directory) for result in dependency_results]
+        try:
+            result, item_count, failure_count = self._pool.submit(_run_in_child, func, encoded_arguments, self.directory).result()
+        finally:
+            for argument in encoded_arguments:
+                if isinstance(argument, _IPCHandle) and os.path.exists(argument.path):
+                    os.remove(argument.path)
+        return _decode(result), item_count, failure_count
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,128 @@
+import cProfile
+import os
+import platform
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MEGABYTE = 1024 * 1024
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False
+# The profilers' own allocations are left out of the top allocations
+_PROFILER_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__), tracemalloc.Filter(False, pstats.__file__)]
+
+
+def peak_rss() -> Optional[int]:
+    """Largest resident set size of this process so far, in bytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def _megabytes(byte_count: Optional[int]) -> Optional[float]:
+    return None if byte_count is None else round(byte_count / MEGABYTE, 3)
+
+
+class TaskProfile:
+    """CPU and memory profile of one task run, taken while used as a context manager.
+
+    cpu profiles the calling thread with cProfile, so work a task hands to other threads or
+    processes only shows as waiting. memory traces Python allocations with tracemalloc, which
+    is started for as long as any profile needs it; its figures, like the peak RSS, are those
+    of the whole process, so they include tasks running at the same time. Allocations made
+    by native libraries such as Polars only show in the RSS. top is the number of functions
+    and allocation sites reported.
+    """
+    def __init__(self, cpu: bool = True, memory: bool = True, top: int = 10):
+        self.profiler = cProfile.Profile() if cpu else None
+        self.memory = memory
+        self.top = top
+        self.path = None
+        self.stats = {}
+        self._start_snapshot = None
+
+    def __enter__(self) -> "TaskProfile":
+        self._start_rss = peak_rss()
+        self._start_cpu_time = time.thread_time()
+        if self.memory:
+            self._start_tracing()
+            self._start_snapshot = tracemalloc.take_snapshot().filter_traces(_PROFILER_FILTERS)
+            self._start_traced = tracemalloc.get_traced_memory()[0]
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.stats = {"cpu_time (sec)": time.thread_time() - self._start_cpu_time}
+        end_rss = peak_rss()
+        if end_rss is not None:
+            self.stats.update({"peak_rss (MB)": _megabytes(end_rss), "peak_rss_increase (MB)": _megabytes(end_rss - self._start_rss)})
+        if self.memory:
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            end_snapshot = tracemalloc.take_snapshot().filter_traces(_PROFILER_FILTERS)
+            top_allocations = end_snapshot.compare_to(self._start_snapshot, "lineno")[:self.top]
+            self._start_snapshot = None
+            self._stop_tracing()
+            self.stats.update({
+                "traced_net (MB)": _megabytes(traced - self._start_traced),
+                "traced_peak (MB)": _megabytes(max(0, traced_peak - self._start_traced)),
+                "top_allocations": [
+                    {"location": str(allocation.traceback), "size (MB)": _megabytes(allocation.size_diff), "count": allocation.count_diff}
+                    for allocation in top_allocations if allocation.size_diff > 0
+                ]
+            })
+        if self.profiler is not None:
+            self.stats["top_functions"] = self.top_functions()
+
+    def _start_tracing(self) -> None:
+        global _tracemalloc_users, _tracemalloc_started
+        with _tracemalloc_lock:
+            if _tracemalloc_users == 0:
+                _tracemalloc_started = not tracemalloc.is_tracing()
+                if _tracemalloc_started:
+                    tracemalloc.start()
+                # Only the first of overlapping profiles resets the peak, so the others get an upper bound of theirs
+                tracemalloc.reset_peak()
+            _tracemalloc_users += 1
+
+    @staticmethod
+    def _stop_tracing() -> None:
+        global _tracemalloc_users
+        with _tracemalloc_lock:
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0 and _tracemalloc_started:
+                tracemalloc.stop()
+
+    def top_functions(self) -> List[Dict]:
+        """Functions with the most time spent in their own code."""
+        entries = sorted(pstats.Stats(self.profiler).stats.items(), key=lambda entry: entry[1][2], reverse=True)[:self.top]
+        return [
+            {"function": f"{file_name}:{line}({function})", "calls": call_count, "self_time (sec)": self_time, "cumulative_time (sec)": cumulative_time}
+            for (file_name, line, function), (_, call_count, self_time, cumulative_time, _) in entries
+        ]
+
+    def dump(self, directory: str, task_name: str) -> Optional[str]:
+        """Writes the CPU profile as a pstats file named after the task, readable with pstats or snakeviz."""
+        if self.profiler is None:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', task_name)}.prof")
+        self.profiler.dump_stats(self.path)
+        return self.path
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "cpu_profile": self.path} if self.path else dict(self.stats)
@@ -0,0 +1,73 @@
+import asyncio
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+import aiohttp
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass
+class RequestPolicy:
+    """Timeouts, retries and hedging applied to every request of a RequestTask.
+
+    timeout bounds a single attempt and deadline bounds one execution of the task, so no
+    request outlives it. A streamed execution shares one deadline across its micro-batches,
+    counted from the start of the stream, as do the partitions of a MapTask run. Failed
+    attempts are retried up to max_retries times after a full-jitter backoff of up to
+    backoff_base * 2**attempt seconds (capped at backoff_max).
+    With hedge_quantile set, a duplicate request is sent once an attempt has been pending
+    longer than that quantile of the observed latencies, and the first answer wins.
+    adaptive_concurrency lets the task's ConcurrencyLimiter lower its cap on requests in flight
+    (down to min_concurrency) while the host struggles and raise it again as it recovers.
+    rate_limit caps the requests per second, in bursts of up to rate_burst.
+    """
+    timeout: Optional[float] = None
+    deadline: Optional[float] = None
+    max_retries: int = 0
+    backoff_base: float = 0.1
+    backoff_max: float = 2.0
+    hedge_quantile: Optional[float] = None
+    hedge_min_samples: int = 20
+    adaptive_concurrency: bool = False
+    min_concurrency: int = 1
+    rate_limit: Optional[float] = None
+    rate_burst: Optional[float] = None
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, connection failures, throttling and server errors are worth another attempt."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRYABLE_STATUSES
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+
+class LatencyWindow:
+    """Quantile of the most recent request latencies, recomputed every few samples."""
+    def __init__(self, quantile: float, min_samples: int = 20, size: int = 1000, refresh_every: int = 50):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self.samples = deque(maxlen=size)
+        self._new_samples = 0
+        self._value = None
+
+    def add(self, latency: float) -> None:
+        self.samples.append(latency)
+        self._new_samples += 1
+        if self._value is None or self._new_samples >= self.refresh_every:
+            self._refresh()
+
+    def value(self) -> Optional[float]:
+        return self._value
+
+    def _refresh(self) -> None:
+        self._new_samples = 0
+        if len(self.samples) < self.min_samples:
+            return
+        ordered = sorted(self.samples)
+        self._value = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
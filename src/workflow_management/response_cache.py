@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_MISS = object()
+
+class ResponseCache:
+    """Endpoint response cache: an in-memory LRU in front of an optional SQLite store on disk.
+
+    Entries are keyed by endpoint and a canonical hash of the request body, expire after ttl
+    seconds and are evicted oldest first once a level holds more than its maximum entry count.
+    """
+    def __init__(self, max_memory_entries: int = 100000, disk_path: Optional[str] = None, max_disk_entries: int = 10000000, ttl: Optional[float] = None):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._disk_entry_count = 0
+
+        if disk_path:
+            self._connection = sqlite3.connect(disk_path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+            self._disk_entry_count = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(endpoint: str, body: Any) -> str:
+        if not isinstance(body, bytes):
+            body = json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+        return hashlib.sha256(endpoint.encode() + b"\n" + body).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """Returns the cached value or CACHE_MISS."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if not self._expired(stored_at, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._connection is not None:
+                row = self._connection.execute("SELECT value, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return CACHE_MISS
+
+    def put(self, key: str, value: Any) -> None:
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, value, stored_at)
+            if self._connection is not None:
+                # The rowcount of an upsert is 1 for updates too, so only keys not stored yet add to the count
+                stored = self._connection.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+                self._connection.execute(
+                    "INSERT INTO responses (key, value, stored_at) VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value, stored_at = excluded.stored_at",
+                    (key, json.dumps(value), stored_at)
+                )
+                self._disk_entry_count += not stored
+                if self._disk_entry_count > self.max_disk_entries:
+                    self._evict_from_disk()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                if self.ttl is not None:
+                    expired = self._connection.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,)).rowcount
+                    self._disk_entry_count -= expired
+                    self.evictions += expired
+                self._connection.commit()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_entry_count
+        }
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _remember(self, key: str, value: Any, stored_at: float) -> None:
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_from_disk(self) -> None:
+        # Evict a tenth of the store at once so that inserts past the limit don't each pay for a delete
+        excess = self._disk_entry_count - self.max_disk_entries + max(1, self.max_disk_entries // 10)
+        evicted = self._connection.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY stored_at LIMIT ?)", (excess,)
+        ).rowcount
+        self._disk_entry_count -= evicted
+        self.evictions += evicted
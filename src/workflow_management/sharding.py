@@ -0,0 +1,368 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+import polars as pl
+from .config import OfferWorkFlowConfig
+from .task import Task
+from .workflow import IWorkFlow
+
+from src.user_functions.offer_workflow_functions import read_result, write_result
+
+logger = logging.getLogger(__name__)
+
+SHARD_KEY = "memberId"
+SHARD_MANIFEST = "manifest.json"
+_CLAIM_FILE = "claim"
+_DONE_FILE = "done.json"
+_FAILED_FILE = "failed.json"
+_RESULT_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "ipc": ".arrow"}
+
+
+def shard_path(shard_dir: str, shard: int, file_name: str = "") -> str:
+    return os.path.join(shard_dir, f"shard-{shard:04d}", file_name)
+
+
+def partition_csv(file_path: str, shard_count: int, shard_dir: str, batch_size: int = 500000) -> List[int]:
+    """Splits a CSV into shard_count CSVs by the hash of their memberId and returns the row count of each.
+
+    The input is read in batches with every column as text, so rows are copied unchanged and
+    every row of a member lands in the same shard. Every shard file gets a header, even if empty.
+    """
+    header = pl.read_csv(file_path, n_rows=0, infer_schema_length=0)
+    row_counts = [0] * shard_count
+    files = []
+    try:
+        for shard in range(shard_count):
+            os.makedirs(shard_path(shard_dir, shard), exist_ok=True)
+            files.append(open(shard_path(shard_dir, shard, "input.csv"), "wb"))
+            header.write_csv(files[-1])
+
+        reader = pl.read_csv_batched(file_path, infer_schema_length=0, batch_size=batch_size)
+        while (batches := reader.next_batches(1)):
+            batch = batches[0].with_columns((pl.col(SHARD_KEY).hash(seed=0) % shard_count).alias("__shard"))
+            for (shard,), rows in batch.partition_by("__shard", as_dict=True, include_key=False).items():
+                rows.write_csv(files[shard], include_header=False)
+                row_counts[shard] += rows.height
+    finally:
+        for f in files:
+            f.close()
+    return row_counts
+
+
+def shard_config(config: OfferWorkFlowConfig, shard_dir: str, shard: int) -> OfferWorkFlowConfig:
+    """Config of one shard: its own input, outputs, checkpoints and disk cache, all inside its shard directory."""
+    suffix = f"shard-{shard:04d}"
+    response_cache_path = None
+    if config.response_cache_path:
+        root, extension = os.path.splitext(config.response_cache_path)
+        response_cache_path = f"{root}.{suffix}{extension}"
+    return replace(
+        config,
+        name=f"{config.name} [{suffix}]",
+        csv_path=shard_path(shard_dir, shard, "input.csv"),
+        result_output_path=shard_path(shard_dir, shard, f"result{_RESULT_EXTENSIONS[config.result_output_format]}"),
+        performance_output_path=shard_path(shard_dir, shard, "performance.json"),
+        trace_output_path=None,
+        failures_output_path=None,
+        checkpoint_dir=os.path.join(config.checkpoint_dir, suffix) if config.checkpoint_dir else None,
+        response_cache_path=response_cache_path,
+        shard_count=1,
+        shard_dir=None,
+        shard_workers=None
+    )
+
+
+def _write_json(path: str, data: Dict) -> None:
+    # Written aside and renamed so that readers on other hosts never see a partial file
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(temp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _is_finished(shard_dir: str, shard: int) -> bool:
+    return os.path.exists(shard_path(shard_dir, shard, _DONE_FILE)) or os.path.exists(shard_path(shard_dir, shard, _FAILED_FILE))
+
+
+def _claim(shard_dir: str, shard: int, stale_after: float) -> bool:
+    """Claims a shard by creating its claim file, taking over claims whose heartbeat stopped stale_after seconds ago."""
+    claim_path = shard_path(shard_dir, shard, _CLAIM_FILE)
+    try:
+        if time.time() - os.path.getmtime(claim_path) > stale_after and not _is_finished(shard_dir, shard):
+            # Only one of the workers taking over the claim wins the rename
+            os.rename(claim_path, f"{claim_path}.stale-{uuid.uuid4().hex}")
+            logger.warning(f"Shard {shard} was claimed by a worker that stopped responding, claiming it again")
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        json.dump({"host": socket.gethostname(), "pid": os.getpid()}, f)
+    return True
+
+
+def _heartbeat(claim_path: str, interval: float, stop_event: threading.Event) -> None:
+    while not stop_event.wait(interval):
+        try:
+            os.utime(claim_path)
+        except FileNotFoundError:
+            return
+
+
+def _run_shard(shard_dir: str, shard: int, stale_after: float) -> None:
+    # Imported here since the factory imports this module
+    from .workflow_factory import WorkFlowFactory
+
+    stop_event = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(shard_path(shard_dir, shard, _CLAIM_FILE), stale_after / 4, stop_event), daemon=True)
+    heartbeat.start()
+    outcome = {"host": socket.gethostname(), "pid": os.getpid()}
+    try:
+        logger.info(f"Running shard {shard} of {shard_dir}")
+        workflow = WorkFlowFactory.create_workflow("OfferWorkFlow", shard_path(shard_dir, shard, "config.json"))
+        workflow.start()
+        if not os.path.exists(workflow.config.result_output_path):
+            # Failed tasks are logged rather than raised, but a shard without results can't be merged
+            raise RuntimeError(f"Shard {shard} wrote no results, see the task errors above")
+        _write_json(shard_path(shard_dir, shard, _DONE_FILE), outcome)
+    except Exception as e:
+        logger.error(f"Shard {shard} of {shard_dir} failed: {e}", exc_info=True)
+        _write_json(shard_path(shard_dir, shard, _FAILED_FILE), {**outcome, "error": repr(e)})
+    finally:
+        stop_event.set()
+        heartbeat.join()
+
+
+def run_shard_worker(shard_dir: str, poll_interval: float = 1.0, stale_after: Optional[float] = None) -> int:
+    """Runs shards of a sharded run one at a time until all of them are finished, and returns how many it ran.
+
+    Workers share nothing but shard_dir, so they may run on any host that mounts it. They
+    wait for the coordinator's manifest, then claim unfinished shards through claim files.
+    """
+    while (manifest := _read_json(os.path.join(shard_dir, SHARD_MANIFEST))) is None:
+        time.sleep(poll_interval)
+    stale_after = stale_after or manifest["stale_after"]
+    shard_count = manifest["shard_count"]
+
+    run_count = 0
+    while True:
+        unfinished = [shard for shard in range(shard_count) if not _is_finished(shard_dir, shard)]
+        if not unfinished:
+            return run_count
+        claimed = next((shard for shard in unfinished if _claim(shard_dir, shard, stale_after)), None)
+        if claimed is None:
+            # The remaining shards are running elsewhere, keep watching in case a worker dies
+            time.sleep(poll_interval)
+            continue
+        _run_shard(shard_dir, claimed, stale_after)
+        run_count += 1
+
+
+def merge_results(result_files: List[str], output_file: str, file_format: str = "csv") -> None:
+    """Concatenates per-shard result files, which hold disjoint members, into one."""
+    if file_format == "csv":
+        # Shards share a header, so the files are appended as they are, less the header of all but the first
+        with open(output_file, "wb") as output:
+            for index, result_file in enumerate(result_files):
+                with open(result_file, "rb") as f:
+                    if index:
+                        f.readline()
+                    shutil.copyfileobj(f, output)
+        return
+    results = [read_result(result_file, file_format) for result_file in result_files]
+    write_result(pl.concat([result for result in results if result.height] or results[:1], how="vertical_relaxed"), output_file, file_format)
+
+
+def _sum_counts(values: List[Dict]) -> Dict:
+    """Sums the counts found in per-shard metrics. Distributions, such as latency percentiles, do not add up and are left out."""
+    merged = {}
+    for key in values[0]:
+        shard_values = [value.get(key) for value in values]
+        if all(isinstance(value, int) and not isinstance(value, bool) for value in shard_values):
+            merged[key] = sum(shard_values)
+        elif all(isinstance(value, dict) and all(isinstance(count, int) for count in value.values()) for value in shard_values):
+            merged[key] = dict(sum((Counter(value) for value in shard_values), Counter()))
+        elif all(isinstance(value, dict) and not any(isinstance(item, float) for item in value.values()) for value in shard_values):
+            merged[key] = _sum_counts(shard_values)
+    return merged
+
+
+def merge_summaries(summaries: List[Dict]) -> Dict:
+    """Summary of a sharded run from those of its shards.
+
+    Shards run side by side, so a task took as long as its slowest shard and its throughput
+    is that of all shards together. Counts are summed, and the shard summaries are kept whole.
+    """
+    tasks = {}
+    for task_name in summaries[0]["tasks"]:
+        shard_tasks = [summary["tasks"][task_name] for summary in summaries]
+        execution_time = max(task["execution_time (sec)"] for task in shard_tasks)
+        processed_item_count = sum(task["processed_item_count"] for task in shard_tasks)
+        item_failure_count = sum(task["item_failure_count"] for task in shard_tasks)
+        tasks[task_name] = {
+            "status": "Success" if item_failure_count == 0 and processed_item_count != 0 else "Failed",
+            "execution_time (sec)": execution_time,
+            "processed_item_count": processed_item_count,
+            "item_failure_count": item_failure_count,
+            "throughput (item/sec)": processed_item_count / execution_time if execution_time else 0
+        }
+        if all("wait_time (sec)" in task for task in shard_tasks):
+            tasks[task_name]["wait_time (sec)"] = max(task["wait_time (sec)"] for task in shard_tasks)
+        tasks[task_name].update(_sum_counts([{key: value for key, value in task.items() if key not in tasks[task_name]} for task in shard_tasks]))
+
+    merged = {"tasks": tasks}
+    if all("response_cache" in summary for summary in summaries):
+        merged["response_cache"] = _sum_counts([summary["response_cache"] for summary in summaries])
+    if all("row_failures" in summary for summary in summaries):
+        errors = {}
+        for summary in summaries:
+            for task_name, counts in summary["row_failures"]["errors"].items():
+                errors[task_name] = dict(Counter(errors.get(task_name, {})) + Counter(counts))
+        merged["row_failures"] = {"failed_rows": sum(summary["row_failures"]["failed_rows"] for summary in summaries), "errors": errors}
+    return merged
+
+
+def merge_traces(traces: Dict[int, Dict]) -> Dict:
+    """One trace with a process per shard, from the traces of each shard by shard number."""
+    events = []
+    for shard, trace in traces.items():
+        events.append({"name": "process_name", "ph": "M", "pid": shard + 1, "args": {"name": f"shard-{shard:04d}"}})
+        events.extend({**event, "pid": shard + 1} for event in trace["traceEvents"])
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class ShardedWorkFlow(IWorkFlow):
+    """OfferWorkFlow over shards of the input split by memberId, run by separate processes or hosts.
+
+    Members are scored independently, so each shard is a complete OfferWorkFlow run whose
+    results are concatenated at the end. The coordinator partitions the input into shard_dir
+    and starts shard_workers local worker processes; with none, it waits for workers started
+    on other hosts with `python -m src.run_workflow --shard-worker <shard_dir>`.
+    """
+    def __init__(self, config: OfferWorkFlowConfig):
+        if config.incremental_state_dir:
+            raise ValueError("Incremental runs can't be sharded, since shards are partitioned anew on each run")
+        self.config = config
+        self.shard_dir = config.shard_dir or f"{os.path.splitext(config.result_output_path)[0]}.shards"
+        self.row_counts: List[int] = []
+        self.shards: List[int] = []
+        self.summary = None
+        self.phase_times: Dict[str, float] = {}
+
+    def add_task(self, task: Task) -> None:
+        raise NotImplementedError("The tasks of a sharded workflow are those of the OfferWorkFlow run on each shard")
+
+    def prepare(self) -> None:
+        """Partitions the input and writes the config of every shard, then the manifest that lets workers start."""
+        for entry in os.listdir(self.shard_dir) if os.path.isdir(self.shard_dir) else []:
+            if entry.startswith("shard-") or entry == SHARD_MANIFEST:
+                path = os.path.join(self.shard_dir, entry)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        self.row_counts = partition_csv(self.config.csv_path, self.config.shard_count, self.shard_dir)
+        # Shards without rows are not run, unless all are empty, so that an empty input behaves as it does unsharded
+        self.shards = [shard for shard, row_count in enumerate(self.row_counts) if row_count] or [0]
+        for shard in range(self.config.shard_count):
+            if shard in self.shards:
+                _write_json(shard_path(self.shard_dir, shard, "config.json"), asdict(shard_config(self.config, self.shard_dir, shard)))
+            else:
+                _write_json(shard_path(self.shard_dir, shard, _DONE_FILE), {"skipped": "no rows"})
+        _write_json(os.path.join(self.shard_dir, SHARD_MANIFEST), {
+            "name": self.config.name,
+            "shard_count": self.config.shard_count,
+            "row_counts": self.row_counts,
+            "stale_after": self.config.shard_stale_after
+        })
+
+    def run_shards(self) -> None:
+        worker_count = min(self.config.shard_count, self.config.shard_count if self.config.shard_workers is None else self.config.shard_workers)
+        if worker_count:
+            with ProcessPoolExecutor(max_workers=worker_count, mp_context=multiprocessing.get_context("spawn")) as executor:
+                for future in [executor.submit(run_shard_worker, self.shard_dir) for _ in range(worker_count)]:
+                    future.result()
+        else:
+            logger.info(f"Waiting for workers, start them with: python -m src.run_workflow --shard-worker {self.shard_dir}")
+        while not all(_is_finished(self.shard_dir, shard) for shard in range(self.config.shard_count)):
+            time.sleep(1.0)
+
+        failures = {shard: failure["error"] for shard in range(self.config.shard_count)
+                    if (failure := _read_json(shard_path(self.shard_dir, shard, _FAILED_FILE))) is not None}
+        if failures:
+            raise RuntimeError(f"Shards of workflow {self.config.name} failed: {failures}")
+
+    def merge(self) -> None:
+        shard_configs = [shard_config(self.config, self.shard_dir, shard) for shard in self.shards]
+        merge_results([config.result_output_path for config in shard_configs], self.config.result_output_path, self.config.result_output_format)
+        # The ledgers share a header too, so a repair run of the whole input can read them as one
+        failure_files = [config.failures_path for config in shard_configs if os.path.exists(config.failures_path)]
+        if failure_files:
+            merge_results(failure_files, self.config.failures_path)
+
+        summaries = [_read_json(config.performance_output_path) for config in shard_configs]
+        self.summary = merge_summaries(summaries)
+        self.traces = {shard: _read_json(f"{os.path.splitext(config.performance_output_path)[0]}.trace.json") for shard, config in zip(self.shards, shard_configs)}
+        self.shard_summaries = [
+            {"shard": shard, "input_row_count": self.row_counts[shard], **_read_json(shard_path(self.shard_dir, shard, _DONE_FILE)), **summary}
+            for shard, summary in zip(self.shards, summaries)
+        ]
+
+    def get_summary(self) -> Dict:
+        return {
+            "name": self.config.name,
+            "description": self.config.description,
+            "shard_count": self.config.shard_count,
+            "skipped_shard_count": self.config.shard_count - len(self.shards),
+            **self.summary,
+            **self.phase_times,
+            "UTC_time_of_completion": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            "shards": self.shard_summaries
+        }
+
+    def save_summary(self) -> None:
+        with open(self.config.performance_output_path, "w") as f:
+            json.dump(self.get_summary(), f, indent=4)
+
+        trace_output_path = self.config.trace_output_path or f"{os.path.splitext(self.config.performance_output_path)[0]}.trace.json"
+        with open(trace_output_path, "w") as f:
+            json.dump(merge_traces(self.traces), f)
+
+        logger.info(f"Workflow {self.config.name} saved a summary successfully")
+
+    def start(self) -> None:
+        start_time = time.perf_counter()
+        self.prepare()
+        partitioned_time = time.perf_counter()
+        self.run_shards()
+        run_time = time.perf_counter()
+        self.merge()
+        end_time = time.perf_counter()
+        logger.info(f"Workflow {self.config.name} completed successfully over {self.config.shard_count} shards")
+
+        self.phase_times = {
+            "partition_time (sec)": partitioned_time - start_time,
+            "shard_run_time (sec)": run_time - partitioned_time,
+            "merge_time (sec)": end_time - run_time,
+            "total_execution_time (sec)": end_time - start_time
+        }
+        self.save_summary()
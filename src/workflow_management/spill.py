@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import Any, Optional
+import polars as pl
+
+
+def result_size(result: Any) -> int:
+    """Estimated bytes held by a task result. Only DataFrames and Series are counted, since only they can be spilled."""
+    if isinstance(result, (pl.DataFrame, pl.Series)):
+        return result.estimated_size()
+    return 0
+
+
+class SpilledResult:
+    """A DataFrame or Series result moved out of memory into an uncompressed Arrow IPC file."""
+    def __init__(self, path: str, is_series: bool, size: int):
+        self.path = path
+        self.is_series = is_series
+        self.size = size
+
+    def load(self) -> Any:
+        # The file is memory-mapped, so the operating system pages the buffers in as they are
+        # read and can drop them again under memory pressure
+        frame = pl.read_ipc(self.path, memory_map=True)
+        return frame.to_series() if self.is_series else frame
+
+    def remove(self) -> None:
+        # Frames already loaded keep their mapping after the file is gone
+        os.remove(self.path)
+
+
+class SpillStore:
+    """Directory of spilled task results, created in directory (the system temp dir by default) on first use.
+
+    The directory and whatever is left in it are removed on close.
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.path = None
+        self._lock = threading.Lock()
+
+    def spill(self, result: Any) -> SpilledResult:
+        with self._lock:
+            if self.path is None:
+                if self.directory:
+                    os.makedirs(self.directory, exist_ok=True)
+                self.path = tempfile.mkdtemp(prefix="spill-", dir=self.directory)
+        is_series = isinstance(result, pl.Series)
+        path = os.path.join(self.path, f"{uuid.uuid4().hex}.arrow")
+        # Consumers may be reading the result on other threads while writing borrows it mutably, so a
+        # shallow clone, sharing its buffers, is written instead
+        (result.to_frame() if is_series else result.clone()).write_ipc(path)
+        return SpilledResult(path, is_series, result_size(result))
+
+    def close(self) -> None:
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+    def __enter__(self) -> "SpillStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
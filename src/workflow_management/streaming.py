@@ -0,0 +1,71 @@
+import itertools
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+import polars as pl
+
+_END_OF_STREAM = object()
+_POLL_INTERVAL = 0.1
+
+class StreamAborted(Exception):
+    """Raised inside a streaming task when another task of the run failed."""
+
+class Channel:
+    """Bounded FIFO of micro-batches between a producer task and one consumer task.
+
+    put() blocks while the channel is full, which applies backpressure to the producer.
+    A capacity of 0 makes the channel unbounded.
+    """
+    def __init__(self, capacity: int, abort_event: threading.Event):
+        self._queue = queue.Queue(maxsize=capacity)
+        self._abort_event = abort_event
+
+    def put(self, batch: Any) -> None:
+        while True:
+            if self._abort_event.is_set():
+                raise StreamAborted()
+            try:
+                self._queue.put(batch, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> None:
+        self.put(_END_OF_STREAM)
+
+    def __iter__(self) -> Iterator:
+        while True:
+            try:
+                batch = self._queue.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if self._abort_event.is_set():
+                    raise StreamAborted()
+                continue
+            if batch is _END_OF_STREAM:
+                return
+            yield batch
+
+def concat_batches(batches: List) -> Any:
+    if not batches:
+        return None
+    if len(batches) == 1:
+        return batches[0]
+    if isinstance(batches[0], (pl.DataFrame, pl.Series)):
+        return pl.concat(batches)
+    if isinstance(batches[0], list):
+        return list(itertools.chain.from_iterable(batches))
+    return batches[-1]
+
+def split_batches(result: Any, batch_size: int) -> Iterator:
+    if not isinstance(result, (pl.DataFrame, pl.Series, list)) or len(result) <= batch_size:
+        yield result
+        return
+    for offset in range(0, len(result), batch_size):
+        yield result[offset:offset + batch_size]
+
+def map_batches(func: Callable[..., Tuple[Any, int, int]]) -> Callable[..., Iterator[Tuple[Any, int, int]]]:
+    """Turns a function over whole results into a stream function applied to each aligned micro-batch."""
+    def stream_func(*dependency_streams: Iterable) -> Iterator[Tuple[Any, int, int]]:
+        for batches in zip(*dependency_streams):
+            yield func(*batches)
+    return stream_func
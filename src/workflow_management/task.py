@@ -1,33 +1,71 @@
 from abc import ABC, abstractmethod
+import itertools
+import json
 import logging
+import threading
 import time
 import asyncio
-from typing import List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import aiohttp
 import polars as pl
+from .checkpoint import describe
+from .failures import FailureLog, RowFailure
+from .http_client import HttpClient
+from .limiter import ConcurrencyLimiter
+from .metrics import RequestStats
+from .request_policy import LatencyWindow, RequestPolicy, is_retryable
+from .response_cache import CACHE_MISS, ResponseCache
+from .streaming import StreamAborted, concat_batches, map_batches, split_batches
 
 logger = logging.getLogger(__name__)
 
+# Rows with a null request field are not sent, since the row failed upstream
+_MISSING_INPUT = RowFailure("MissingInput", attempts=0)
+
+EXECUTORS = ("thread", "process", "inline")
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_NDJSON_HEADERS = {"Content-Type": "application/x-ndjson"}
+
+BATCH_FORMATS = ("json", "ndjson")
+
 class Task(ABC):
-    def __init__(self, name, func, dependencies=None):
+    def __init__(self, name, func, dependencies=None, stream_func: Optional[Callable[..., Iterator[Tuple[Any, int, int]]]] = None, executor: str = "thread",
+                 checkpoint: bool = True):
         self.name = name
         self.func = func
         self.dependencies = dependencies or []
+        self.stream_func = stream_func
+        self.executor = executor
+        # Tasks with effects outside their result, such as writing files, must run every time rather than be restored
+        self.checkpoint = checkpoint
+        self.process_runner = None
         self.result = None
         self.result_count = 0
         self.failure_count = 0
         self.execution_time = None
 
+    def get_metrics(self) -> Dict:
+        """Task specific figures added to the task's entry in the workflow summary."""
+        return {}
+
+    def fingerprint(self) -> str:
+        """Identity of the work this task does, used to key its checkpoints."""
+        return f"{type(self).__name__}({self.name!r}, {describe(self.func)}, {describe(self.dependencies)})"
+
     @abstractmethod
-    def execute(self, dependency_results) -> List:
-        raise NotImplementedError("execute() must be implemented")
+    def _run(self, dependency_results) -> Tuple[Any, int, int]:
+        raise NotImplementedError("_run() must be implemented")
+
+    def partition_runner(self) -> Callable[[List], Tuple[Any, int, int]]:
+        """Runs one partition of a MapTask run. Called once per run, so tasks set up what their partitions share here."""
+        return self._run
 
-class SyncTask(Task):
     def execute(self, dependency_results) -> List:
         start_time = time.time()
         try:
             logger.info(f"Executing task: {self.name}")
-            self.result, self.result_count, self.failure_count = self.func(*dependency_results)
+            self.result, self.result_count, self.failure_count = self._run(dependency_results)
             logger.info(f"Task {self.name} completed successfully")
         except Exception as e:
             logger.error(f"Task {self.name} failed with error: {e}")
@@ -35,47 +73,484 @@ class SyncTask(Task):
         finally:
             self.execution_time = time.time() - start_time
         return self.result
-    
-class AsyncTask(Task):
-    def execute(self, dependency_results) -> List:
+
+    def stream(self, dependency_streams: List[Iterable], batch_size: int) -> Iterator:
+        """Yields this task's result as micro-batches.
+
+        Tasks without a stream_func need their whole input, so every upstream batch is
+        collected first and the result is split into batches afterwards.
+        """
+        if self.stream_func is None:
+            dependency_results = [concat_batches(list(stream)) for stream in dependency_streams]
+            yield from split_batches(self.execute(dependency_results), batch_size)
+            return
+
         start_time = time.time()
+        self.result, self.result_count, self.failure_count = None, 0, 0
         try:
-            logger.info(f"Executing task: {self.name}")
-            self.result, self.result_count, self.failure_count = asyncio.run(self.func(*dependency_results))
+            logger.info(f"Streaming task: {self.name}")
+            for batch_result, item_count, failure_count in self.stream_func(*dependency_streams):
+                self.result_count += item_count
+                self.failure_count += failure_count
+                yield batch_result
             logger.info(f"Task {self.name} completed successfully")
+        except StreamAborted:
+            raise
         except Exception as e:
+            # Raised so that the run aborts: ending the stream quietly would truncate what its consumers zip it with
             logger.error(f"Task {self.name} failed with error: {e}")
-            self.result = None
+            raise
         finally:
             self.execution_time = time.time() - start_time
-        return self.result
+
+class SyncTask(Task):
+    def _run(self, dependency_results) -> Tuple[Any, int, int]:
+        if self.executor == "process" and self.process_runner is not None:
+            return self.process_runner.run(self.func, dependency_results)
+        return self.func(*dependency_results)
     
+class AsyncTask(Task):
+    def __init__(self, name, func, dependencies=None, stream_func=None, http_client: Optional[HttpClient] = None, executor: str = "thread"):
+        super().__init__(name, func, dependencies, stream_func, executor)
+        self.http_client = http_client
+
+    def _run(self, dependency_results) -> Tuple[Any, int, int]:
+        if self.http_client is not None:
+            return self.http_client.run(self.func(*dependency_results))
+        return asyncio.run(self.func(*dependency_results))
+    
+class _RequestRun:
+    """State of one run of a RequestTask, or of one partition of a MapTask run: the deadline and limiter its
+    requests go through, and its counts, which are added to the task's when it ends."""
+    COUNTERS = ("cache_hits", "cache_misses", "coalesced_requests", "retries", "timeouts", "hedged_requests", "hedge_wins")
+
+    def __init__(self, deadline_at: Optional[float], limiter: ConcurrencyLimiter):
+        self.deadline_at = deadline_at
+        self.limiter = limiter
+        self.request_stats = RequestStats()
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+
+    def attempt_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        """Timeout of an attempt starting now, cut short by the deadline."""
+        if self.deadline_at is None:
+            return timeout
+        remaining = self.deadline_at - time.monotonic()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def fits_deadline(self, delay: float) -> bool:
+        return self.deadline_at is None or time.monotonic() + delay < self.deadline_at
+
 class RequestTask(AsyncTask):
-    def __init__(self, name, api_url, max_concurrent_requests=100, dependencies=None):
-        super().__init__(name, self.network_task, dependencies)
+    def __init__(self, name, api_url, max_concurrent_requests=100, dependencies=None, http_client: Optional[HttpClient] = None, batch_size: Optional[int] = None,
+                 response_cache: Optional[ResponseCache] = None, request_fields: Optional[List[str]] = None, policy: Optional[RequestPolicy] = None,
+                 dtype: Optional[pl.DataType] = None, response_key: Optional[str] = None, batch_format: str = "json",
+                 failure_log: Optional[FailureLog] = None, skip_null_rows: bool = False):
+        if batch_format not in BATCH_FORMATS:
+            raise ValueError(f"Unknown batch format {batch_format} for task {name}, expected one of {BATCH_FORMATS}")
+        super().__init__(name, self.network_task, dependencies, stream_func=self._stream_batches, http_client=http_client)
         self.api_url = api_url
         self.max_concurrent_requests = max_concurrent_requests
+        self.batch_size = batch_size
+        # Batches are sent as a JSON array answered by one object, or as NDJSON answered by one line per row
+        self.ndjson_batches = bool(batch_size) and batch_format == "ndjson"
+        self.response_cache = response_cache
+        self.request_fields = request_fields
+        self.dtype = dtype
+        self.response_key = response_key
+        self._response_prefix = None if response_key is None else b"{" + json.dumps(response_key).encode() + b":"
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced_requests = 0
+        self.policy = policy or RequestPolicy()
+        self.latencies = LatencyWindow(self.policy.hedge_quantile, self.policy.hedge_min_samples) if self.policy.hedge_quantile else None
+        self.retries = 0
+        self.timeouts = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.request_stats = RequestStats()
+        self.limiter: Optional[ConcurrencyLimiter] = None
+        # Failed rows are recorded by the failure log's key field, or by their position in the input if it has none
+        self.failure_log = failure_log
+        self.skip_null_rows = skip_null_rows
+        self._counts_lock = threading.Lock()
+
+    def fingerprint(self) -> str:
+        return f"{super().fingerprint()}[{self.api_url!r}, {self.batch_size}, {describe(self.request_fields)}, {self.dtype}, {self.response_key!r}, {self.ndjson_batches}, {self.skip_null_rows}]"
+
+    def get_metrics(self) -> Dict:
+        metrics = {"requests": self.request_stats.get_stats()} if self.request_stats.outcomes else {}
+        if self.response_cache is not None:
+            metrics["cache"] = {"hits": self.cache_hits, "misses": self.cache_misses, "coalesced_requests": self.coalesced_requests}
+        if self.retries or self.timeouts or self.hedged_requests:
+            metrics.setdefault("requests", {}).update({"retries": self.retries, "timeouts": self.timeouts, "hedged": self.hedged_requests, "hedge_wins": self.hedge_wins})
+        if self.limiter is not None and self.limiter.adaptive:
+            metrics.setdefault("requests", {}).update({"concurrency_limit": int(self.limiter.limit), "limit_decreases": self.limiter.decreases})
+        return metrics
         
-    async def network_task(self,transformed_data) -> Tuple[List, int, int]:            
-        async with aiohttp.ClientSession() as session:
-            if isinstance(transformed_data, pl.DataFrame):
-                tasks = [self._post_data_with_semaphore(session, self.api_url, row, asyncio.Semaphore(value=self.max_concurrent_requests)) for row in transformed_data.iter_rows(named=True)]
+    def _run(self, dependency_results, deadline_at: Optional[float] = None) -> Tuple[Any, int, int]:
+        coroutine = self.network_task(*dependency_results, deadline_at=deadline_at)
+        if self.http_client is not None:
+            return self.http_client.run(coroutine)
+        return asyncio.run(coroutine)
+
+    def partition_runner(self) -> Callable[[List], Tuple[Any, int, int]]:
+        # Partitions share the deadline of the run rather than each getting a full one
+        deadline_at = self._new_deadline()
+        return lambda dependency_results: self._run(dependency_results, deadline_at)
+
+    def _stream_batches(self, *dependency_streams: Iterable) -> Iterator[Tuple[Any, int, int]]:
+        # The deadline starts with the stream and bounds all of its batches, as it bounds a whole run
+        deadline_at = self._new_deadline()
+        return map_batches(lambda *batches: self._run(batches, deadline_at))(*dependency_streams)
+
+    def _new_deadline(self) -> Optional[float]:
+        return None if self.policy.deadline is None else time.monotonic() + self.policy.deadline
+
+    async def network_task(self, transformed_data, deadline_at: Optional[float] = None) -> Tuple[Any, int, int]:
+        """Posts every row, within the policy's deadline from now, or by deadline_at, a time.monotonic() time."""
+        if deadline_at is None:
+            deadline_at = self._new_deadline()
+        if self.http_client is not None:
+            # Tasks sending to the same host share its limiter, which keeps what it learnt between runs
+            run = _RequestRun(deadline_at, self.http_client.limiter(self.api_url, self._create_limiter))
+        else:
+            # A limiter serves one event loop, so runs on loops of their own, like MapTask partitions, each get one
+            run = _RequestRun(deadline_at, self._create_limiter())
+        # Reported in the metrics only
+        self.limiter = run.limiter
+        try:
+            if self.http_client is not None:
+                return await self._post_all(await self.http_client.get_session(), transformed_data, run)
+            async with aiohttp.ClientSession() as session:
+                return await self._post_all(session, transformed_data, run)
+        finally:
+            self._add_counts(run)
+
+    def _add_counts(self, run: _RequestRun) -> None:
+        # Partitions of a MapTask run without an HttpClient end on different threads
+        with self._counts_lock:
+            self.request_stats.merge(run.request_stats)
+            for counter in _RequestRun.COUNTERS:
+                setattr(self, counter, getattr(self, counter) + getattr(run, counter))
+
+    def _create_limiter(self) -> ConcurrencyLimiter:
+        return ConcurrencyLimiter(self.max_concurrent_requests, adaptive=self.policy.adaptive_concurrency, min_limit=self.policy.min_concurrency,
+                                  rate=self.policy.rate_limit, burst=self.policy.rate_burst)
+
+    async def _post_all(self, session: aiohttp.ClientSession, transformed_data, run: "_RequestRun") -> Tuple[Any, int, int]:
+        """Posts every row and returns their results in row order, as a list or, given a dtype, as a Series.
+
+        Failed rows are None, which in a Series is a null in its validity mask.
+        """
+        rows = self._encode_rows(transformed_data)
+        missing_input = self._missing_input(transformed_data) if self.skip_null_rows else []
+        sent_rows = [row for row, missing in zip(rows, missing_input) if not missing] if any(missing_input) else rows
+        if self.response_cache is not None:
+            results = await self._post_rows_cached(session, sent_rows, run)
+        else:
+            results = await self._post_rows(session, sent_rows, run)
+        if sent_rows is not rows:
+            sent_results = iter(results)
+            results = [_MISSING_INPUT if missing else next(sent_results) for missing in missing_input]
+
+        failures = {index: result for index, result in enumerate(results) if isinstance(result, RowFailure)}
+        results = [None if index in failures else result for index, result in enumerate(results)]
+        if self.dtype is not None:
+            series = pl.Series(self.name, results, dtype=self.dtype, strict=False)
+            # Results that could not be converted to dtype are nulls as well
+            unconverted_count = series.null_count() - results.count(None)
+            if unconverted_count:
+                logger.error(f"{unconverted_count} results of {self.name} are not of type {self.dtype}")
+                for index in series.is_null().arg_true().to_list():
+                    failures.setdefault(index, RowFailure("InvalidResult"))
+            self._record_failures(transformed_data, failures)
+            return series, len(results), len(failures)
+        self._record_failures(transformed_data, failures)
+        return results, len(results), len(failures)
+
+    def _missing_input(self, transformed_data) -> List[bool]:
+        """Whether each row has a null among the fields it sends."""
+        if len(transformed_data) == 0:
+            return []
+        frame = transformed_data if isinstance(transformed_data, pl.DataFrame) else pl.DataFrame(transformed_data, infer_schema_length=None)
+        frame = frame.select(self.request_fields) if self.request_fields else frame
+        return frame.select(pl.any_horizontal(pl.all().is_null())).to_series().to_list()
+
+    def _record_failures(self, transformed_data, failures: Dict[int, RowFailure]) -> None:
+        if self.failure_log is None or not failures:
+            return
+        indices = list(failures)
+        key_field = self.failure_log.key_field
+        if isinstance(transformed_data, pl.DataFrame) and key_field in transformed_data.columns:
+            keys = transformed_data[key_field].gather(indices).to_list()
+        elif isinstance(transformed_data, list) and all(isinstance(row, dict) for row in transformed_data):
+            keys = [transformed_data[index].get(key_field, index) for index in indices]
+        else:
+            keys = indices
+        for key, failure in zip(keys, failures.values()):
+            self.failure_log.record(self.name, key, failure)
+
+    def _encode_rows(self, transformed_data) -> List[bytes]:
+        """JSON request body of each row. DataFrames are encoded in one pass as NDJSON and split into lines."""
+        if isinstance(transformed_data, pl.DataFrame):
+            frame = transformed_data.select(self.request_fields) if self.request_fields else transformed_data
+            if frame.height == 0:
+                return []
+            # JSON escapes line breaks inside strings, so every line is exactly one row
+            return frame.write_ndjson().encode().split(b"\n")[:frame.height]
+        if self.request_fields:
+            return [json.dumps({field: row.get(field) for field in self.request_fields}).encode() for row in transformed_data]
+        return [json.dumps(row).encode() for row in transformed_data]
+
+    def _parse_result(self, body: bytes) -> Any:
+        """Result in a response body: the value under response_key, or else the first value of the object."""
+        if self._response_prefix is not None and body.startswith(self._response_prefix) and body.endswith(b"}"):
+            # Only the value is decoded. Should the object have other keys the slice is not valid JSON
+            try:
+                return json.loads(body[len(self._response_prefix):-1])
+            except ValueError:
+                pass
+        result = json.loads(body)
+        return result[self.response_key] if self.response_key is not None else next(iter(result.values()))
+
+    def _parse_body(self, body: bytes) -> Any:
+        if not self.ndjson_batches:
+            return self._parse_result(body)
+        results = []
+        for line in body.splitlines():
+            if line.strip():
+                # A row the service could not answer fails alone
+                try:
+                    results.append(self._parse_result(line))
+                except (ValueError, KeyError, StopIteration):
+                    results.append(RowFailure("UnexpectedResponse"))
+        return results
+
+    async def _post_rows(self, session: aiohttp.ClientSession, rows: List[bytes], run: "_RequestRun") -> List:
+        if self.batch_size:
+            return await self._post_batches(session, rows, run)
+        return await asyncio.gather(*[self._post_data_limited(session, self.api_url, row, run) for row in rows])
+
+    async def _post_rows_cached(self, session: aiohttp.ClientSession, rows: List[bytes], run: "_RequestRun") -> List:
+        """Answers rows from the response cache and sends each distinct remaining request body only once."""
+        keys = [self.response_cache.make_key(self.api_url, row) for row in rows]
+        cached_results = [self.response_cache.get(key) for key in keys]
+
+        pending_rows = {}
+        for key, row, cached_result in zip(keys, rows, cached_results):
+            if cached_result is CACHE_MISS:
+                pending_rows.setdefault(key, row)
+
+        missed_row_count = sum(1 for cached_result in cached_results if cached_result is CACHE_MISS)
+        run.cache_hits += len(rows) - missed_row_count
+        run.cache_misses += len(pending_rows)
+        run.coalesced_requests += missed_row_count - len(pending_rows)
+
+        fetched_results = dict(zip(pending_rows, await self._post_rows(session, list(pending_rows.values()), run)))
+        for key, result in fetched_results.items():
+            if not isinstance(result, RowFailure):
+                self.response_cache.put(key, result)
+        self.response_cache.flush()
+
+        return [fetched_results[key] if cached_result is CACHE_MISS else cached_result for key, cached_result in zip(keys, cached_results)]
+
+    async def _post_batches(self, session: aiohttp.ClientSession, rows: List[bytes], run: "_RequestRun") -> List:
+        """Posts batch_size rows per request to a batch endpoint answering with one result per row, in order."""
+        chunks = [rows[offset:offset + self.batch_size] for offset in range(0, len(rows), self.batch_size)]
+        bodies = [b"\n".join(chunk) + b"\n" if self.ndjson_batches else b"[" + b",".join(chunk) + b"]" for chunk in chunks]
+        chunk_results = await asyncio.gather(*[self._post_data_limited(session, self.api_url, body, run) for body in bodies])
+
+        results = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            if isinstance(chunk_result, RowFailure):
+                results.extend([chunk_result] * len(chunk))
+            elif len(chunk_result) != len(chunk):
+                results.extend([RowFailure("UnexpectedResponse")] * len(chunk))
             else:
-                tasks = [self._post_data_with_semaphore(session,self.api_url, row, asyncio.Semaphore(value=self.max_concurrent_requests)) for row in transformed_data]
-            results = await asyncio.gather(*tasks)
-            return results, len(results), self.failure_count
+                results.extend(chunk_result)
+        return results
     
-    async def _post_data(self,session: aiohttp.ClientSession, api_url: str, data: dict):
+    async def _post_data(self,session: aiohttp.ClientSession, api_url: str, data: bytes, run: "_RequestRun"):
+        """Posts data with the task's request policy, returning a RowFailure once it runs out of attempts or time."""
+        for attempt in range(self.policy.max_retries + 1):
+            timeout = run.attempt_timeout(self.policy.timeout)
+            if timeout is not None and timeout <= 0:
+                logger.error(f"Error for data {data.decode()} for api {api_url}: deadline of {self.policy.deadline}s exceeded")
+                return RowFailure("DeadlineExceeded", attempts=attempt)
+            try:
+                return await self._post_hedged(session, api_url, data, timeout, run)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    run.timeouts += 1
+                backoff = self.policy.backoff(attempt)
+                if attempt == self.policy.max_retries or not is_retryable(e) or not run.fits_deadline(backoff):
+                    logger.error(f"Error for data {data.decode()} for api {api_url}: {e!r}")
+                    return RowFailure(f"HTTP {e.status}" if isinstance(e, aiohttp.ClientResponseError) else type(e).__name__, attempts=attempt + 1)
+                run.retries += 1
+                await asyncio.sleep(backoff)
+
+    async def _post_hedged(self, session: aiohttp.ClientSession, api_url: str, data: bytes, timeout: Optional[float], run: "_RequestRun"):
+        """Sends a duplicate of a request still pending after the hedge latency and returns the first answer."""
+        hedge_delay = self.latencies.value() if self.latencies is not None else None
+        if hedge_delay is None or (timeout is not None and hedge_delay >= timeout):
+            return await self._post_once(session, api_url, data, timeout, run)
+
+        primary = asyncio.ensure_future(self._post_once(session, api_url, data, timeout, run))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        run.hedged_requests += 1
+        hedge = asyncio.ensure_future(self._post_once(session, api_url, data, None if timeout is None else timeout - hedge_delay, run))
+        pending = {primary, hedge}
         try:
-            async with session.post(api_url, json=data) as response:
-                response.raise_for_status() 
-                result = await response.json()
-                return list(result.values())[0]
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        run.hedge_wins += attempt is hedge
+                        return attempt.result()
+            return primary.result()
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+
+    async def _post_once(self, session: aiohttp.ClientSession, api_url: str, data: bytes, timeout: Optional[float], run: "_RequestRun"):
+        run.request_stats.bytes_sent += len(data)
+        request_options = {} if timeout is None else {"timeout": aiohttp.ClientTimeout(total=timeout)}
+        start_time = time.perf_counter()
+        try:
+            async with session.post(api_url, data=data, headers=_NDJSON_HEADERS if self.ndjson_batches else _JSON_HEADERS, **request_options) as response:
+                run.request_stats.outcomes[str(response.status)] += 1
+                response.raise_for_status()
+                body = await response.read()
         except Exception as e:
-            self.failure_count += 1
-            logger.error(f"Error for data {data} for api {api_url}: {e}")
-            return None
+            self._record_latency(run, time.perf_counter() - start_time, overloaded=is_retryable(e))
+            if not isinstance(e, aiohttp.ClientResponseError):
+                run.request_stats.outcomes[type(e).__name__] += 1
+            raise
+        self._record_latency(run, time.perf_counter() - start_time)
+        run.request_stats.bytes_received += len(body)
+        return self._parse_body(body)
+
+    def _record_latency(self, run: "_RequestRun", latency: float, overloaded: bool = False) -> None:
+        run.request_stats.latency.record(latency)
+        if self.latencies is not None:
+            self.latencies.add(latency)
+        run.limiter.observe(latency, overloaded)
+
+    async def _post_data_limited(self, session: aiohttp.ClientSession, api_url: str, data: bytes, run: "_RequestRun"):
+        """Posts data once the limiter lets it through. Retries and hedges of a request reuse its slot."""
+        queued_time = time.perf_counter()
+        async with run.limiter:
+            run.request_stats.queue_wait.record(time.perf_counter() - queued_time)
+            return await self._post_data(session, api_url, data, run)
+
+
+class ExpressionTask(Task):
+    """Evaluates a Polars expression over the rows of its input in-process, producing one result per row.
+
+    Results are a list, or given a dtype, a Series of that type.
+    """
+    def __init__(self, name, expression: pl.Expr, dependencies=None, dtype: Optional[pl.DataType] = None):
+        super().__init__(name, self.evaluate, dependencies, stream_func=map_batches(lambda *batches: self._run(batches)))
+        self.expression = expression
+        self.dtype = dtype
+
+    def fingerprint(self) -> str:
+        return f"{super().fingerprint()}[{describe(self.expression)}, {self.dtype}]"
+
+    def _run(self, dependency_results) -> Tuple[Any, int, int]:
+        return self.func(*dependency_results)
+
+    def evaluate(self, input_data) -> Tuple[Any, int, int]:
+        if len(input_data) == 0:
+            return ([] if self.dtype is None else pl.Series(self.name, [], dtype=self.dtype)), 0, 0
+        input_df = input_data if isinstance(input_data, pl.DataFrame) else pl.DataFrame(input_data, infer_schema_length=None)
+        results = input_df.select(self.expression).to_series()
+        if self.dtype is not None:
+            results = results.cast(self.dtype).alias(self.name)
+            return results, len(results), results.null_count()
+        return results.to_list(), len(results), results.null_count()
+
+class MapTask(Task):
+    """Runs another task over partitions of its input as separate units of work, concatenating their results in partition order.
+
+    Partitions are contiguous row ranges, so row-aligned results come out in input order, or
+    with partition_by, the rows sharing a hash of that column of the first input, for tasks
+    that group by it. There are partitions of them if given, else one per partition_rows rows,
+    at most one per worker. Every input is split alike, so all must have as many rows.
+
+    The task manager hands the task its thread pool. The thread running the task works through
+    the partitions along with helpers submitted to the pool, so the task never waits on
+    partitions that no thread has picked up, even when every worker of the pool is busy.
+    """
+    def __init__(self, task: Task, partitions: Optional[int] = None, partition_rows: int = 100000, partition_by: Optional[str] = None):
+        super().__init__(task.name, task.func, task.dependencies, stream_func=task.stream_func, executor=task.executor, checkpoint=task.checkpoint)
+        self.task = task
+        self.partitions = partitions
+        self.partition_rows = partition_rows
+        self.partition_by = partition_by
+        self.thread_pool = None
+        self.parallelism = 1
+        self.partition_count = 0
+
+    def fingerprint(self) -> str:
+        return f"{type(self).__name__}({self.task.fingerprint()}, {self.partitions}, {self.partition_rows}, {self.partition_by!r})"
+
+    def get_metrics(self) -> Dict:
+        return {**self.task.get_metrics(), "partitions": self.partition_count}
+
+    def _partition_count(self, row_count: int) -> int:
+        if self.partitions is not None:
+            return max(1, min(self.partitions, row_count))
+        return max(1, min(self.parallelism, -(-row_count // self.partition_rows)))
+
+    def split(self, dependency_results: List) -> List[List]:
+        """Per-partition inputs, each a list with one part of every dependency result."""
+        row_count = len(dependency_results[0]) if dependency_results else 0
+        partition_count = self._partition_count(row_count)
+        if partition_count == 1:
+            return [list(dependency_results)]
+        if self.partition_by is not None:
+            partition_ids = dependency_results[0][self.partition_by].hash(seed=0) % partition_count
+            masks = [partition_ids == partition for partition in range(partition_count)]
+            return [[self._filter(result, mask) for result in dependency_results] for mask in masks]
+        size = -(-row_count // partition_count)
+        return [[result[offset:offset + size] for result in dependency_results] for offset in range(0, row_count, size)]
+
+    @staticmethod
+    def _filter(result, mask: pl.Series):
+        if isinstance(result, list):
+            return [row for row, keep in zip(result, mask) if keep]
+        return result.filter(mask)
+
+    def _run(self, dependency_results) -> Tuple[Any, int, int]:
+        partitions = self.split(dependency_results)
+        self.partition_count = len(partitions)
+        outputs = [None] * len(partitions)
+        # next() on a count is atomic, so each partition is claimed by exactly one thread
+        claims = itertools.count()
+        failed = threading.Event()
+        run_partition = self.task.partition_runner()
+
+        def work() -> None:
+            while not failed.is_set() and (index := next(claims)) < len(partitions):
+                try:
+                    outputs[index] = run_partition(partitions[index])
+                except BaseException:
+                    failed.set()
+                    raise
+
+        helpers = [self.thread_pool.submit(work) for _ in range(len(partitions) - 1)] if self.thread_pool is not None else []
+        try:
+            work()
+        finally:
+            for helper in helpers:
+                # Helpers still queued have nothing left to do, running ones are finishing a partition
+                if not helper.cancel():
+                    helper.result()
 
-    async def _post_data_with_semaphore(self, session: aiohttp.ClientSession, api_url: str, data: dict, semaphore: asyncio.Semaphore):
-        async with semaphore:
-            return await self._post_data(session, api_url, data)
\ No newline at end of file
+        results, item_counts, failure_counts = zip(*outputs)
+        return concat_batches(list(results)), sum(item_counts), sum(failure_counts)
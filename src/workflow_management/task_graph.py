@@ -0,0 +1,127 @@
+from array import array
+from collections import deque
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional
+
+
+class CycleError(ValueError):
+    """Raised when the task dependencies form a cycle, which is given as the task names along it."""
+    def __init__(self, cycle: List[str]):
+        super().__init__(f"The task dependencies form a cycle! {' -> '.join(cycle)}")
+        self.cycle = cycle
+
+
+class TaskGraph:
+    """Dependency graph of tasks, stored as integer ids and flat arrays.
+
+    Tasks get consecutive ids in insertion order and edges are appended to two arrays. The
+    successors of every task are packed into CSR form (an offsets array and one successor
+    array) on first use after a change, so that validation, ordering and scheduling are
+    linear in the number of tasks and edges, with a few bytes per edge.
+    """
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self._sources = array("q")
+        self._targets = array("q")
+        self._offsets: Optional[array] = None
+        self._successors: Optional[array] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def add_node(self, name: str) -> int:
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+            self._offsets = None
+        return self.ids[name]
+
+    def add_edge(self, source: str, target: str) -> None:
+        self._sources.append(self.add_node(source))
+        self._targets.append(self.add_node(target))
+        self._offsets = None
+
+    def _build(self) -> None:
+        """Packs the edges by source with a counting sort, keeping the order they were added in."""
+        # Python lists index faster than arrays, so the arrays are only used for storage
+        sources, targets = self._sources.tolist(), self._targets.tolist()
+        offsets = [0] * (len(self.names) + 1)
+        for source in sources:
+            offsets[source + 1] += 1
+        offsets = list(accumulate(offsets))
+        successors = [0] * len(targets)
+        positions = offsets[:-1]
+        for source, target in zip(sources, targets):
+            successors[positions[source]] = target
+            positions[source] += 1
+        self._offsets, self._successors = array("q", offsets), array("q", successors)
+
+    def successor_ids(self, node: int) -> array:
+        if self._offsets is None:
+            self._build()
+        return self._successors[self._offsets[node]:self._offsets[node + 1]]
+
+    def successors(self, name: str) -> Iterator[str]:
+        return (self.names[successor] for successor in self.successor_ids(self.ids[name]))
+
+    def in_degrees(self) -> List[int]:
+        degrees = [0] * len(self.names)
+        for target in self._targets.tolist():
+            degrees[target] += 1
+        return degrees
+
+    def in_degree(self, name: str) -> int:
+        return self.in_degrees()[self.ids[name]]
+
+    def topological_order(self) -> List[int]:
+        """Task ids with every task after its dependencies, ties in insertion order (Kahn's algorithm).
+
+        Raises CycleError naming the tasks of one cycle if there is no such order.
+        """
+        if self._offsets is None:
+            self._build()
+        offsets, successors = self._offsets.tolist(), self._successors.tolist()
+        degrees = self.in_degrees()
+        ready = deque(node for node, degree in enumerate(degrees) if degree == 0)
+        order = []
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for index in range(offsets[node], offsets[node + 1]):
+                successor = successors[index]
+                degrees[successor] -= 1
+                if degrees[successor] == 0:
+                    ready.append(successor)
+        if len(order) != len(self.names):
+            raise CycleError(self._find_cycle(degrees))
+        return order
+
+    def _find_cycle(self, degrees: List[int]) -> List[str]:
+        """Follows dependencies that were never released from a task left by Kahn's algorithm until a task repeats."""
+        predecessor = {}
+        for source, target in zip(self._sources, self._targets):
+            if degrees[source] and degrees[target]:
+                predecessor.setdefault(target, source)
+        node = next(node for node, degree in enumerate(degrees) if degree)
+        visited = {}
+        path = []
+        while node not in visited:
+            visited[node] = len(path)
+            path.append(node)
+            node = predecessor[node]
+        cycle = path[visited[node]:][::-1]
+        # Starting from the task added first makes the report independent of where the walk began
+        first = cycle.index(min(cycle))
+        cycle = cycle[first:] + cycle[:first + 1]
+        return [self.names[node] for node in cycle]
+
+    def is_acyclic(self) -> bool:
+        try:
+            self.topological_order()
+        except CycleError:
+            return False
+        return True
@@ -1,13 +1,32 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from datetime import datetime, timezone
 from functools import partial
 import json
 import logging
+import os
+from typing import Dict, List, Optional, Type
+from urllib.parse import urljoin
 from .dag_task_manager import DAGTaskManager
+from .checkpoint import CheckpointStore
 from .config import Config, OfferWorkFlowConfig
-from .task import RequestTask, SyncTask, Task
+from .failures import FailureLog
+from .http_client import HttpClient
+from .request_policy import RequestPolicy
+from .response_cache import ResponseCache
+from .streaming import map_batches
+from .task import ExpressionTask, MapTask, RequestTask, SyncTask, Task
+import polars as pl
+from pydantic import BaseModel
 
-from src.user_functions.offer_workflow_functions import combiner_task, extract_task, load_task, transform_task
-from src.api.prediction_ep import Prediction
+from src.user_functions.offer_workflow_functions import (
+    combiner_task, commit_member_state_task, extract_task, failed_rows_task, incremental_extract_task, incremental_transform_task,
+    lazy_extract_transform_task, lazy_transform_task, load_task, stream_load_task, transform_task
+)
+from src.api.member_features import MemberFeatures
+from src.api.offer_ep import offer_expr
+from src.api.prediction_ep import Prediction, ats_prediction_expr, resp_prediction_expr
+from src.api.score_ep import SCORE_DTYPE, score_expr
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +47,10 @@ class IPreloadedWorkFlow(IWorkFlow):
 class BasicWorkFlow(IWorkFlow):
     def __init__(self, config:Config):
         self.config = config
-        self.task_manager = DAGTaskManager()
+        self.task_manager = self.create_task_manager()
+
+    def create_task_manager(self) -> DAGTaskManager:
+        return DAGTaskManager()
 
     def add_task(self, task: Task) -> None:
         self.task_manager.add_task(task)
@@ -50,31 +72,207 @@ class PreloadedWorkFlow(BasicWorkFlow, IPreloadedWorkFlow):
         logger.info(f"Workflow {self.config.name} completed successfully")
 
 class OfferWorkFlow(PreloadedWorkFlow):
-    def __init__(self, config: OfferWorkFlowConfig):
+    """The offer scoring workflow.
+
+    http_client, response_cache and executor may be handed in to share them with other
+    workflows, as the daemon does; the workflow then leaves closing them to their owner.
+
+    Rows failing in a request stage are recorded by memberId in a failures ledger written
+    next to the results. A repair run scores only those rows again and merges them into the
+    existing results.
+    """
+    def __init__(self, config: OfferWorkFlowConfig, http_client: Optional[HttpClient] = None, response_cache: Optional[ResponseCache] = None,
+                 executor: Optional[Executor] = None):
+        self.executor = executor
         super().__init__(config)
+        self.owns_http_client = http_client is None
+        self.http_client = http_client or HttpClient(
+            connection_limit=config.http_connection_limit,
+            connection_limit_per_host=config.http_connection_limit_per_host,
+            dns_cache_ttl=config.http_dns_cache_ttl,
+            keepalive_timeout=config.http_keepalive_timeout
+        )
+        self.owns_response_cache = response_cache is None
+        self.response_cache = response_cache or self.create_response_cache(config)
+        self.failure_log = FailureLog(key_field="memberId")
+
+    @staticmethod
+    def create_response_cache(config: OfferWorkFlowConfig) -> Optional[ResponseCache]:
+        if not config.response_cache:
+            return None
+        return ResponseCache(
+            max_memory_entries=config.response_cache_memory_entries,
+            disk_path=config.response_cache_path,
+            max_disk_entries=config.response_cache_disk_entries,
+            ttl=config.response_cache_ttl
+        )
+
+    def create_task_manager(self) -> DAGTaskManager:
+        checkpoint_store = None
+        if self.config.checkpoint_dir:
+            # DAYS_SINCE_LAST_TRANSACTION depends on the current day, so checkpoints are only reused within a day
+            checkpoint_store = CheckpointStore(self.config.checkpoint_dir, salt=datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+
+        return DAGTaskManager(
+            max_workers=self.config.max_workers,
+            streaming=self.config.streaming,
+            stream_batch_size=self.config.stream_batch_size,
+            stream_channel_capacity=self.config.stream_channel_capacity,
+            checkpoint_store=checkpoint_store,
+            process_workers=self.config.process_workers,
+            executor=self.executor,
+            memory_budget=int(self.config.memory_budget_mb * 2**20) if self.config.memory_budget_mb is not None else None,
+            spill_dir=self.config.spill_dir,
+            profile_tasks=self.config.profile_tasks,
+            profile_memory=self.config.profile_memory,
+            profile_top=self.config.profile_top
+        )
+
+    def add_task(self, task: Task) -> None:
+        task.executor = self.config.task_executors.get(task.name, task.executor)
+        super().add_task(task)
+
+    def _request_task(self, name: str, api_url: str, batch_api_url: Optional[str], request_model: Type[BaseModel], dtype: pl.DataType,
+                      response_key: str, batch_response_key: str, dependencies: List[str], batch_format: str = "json") -> RequestTask:
+        batch_size = self.config.request_batch_size
+        if batch_format == "ndjson":
+            # NDJSON endpoints stream many rows per request, so rows are always sent in batches
+            batch_size = batch_size or 10000
+        if batch_size:
+            api_url = batch_api_url or f"{api_url}/batch"
+            response_key = batch_response_key
+        return RequestTask(name, api_url, max_concurrent_requests=self.config.request_max_concurrency, dependencies=dependencies,
+                           http_client=self.http_client, batch_size=batch_size, batch_format=batch_format,
+                           response_cache=self.response_cache, request_fields=list(request_model.model_fields),
+                           policy=RequestPolicy(timeout=self.config.request_timeout, deadline=self.config.request_deadline,
+                                                max_retries=self.config.request_max_retries, backoff_base=self.config.request_retry_backoff,
+                                                hedge_quantile=self.config.request_hedge_quantile,
+                                                adaptive_concurrency=self.config.request_adaptive_concurrency,
+                                                min_concurrency=self.config.request_min_concurrency,
+                                                rate_limit=self.config.request_rate_limit, rate_burst=self.config.request_rate_burst),
+                           dtype=dtype, response_key=response_key, failure_log=self.failure_log, skip_null_rows=True)
+
+    def _mapped(self, task: Task, partition_by: Optional[str] = None) -> Task:
+        """The task split over partitions of its input, if map_partitions or map_partition_rows is set."""
+        if self.config.map_partitions is None and self.config.map_partition_rows is None:
+            return task
+        # Tasks running in a worker process must stay SyncTasks
+        if self.config.task_executors.get(task.name, task.executor) == "process":
+            return task
+        return MapTask(task, partitions=self.config.map_partitions, partition_rows=self.config.map_partition_rows or 100000, partition_by=partition_by)
+
+    def _scoring_task(self, name: str, mode: str, api_url: str, batch_api_url: Optional[str], request_model: Type[BaseModel], expression: pl.Expr,
+                      dtype: pl.DataType, response_key: str, batch_response_key: str, dependencies: List[str], batch_format: str = "json") -> Task:
+        if mode == "request":
+            return self._mapped(self._request_task(name, api_url, batch_api_url, request_model, dtype, response_key, batch_response_key, dependencies,
+                                                   batch_format))
+        elif mode == "local":
+            return self._mapped(ExpressionTask(name, expression, dependencies=dependencies, dtype=dtype))
+        else:
+            raise ValueError(f"Unknown scoring mode {mode} for task {name}")
+
+    def _fused_scoring_task(self, dependencies: List[str]) -> Task:
+        """One task scoring ATS, RESP and the offer of every row together, in one round trip to the fused endpoint per row or batch."""
+        modes = {self.config.ats_mode, self.config.resp_mode, self.config.offer_mode}
+        if len(modes) != 1:
+            raise ValueError(f"Fused scoring needs the same ats_mode, resp_mode and offer_mode, got {sorted(modes)}")
+        score_url = self.config.score_url or urljoin(self.config.offer_url, "/offer/score")
+        if self.config.scoring_mode == "stream":
+            return self._scoring_task("Score", modes.pop(), score_url, f"{score_url}/stream", MemberFeatures, score_expr(), SCORE_DTYPE,
+                                      "score", "score", dependencies, batch_format="ndjson")
+        return self._scoring_task("Score", modes.pop(), score_url, None, MemberFeatures, score_expr(), SCORE_DTYPE, "score", "scores", dependencies)
 
     def preload(self) -> None:
-        self.add_task(SyncTask("Extract", partial(extract_task, file_path=self.config.csv_path)))
-        self.add_task(SyncTask("Transform", transform_task, dependencies=["Extract"]))
-        self.add_task(RequestTask("ATS Predict", self.config.ats_url, dependencies=["Transform"]))
-        self.add_task(RequestTask("RESP Predict", self.config.resp_url, dependencies=["Transform"]))
-        self.add_task(SyncTask("ATS-RESP Combiner", partial(combiner_task, output_format=Prediction), dependencies=["ATS Predict", "RESP Predict"]))
-        self.add_task(RequestTask("Offer Recommendation", self.config.offer_url, dependencies=["ATS-RESP Combiner"]))
-        self.add_task(SyncTask("Load", partial(load_task, output_file=self.config.result_output_path), dependencies=["Transform", "ATS Predict", "RESP Predict","Offer Recommendation"]))
+        state_dir = self.config.incremental_state_dir
+        if state_dir:
+            # Both stage the next member state, so they run every time instead of being restored from a checkpoint
+            self.add_task(SyncTask("Extract", partial(incremental_extract_task, file_path=self.config.csv_path, state_dir=state_dir), checkpoint=False))
+            self.add_task(SyncTask("Transform", partial(incremental_transform_task, state_dir=state_dir), dependencies=["Extract"], checkpoint=False))
+        elif self.config.transform_mode == "fused":
+            self.add_task(SyncTask("Transform", partial(lazy_extract_transform_task, file_path=self.config.csv_path, streaming=self.config.polars_streaming)))
+        elif self.config.transform_mode == "lazy":
+            self.add_task(SyncTask("Extract", partial(extract_task, file_path=self.config.csv_path)))
+            # Members are independent, so Transform can be split by memberId
+            self.add_task(self._mapped(SyncTask("Transform", partial(lazy_transform_task, streaming=self.config.polars_streaming), dependencies=["Extract"]), "memberId"))
+        elif self.config.transform_mode == "eager":
+            self.add_task(SyncTask("Extract", partial(extract_task, file_path=self.config.csv_path)))
+            self.add_task(self._mapped(SyncTask("Transform", transform_task, dependencies=["Extract"]), "memberId"))
+        else:
+            raise ValueError(f"Unknown transform mode {self.config.transform_mode}")
+        scored_input = "Transform"
+        if self.config.repair:
+            if state_dir:
+                raise ValueError("Incremental runs can't be repaired, since their Transform only computes the members that changed")
+            self.add_task(SyncTask("Failed Rows", partial(failed_rows_task, failures_file=self.config.failures_path, key_field=self.failure_log.key_field),
+                                   dependencies=["Transform"]))
+            scored_input = "Failed Rows"
+        if self.config.scoring_mode in ("fused", "stream"):
+            self.add_task(self._fused_scoring_task(dependencies=[scored_input]))
+            prediction_tasks = ["Score"]
+        elif self.config.scoring_mode == "staged":
+            self._add_staged_scoring_tasks(scored_input)
+            prediction_tasks = ["ATS Predict", "RESP Predict", "Offer Recommendation"]
+        else:
+            raise ValueError(f"Unknown scoring mode {self.config.scoring_mode}")
+        load_options = {"output_file": self.config.result_output_path, "file_format": self.config.result_output_format,
+                        "failure_log": self.failure_log, "failures_file": self.config.failures_path}
+        if state_dir or self.config.repair:
+            # Only changed or failed members are scored, so their rows are merged into the existing results
+            self.add_task(SyncTask("Load", partial(load_task, merge_key="memberId", **load_options), dependencies=[scored_input, *prediction_tasks],
+                                   checkpoint=False))
+            if state_dir:
+                self.add_task(SyncTask("Commit State", partial(commit_member_state_task, state_dir=state_dir), dependencies=["Load"], checkpoint=False))
+        else:
+            self.add_task(SyncTask("Load", partial(load_task, **load_options), dependencies=[scored_input, *prediction_tasks], checkpoint=False,
+                                   stream_func=partial(stream_load_task, **load_options)))
+
+    def _add_staged_scoring_tasks(self, scored_input: str) -> None:
+        """ATS and RESP predictions as separate stages, combined into the input of the offer stage."""
+        self.add_task(self._scoring_task("ATS Predict", self.config.ats_mode, self.config.ats_url, self.config.ats_batch_url, MemberFeatures,
+                                         ats_prediction_expr(), pl.Float64, "prediction", "predictions", dependencies=[scored_input]))
+        self.add_task(self._scoring_task("RESP Predict", self.config.resp_mode, self.config.resp_url, self.config.resp_batch_url, MemberFeatures,
+                                         resp_prediction_expr(), pl.Float64, "prediction", "predictions", dependencies=[scored_input]))
+        # memberId is carried along so that the offer stage records its failed rows by member
+        combiner = partial(combiner_task, output_format=Prediction, key_field=self.failure_log.key_field)
+        self.add_task(SyncTask("ATS-RESP Combiner", combiner, dependencies=[scored_input, "ATS Predict", "RESP Predict"], stream_func=map_batches(combiner)))
+        self.add_task(self._scoring_task("Offer Recommendation", self.config.offer_mode, self.config.offer_url, self.config.offer_batch_url, Prediction,
+                                         offer_expr(pl.col("ats_prediction"), pl.col("resp_prediction")), pl.String, "offer", "offers", dependencies=["ATS-RESP Combiner"]))
     
-    def save_summary(self) -> None:
+    def get_summary(self) -> Dict:
         workflow_information = {
             "name": self.config.name,
             "description": self.config.description,
         }
 
         workflow_information.update(self.task_manager.get_summary())
+        workflow_information["row_failures"] = self.failure_log.get_stats()
+        if self.response_cache is not None:
+            workflow_information["response_cache"] = self.response_cache.get_stats()
+        return workflow_information
 
+    def save_summary(self) -> None:
+        output_stem = os.path.splitext(self.config.performance_output_path)[0]
+        # Written first so that the summary can point at each task's CPU profile
+        self.task_manager.write_profiles(f"{output_stem}.profiles")
         with open(self.config.performance_output_path, "w") as f:
-            json.dump(workflow_information, f, indent=4)
+            json.dump(self.get_summary(), f, indent=4)
+
+        trace_output_path = self.config.trace_output_path or f"{output_stem}.trace.json"
+        with open(trace_output_path, "w") as f:
+            json.dump(self.task_manager.get_trace(), f)
         
         logger.info(f"Workflow {self.config.name} saved a summary successfully")
 
     def start(self) -> None:
-        super().start()
+        self.failure_log.clear()
+        try:
+            super().start()
+        finally:
+            if self.owns_http_client:
+                self.http_client.close()
+            if self.response_cache is not None:
+                if self.owns_response_cache:
+                    self.response_cache.close()
+                else:
+                    self.response_cache.flush()
         self.save_summary()
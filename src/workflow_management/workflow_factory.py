@@ -1,15 +1,31 @@
-from .config import OfferWorkFlowConfig
-from .workflow import OfferWorkFlow, PreloadedWorkFlow
+from .config import Config, OfferWorkFlowConfig
+from .sharding import ShardedWorkFlow
+from .workflow import IWorkFlow, OfferWorkFlow
 import logging
 
 logger = logging.getLogger(__name__)
 
 class WorkFlowFactory:
     @staticmethod
-    def create_workflow(workflow_type: str, config_path) -> PreloadedWorkFlow:
+    def load_config(workflow_type: str, config_path) -> Config:
         if workflow_type == "OfferWorkFlow":
             config = OfferWorkFlowConfig.from_json_file(config_path)
             logger.info(f"Loaded config: {config}")
-            return OfferWorkFlow(config)
+            return config
         else:
             raise ValueError("Unknown workflow type")
+
+    @staticmethod
+    def create_from_config(workflow_type: str, config: Config, **resources) -> IWorkFlow:
+        """Builds a workflow from a loaded config. resources are shared objects (http_client, response_cache, executor) the workflow uses instead of its own."""
+        if workflow_type == "OfferWorkFlow":
+            # A repair run only scores the rows that failed, which needs no sharding
+            if config.shard_count > 1 and not config.repair:
+                return ShardedWorkFlow(config)
+            return OfferWorkFlow(config, **resources)
+        else:
+            raise ValueError("Unknown workflow type")
+
+    @staticmethod
+    def create_workflow(workflow_type: str, config_path, **resources) -> IWorkFlow:
+        return WorkFlowFactory.create_from_config(workflow_type, WorkFlowFactory.load_config(workflow_type, config_path), **resources)
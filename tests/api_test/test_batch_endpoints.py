@@ -0,0 +1,100 @@
+import asyncio
+import json
+import polars as pl
+import pytest
+from src.api.member_features import MemberFeatures
+from src.api.offer_ep import get_offer, get_offer_batch, offer_expr
+from src.api.prediction_ep import Prediction, predict_ats, predict_ats_batch, predict_resp, predict_resp_batch
+from src.api.app import app
+from src.api.score_ep import score_batch, score_member, score_stream
+
+@pytest.fixture
+def members_features():
+    return [
+        MemberFeatures(AVG_POINTS_BOUGHT=2088.9, AVG_REVENUE_USD=10.6, LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT=-433.3,
+                       LAST_3_TRANSACTIONS_AVG_REVENUE_USD=3.6, PCT_BUY_TRANSACTIONS=0.33, PCT_GIFT_TRANSACTIONS=0.37,
+                       PCT_REDEEM_TRANSACTIONS=0.3, DAYS_SINCE_LAST_TRANSACTION=532),
+        MemberFeatures(AVG_POINTS_BOUGHT=-2666.7, AVG_REVENUE_USD=1.9, LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT=-2666.7,
+                       LAST_3_TRANSACTIONS_AVG_REVENUE_USD=1.9, PCT_BUY_TRANSACTIONS=0.0, PCT_GIFT_TRANSACTIONS=0.33,
+                       PCT_REDEEM_TRANSACTIONS=0.67, DAYS_SINCE_LAST_TRANSACTION=448),
+        MemberFeatures(AVG_POINTS_BOUGHT=9000.0, AVG_REVENUE_USD=900.0, LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT=9000.0,
+                       LAST_3_TRANSACTIONS_AVG_REVENUE_USD=900.0, PCT_BUY_TRANSACTIONS=1.0, PCT_GIFT_TRANSACTIONS=0.0,
+                       PCT_REDEEM_TRANSACTIONS=0.0, DAYS_SINCE_LAST_TRANSACTION=0),
+    ]
+
+def test_predict_ats_batch_matches_single_predictions(members_features):
+    """Test if the ATS batch endpoint logic matches the per-member logic, including the weight clamp"""
+    expected = [predict_ats(member)["prediction"] for member in members_features]
+    assert predict_ats_batch(members_features)["predictions"] == pytest.approx(expected)
+
+def test_predict_resp_batch_matches_single_predictions(members_features):
+    """Test if the RESP batch endpoint logic matches the per-member logic, including the 0.9 cap"""
+    expected = [predict_resp(member)["prediction"] for member in members_features]
+    assert predict_resp_batch(members_features)["predictions"] == pytest.approx(expected)
+
+def test_get_offer_batch_matches_single_offers():
+    """Test if the offer batch endpoint logic applies the same threshold in order"""
+    predictions = [Prediction(ats_prediction=500, resp_prediction=0.4), Prediction(ats_prediction=100, resp_prediction=0.9)]
+    expected = [get_offer(prediction)["offer"] for prediction in predictions]
+    assert get_offer_batch(predictions)["offers"] == expected == ["OFFER_2", "OFFER_1"]
+
+def test_offer_expr_leaves_missing_predictions_without_offer():
+    """Test if the vectorised offer logic gives no offer when a prediction is missing"""
+    predictions_df = pl.DataFrame({"ats": [500.0, None], "resp": [0.5, 0.5]})
+    offers = predictions_df.select(offer_expr(pl.col("ats"), pl.col("resp"))).to_series().to_list()
+    assert offers == ["OFFER_2", None]
+
+def test_score_batch_matches_single_scores(members_features):
+    """Test if the fused batch scoring logic gives each member the predictions and offer of the separate endpoints"""
+    scores = score_batch(members_features)["scores"]
+    expected = [score_member(member)["score"] for member in members_features]
+    assert [score["offer"] for score in scores] == [score["offer"] for score in expected]
+    assert [score["ats_prediction"] for score in scores] == pytest.approx([score["ats_prediction"] for score in expected])
+    assert [score["resp_prediction"] for score in scores] == pytest.approx([score["resp_prediction"] for score in expected])
+
+def test_score_stream_answers_every_line_in_order(members_features):
+    """Test if NDJSON scoring answers each member line in order, across chunk boundaries, with invalid lines answered by their errors"""
+    body = b"\n".join([members_features[0].model_dump_json().encode(), b'{"AVG_POINTS_BOUGHT": "many"}', b"", members_features[2].model_dump_json().encode()])
+
+    async def chunks():
+        for offset in range(0, len(body), 7):
+            yield body[offset:offset + 7]
+
+    async def collect():
+        return b"".join([lines async for lines in score_stream(chunks())])
+
+    lines = [json.loads(line) for line in asyncio.run(collect()).splitlines()]
+    assert len(lines) == 3
+    assert lines[0]["score"]["offer"] == score_member(members_features[0])["score"]["offer"]
+    assert lines[1]["detail"][0]["loc"] == ["AVG_POINTS_BOUGHT"]
+    assert lines[2]["score"] == score_batch([members_features[2]])["scores"][0]
+
+def test_score_stream_endpoint_answers_before_the_body_ends(members_features):
+    """Test if /offer/score/stream answers the members of the first body chunk while the rest of the body has yet to arrive"""
+    scope = {"type": "http", "http_version": "1.1", "method": "POST", "scheme": "http", "path": "/offer/score/stream", "root_path": "",
+             "query_string": b"", "headers": [(b"content-type", b"application/x-ndjson")], "server": ("test", 80), "client": ("test", 1)}
+    chunks = [member.model_dump_json().encode() + b"\n" for member in members_features[:2]]
+
+    async def call():
+        first_answer = asyncio.Event()
+        answers = []
+
+        async def receive():
+            if chunks:
+                chunk = chunks.pop(0)
+                if not chunks:
+                    # The last chunk only comes once the first one is answered
+                    await first_answer.wait()
+                return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                answers.append(message["body"])
+                first_answer.set()
+
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+        return answers
+
+    answers = asyncio.run(call())
+    assert [json.loads(answer)["score"] for answer in answers] == score_batch(members_features[:2])["scores"]
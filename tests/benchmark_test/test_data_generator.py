@@ -0,0 +1,27 @@
+import polars as pl
+from src.benchmark.data_generator import generate_member_data
+from src.user_functions.offer_workflow_functions import extract_task, transform_task
+
+def test_generate_member_data_is_reproducible(tmp_path):
+    """Test if the same seed writes the same file and another seed a different one"""
+    first = generate_member_data(str(tmp_path / "first.csv"), 5000, seed=1, chunk_size=1000)
+    second = generate_member_data(str(tmp_path / "second.csv"), 5000, seed=1)
+    other = generate_member_data(str(tmp_path / "other.csv"), 5000, seed=2)
+
+    assert open(first).read() == open(second).read()
+    assert open(first).read() != open(other).read()
+
+def test_generate_member_data_matches_sample_schema(tmp_path):
+    """Test if generated files have the columns, types and value ranges of member_data.csv"""
+    output_file = generate_member_data(str(tmp_path / "members.csv"), 20000)
+
+    generated = pl.read_csv(output_file)
+    sample = pl.read_csv("member_data.csv")
+
+    assert generated.schema == sample.schema
+    assert generated.height == 20000
+    assert 3500 < generated["memberId"].n_unique() < 5000
+    assert set(generated["lastTransactionType"].drop_nulls()) == {"buy", "redeem", "gift"}
+    assert generated.filter(pl.col("lastTransactionType") == "redeem")["lastTransactionRevenueUSD"].max() == 0
+    assert generated["lastTransactionPointsBought"].abs().max() <= 10000
+    assert transform_task(extract_task(output_file)[0])[1] > 0
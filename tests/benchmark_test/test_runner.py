@@ -0,0 +1,48 @@
+import copy
+from src.benchmark.runner import BenchmarkCase, compare_results, run_case
+
+def make_results(total_time=1.0, stage_time=0.5, failures=0, p95=0.01):
+    return {"runs": [{
+        "name": "rows=1000",
+        "total_execution_time (sec)": total_time,
+        "peak_rss (MB)": 100.0,
+        "stages": {"ATS Predict": {"execution_time (sec)": stage_time, "item_failure_count": failures, "peak_rss (MB)": 90.0,
+                                   "latency (sec)": {"p95": p95, "p99": p95}}}
+    }]}
+
+def test_compare_results_flags_regressions_beyond_tolerance():
+    """Test if slower stages, higher latency and new failures are flagged and changes within tolerance are not"""
+    baseline = make_results()
+
+    assert compare_results(make_results(total_time=1.05, stage_time=0.52), baseline, tolerance=0.1) == []
+    regressions = compare_results(make_results(total_time=1.5, stage_time=0.8, failures=3, p95=0.05), baseline, tolerance=0.1)
+
+    assert len(regressions) == 5
+    assert regressions[0].startswith("rows=1000 total time: 1.5 vs baseline 1")
+
+def test_compare_results_skips_runs_missing_from_baseline():
+    """Test if runs without a baseline counterpart are not compared"""
+    baseline = copy.deepcopy(make_results())
+    baseline["runs"][0]["name"] = "rows=5000"
+
+    assert compare_results(make_results(total_time=10), baseline) == []
+
+def test_case_names_tell_apart_injected_latency_and_errors():
+    """Test if cases with the same row count but different latency, jitter or error rate get different names"""
+    cases = [BenchmarkCase(rows=1000), BenchmarkCase(rows=1000, latency=0.005), BenchmarkCase(rows=1000, latency_jitter=0.01), BenchmarkCase(rows=1000, error_rate=0.001)]
+
+    assert len({case.name for case in cases}) == len(cases)
+    assert BenchmarkCase(rows=1000, latency=0.005).name == "rows=1000,latency=0.005,jitter=0.0,error_rate=0.0"
+
+def test_run_case_reports_stages_against_stub_api(tmp_path):
+    """Test if a benchmark run scores every member through the stub API and reports each stage"""
+    result = run_case(BenchmarkCase(rows=500, error_rate=0.05, config={"request_max_retries": 5, "request_retry_backoff": 0.001}), str(tmp_path))
+
+    stages = result["stages"]
+    assert set(stages) == {"Extract", "Transform", "ATS Predict", "RESP Predict", "ATS-RESP Combiner", "Offer Recommendation", "Load"}
+    assert stages["ATS Predict"]["processed_item_count"] == stages["Transform"]["processed_item_count"]
+    assert stages["Offer Recommendation"]["item_failure_count"] == 0
+    assert result["api_injected_errors"] > 0
+    assert result["api_requests"] == 3 * stages["Transform"]["processed_item_count"] + result["api_injected_errors"]
+    assert stages["ATS Predict"]["latency (sec)"]["count"] >= stages["Transform"]["processed_item_count"]
+    assert stages["Load"]["peak_rss (MB)"] > 0
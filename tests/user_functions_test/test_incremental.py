@@ -0,0 +1,91 @@
+import os
+import polars as pl
+import pytest
+from src.user_functions.offer_workflow_functions import (
+    commit_member_state_task, incremental_extract_task, incremental_transform_task, load_task, transform_task
+)
+
+FIRST_ROWS = pl.DataFrame({
+    'memberId': ['A', 'A', 'B'],
+    'lastTransactionUtcTs': ['2024-01-01 10:00:00', '2024-01-03 12:00:00', '2024-01-01 13:00:00'],
+    'lastTransactionType': ['buy', 'gift', 'redeem'],
+    'lastTransactionPointsBought': [100, 200, 300],
+    'lastTransactionRevenueUSD': [10.0, 20.0, 30.0]
+})
+
+APPENDED_ROWS = pl.DataFrame({
+    'memberId': ['A', 'A', 'C'],
+    'lastTransactionUtcTs': ['2024-01-02 11:00:00', '2024-01-05 14:00:00', '2024-01-04 09:00:00'],
+    'lastTransactionType': ['redeem', 'buy', 'gift'],
+    'lastTransactionPointsBought': [400, 500, 600],
+    'lastTransactionRevenueUSD': [40.0, 50.0, 60.0]
+})
+
+def run_incremental(csv_path, state_dir):
+    extracted_df, _, _ = incremental_extract_task(csv_path, state_dir)
+    transformed_df, _, _ = incremental_transform_task(extracted_df, state_dir)
+    commit_member_state_task("load", state_dir)
+    return extracted_df, transformed_df
+
+def test_incremental_transform_matches_full_recompute(tmp_path):
+    """Test if folding appended rows into the member state gives the same features as a full recompute"""
+    csv_path = str(tmp_path / "data.csv")
+    state_dir = str(tmp_path / "state")
+    FIRST_ROWS.write_csv(csv_path)
+    run_incremental(csv_path, state_dir)
+
+    with open(csv_path, "ab") as f:
+        APPENDED_ROWS.write_csv(f, include_header=False)
+    extracted_df, transformed_df = run_incremental(csv_path, state_dir)
+
+    assert len(extracted_df) == 3
+    assert sorted(transformed_df["memberId"].to_list()) == ['A', 'C']
+
+    expected_df, _, _ = transform_task(pl.concat([FIRST_ROWS, APPENDED_ROWS]))
+    expected_df = expected_df.filter(pl.col("memberId").is_in(['A', 'C'])).sort("memberId")
+    transformed_df = transformed_df.sort("memberId")
+    assert transformed_df.columns == expected_df.columns
+    for column in expected_df.columns[1:]:
+        assert transformed_df[column].to_list() == pytest.approx(expected_df[column].to_list())
+
+def test_incremental_extract_skips_committed_rows(tmp_path):
+    """Test if nothing is extracted again once the state is committed"""
+    csv_path = str(tmp_path / "data.csv")
+    state_dir = str(tmp_path / "state")
+    FIRST_ROWS.write_csv(csv_path)
+    run_incremental(csv_path, state_dir)
+
+    extracted_df, transformed_df = run_incremental(csv_path, state_dir)
+
+    assert len(extracted_df) == 0
+    assert len(transformed_df) == 0
+
+def test_incremental_extract_removes_uncommitted_state(tmp_path):
+    """Test if state staged by runs that failed before committing is deleted by the next run, keeping the committed state"""
+    csv_path = str(tmp_path / "data.csv")
+    state_dir = str(tmp_path / "state")
+    FIRST_ROWS.write_csv(csv_path)
+    run_incremental(csv_path, state_dir)
+    committed_files = set(os.listdir(state_dir))
+
+    with open(csv_path, "ab") as f:
+        APPENDED_ROWS.write_csv(f, include_header=False)
+    for _ in range(2):
+        extracted_df, _, _ = incremental_extract_task(csv_path, state_dir)
+        incremental_transform_task(extracted_df, state_dir)
+    assert len(os.listdir(state_dir)) == len(committed_files) + 2
+
+    extracted_df, _, _ = incremental_extract_task(csv_path, state_dir)
+
+    assert len(extracted_df) == 3
+    assert set(os.listdir(state_dir)) == committed_files | {"state.pending.json"}
+
+def test_load_task_merges_on_key(tmp_path):
+    """Test if load_task replaces existing rows sharing the merge key and keeps the others"""
+    output_file = str(tmp_path / "result.csv")
+    load_task(pl.DataFrame({"memberId": ["A", "B"]}), [1.0, 2.0], [0.1, 0.2], ["OFFER_1", "OFFER_1"], output_file=output_file)
+    load_task(pl.DataFrame({"memberId": ["B", "C"]}), [3.0, 4.0], [0.3, 0.4], ["OFFER_2", "OFFER_2"], output_file=output_file, merge_key="memberId")
+
+    result = pl.read_csv(output_file).sort("memberId")
+    assert result["memberId"].to_list() == ["A", "B", "C"]
+    assert result["ATS"].to_list() == [1.0, 3.0, 4.0]
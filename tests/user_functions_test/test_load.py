@@ -0,0 +1,52 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+from src.api.prediction_ep import Prediction
+from src.user_functions.offer_workflow_functions import combiner_task, load_task, read_result, stream_load_task
+
+@pytest.fixture
+def transform_result():
+    return pl.DataFrame({"memberId": ["A", "B", "C"], "AVG_POINTS_BOUGHT": [1.0, 2.0, 3.0]})
+
+def test_combiner_joins_series_into_columns():
+    """Test if typed results are combined into a DataFrame named after the output model's fields"""
+    ats = pl.Series("ATS Predict", [1.0, None, 3.0])
+    resp = pl.Series("RESP Predict", [0.1, 0.2, None])
+
+    combined, item_count, _ = combiner_task(ats, resp, output_format=Prediction)
+
+    assert combined.columns == ["ats_prediction", "resp_prediction"]
+    assert combined["ats_prediction"].to_list() == [1.0, None, 3.0]
+    assert item_count == 3
+
+@pytest.mark.parametrize("file_format", ["csv", "parquet", "ipc"])
+def test_load_task_writes_each_format(tmp_path, transform_result, file_format):
+    """Test if Load writes the same rows in every supported format and merges into an existing file"""
+    output_file = str(tmp_path / f"result.{file_format}")
+    predictions = (pl.Series([1.0, None, 3.0]), pl.Series([0.5, 0.5, None]), pl.Series(["OFFER_1", None, "OFFER_2"]))
+
+    load_task(transform_result, *predictions, output_file=output_file, file_format=file_format)
+    load_task(transform_result[1:2], pl.Series([9.0]), pl.Series([0.9]), pl.Series(["OFFER_2"]), output_file=output_file,
+              merge_key="memberId", file_format=file_format)
+
+    result = read_result(output_file, file_format).sort("memberId")
+    assert result["memberId"].to_list() == ["A", "B", "C"]
+    assert result["ATS"].to_list() == [1.0, 9.0, 3.0]
+    assert result["OFFER"].to_list() == ["OFFER_1", "OFFER_2", "OFFER_2"]
+
+@pytest.mark.parametrize("file_format", ["parquet", "ipc"])
+def test_stream_load_task_matches_load_task(tmp_path, transform_result, file_format):
+    """Test if streaming Load writes the same file content as Load and leaves no staged parts behind"""
+    predictions = (pl.Series([1.0, None, 3.0]), pl.Series([0.5, 0.5, None]), pl.Series(["OFFER_1", None, "OFFER_2"]))
+    load_task(transform_result, *predictions, output_file=str(tmp_path / "batch"), file_format=file_format)
+
+    batches = [[value[:2], value[2:]] for value in (transform_result, *predictions)]
+    list(stream_load_task(*batches, output_file=str(tmp_path / "stream"), file_format=file_format))
+
+    assert_frame_equal(read_result(str(tmp_path / "stream"), file_format), read_result(str(tmp_path / "batch"), file_format))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["batch", "stream"]
+
+def test_load_task_rejects_unknown_format(tmp_path, transform_result):
+    """Test if an unknown result format is refused"""
+    with pytest.raises(ValueError):
+        load_task(transform_result, [1, 2, 3], [1, 2, 3], ["a", "b", "c"], output_file=str(tmp_path / "result"), file_format="xlsx")
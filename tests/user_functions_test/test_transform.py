@@ -1,6 +1,6 @@
 from datetime import datetime
 from unittest.mock import patch
-from src.user_functions.offer_workflow_functions import transform_task
+from src.user_functions.offer_workflow_functions import lazy_extract_transform_task, lazy_transform_task, transform_task
 import polars as pl
 import pytest
 
@@ -95,4 +95,60 @@ def test_transform_task_days_since_last_transaction():
         transformed_df, processed_count, failure_count = transform_task(mock_df)
     
     days_since_last_transaction = transformed_df.select('DAYS_SINCE_LAST_TRANSACTION').item()
-    assert days_since_last_transaction == 1
\ No newline at end of file
+    assert days_since_last_transaction == 1
+
+def test_lazy_transform_matches_eager_transform(tmp_path):
+    """Test if the fused lazy query computes the same member features as transform_task"""
+    mock_df = pl.DataFrame({
+        'memberId': [1, 1, 1, 1, 2, 2, None],
+        'lastTransactionUtcTs': [
+            '2024-01-04 13:00:00',
+            '2024-01-01 10:00:00',
+            '2024-01-03 12:00:00',
+            '2024-01-02 11:00:00',
+            '2024-01-01 13:00:00',
+            '2024-01-02 14:00:00',
+            '2024-01-02 14:00:00'
+        ],
+        'lastTransactionPointsBought': [400, 100, 300, 200, 150, 250, 50],
+        'lastTransactionRevenueUSD': [40, 10, 30, 20, 15, 25, 5],
+        'lastTransactionType': ['buy', 'buy', 'redeem', 'gift', 'buy', 'gift', 'buy']
+    })
+    csv_path = tmp_path / "data.csv"
+    mock_df.write_csv(csv_path)
+
+    fixed_time = datetime(2024, 1, 6, 14, 0, 0)
+    with patch('src.user_functions.offer_workflow_functions.datetime') as mock_datetime:
+        mock_datetime.now.return_value = fixed_time
+        expected_df, _, _ = transform_task(mock_df)
+        lazy_df, _, _ = lazy_transform_task(mock_df)
+        fused_df, processed_count, _ = lazy_extract_transform_task(str(csv_path), streaming=True)
+
+    assert processed_count == 2
+    for transformed_df in (lazy_df, fused_df):
+        assert transformed_df.columns == expected_df.columns
+        assert transformed_df.sort('memberId').equals(expected_df.sort('memberId'))
+
+def test_transforms_break_timestamp_ties_by_file_order(tmp_path):
+    """Test if the eager, lazy and fused transforms all take the last rows in file order among transactions at the same time"""
+    mock_df = pl.DataFrame({
+        'memberId': [1, 1, 1, 1, 1],
+        'lastTransactionUtcTs': [
+            '2024-01-03 12:00:00',
+            '2024-01-01 10:00:00',
+            '2024-01-02 11:00:00',
+            '2024-01-02 11:00:00',
+            '2024-01-02 11:00:00'
+        ],
+        'lastTransactionPointsBought': [500, 100, 200, 300, 400],
+        'lastTransactionRevenueUSD': [50, 10, 20, 30, 40],
+        'lastTransactionType': ['buy', 'gift', 'redeem', 'buy', 'gift']
+    })
+    csv_path = tmp_path / "data.csv"
+    mock_df.write_csv(csv_path)
+
+    transformed_dfs = [transform_task(mock_df)[0], lazy_transform_task(mock_df)[0], lazy_extract_transform_task(str(csv_path), streaming=True)[0]]
+
+    for transformed_df in transformed_dfs:
+        assert transformed_df['LAST_3_TRANSACTIONS_AVG_POINTS_BOUGHT'].item() == pytest.approx(400.0)  # (500 + 400 + 300) / 3
+        assert transformed_df['LAST_3_TRANSACTIONS_AVG_REVENUE_USD'].item() == pytest.approx(40.0)
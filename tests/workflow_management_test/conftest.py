@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime
+import json
+import threading
+from unittest.mock import patch
+import polars as pl
+import pytest
+from aiohttp import web
+from src.workflow_management import OfferWorkFlowConfig
+
+# Features and scores computed from the time of the run: (now - last transaction).total_days() changes whenever the
+# clock passes the time of day of a member's last transaction, and RESP and with it OFFER are scored from it
+CLOCK_DEPENDENT_COLUMNS = ["DAYS_SINCE_LAST_TRANSACTION", "RESP", "OFFER"]
+
+class LocalServer:
+    """Minimal prediction service running on its own loop and thread for RequestTask tests."""
+    def __init__(self):
+        self.request_count = 0
+        self.peers = set()
+        self.url = None
+        self.failures_left = 0
+        self.stalled_values = set()
+        self.release_stalled = asyncio.Event()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.capacity = None
+
+    async def predict(self, request):
+        self.request_count += 1
+        self.peers.add(request.transport.get_extra_info("peername"))
+        body = await request.json()
+        return web.json_response({"prediction": body["value"] * 2})
+
+    async def predict_flaky(self, request):
+        """Answers 503 to the first failures_left requests."""
+        self.request_count += 1
+        body = await request.json()
+        if self.failures_left > 0:
+            self.failures_left -= 1
+            return web.json_response({"error": "unavailable"}, status=503)
+        return web.json_response({"prediction": body["value"] * 2})
+
+    async def predict_slow(self, request):
+        """Stalls the first request for each value in stalled_values until the server shuts down."""
+        self.request_count += 1
+        body = await request.json()
+        if body["value"] in self.stalled_values:
+            self.stalled_values.discard(body["value"])
+            await self.release_stalled.wait()
+        return web.json_response({"prediction": body["value"] * 2})
+
+    async def predict_busy(self, request):
+        """Takes 10 ms per request and answers 503 to requests beyond capacity in flight."""
+        self.request_count += 1
+        body = await request.json()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.capacity is not None and self.in_flight > self.capacity:
+                return web.json_response({"error": "overloaded"}, status=503)
+            await asyncio.sleep(0.01)
+            return web.json_response({"prediction": body["value"] * 2})
+        finally:
+            self.in_flight -= 1
+
+    async def predict_ndjson(self, request):
+        """Answers each NDJSON line with its prediction, or with an error for negative values."""
+        self.request_count += 1
+        answers = []
+        for line in (await request.read()).splitlines():
+            value = json.loads(line)["value"]
+            answers.append({"detail": "negative value"} if value < 0 else {"prediction": value * 2})
+        return web.Response(body="".join(json.dumps(answer) + "\n" for answer in answers), content_type="application/x-ndjson")
+
+    async def echo(self, request):
+        """Answers with the request body next to a second key."""
+        self.request_count += 1
+        return web.json_response({"echo": await request.json(), "server": "local"})
+
+    async def predict_batch(self, request):
+        self.request_count += 1
+        body = await request.json()
+        return web.json_response({"predictions": [row["value"] * 2 for row in body]})
+
+@pytest.fixture
+def local_server():
+    server = LocalServer()
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_post("/predict", server.predict)
+    app.router.add_post("/predict/batch", server.predict_batch)
+    app.router.add_post("/predict/flaky", server.predict_flaky)
+    app.router.add_post("/predict/slow", server.predict_slow)
+    app.router.add_post("/predict/busy", server.predict_busy)
+    app.router.add_post("/predict/ndjson", server.predict_ndjson)
+    app.router.add_post("/echo", server.echo)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    server.url = f"http://127.0.0.1:{port}"
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server
+
+    loop.call_soon_threadsafe(server.release_stalled.set)
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+@pytest.fixture
+def make_config(tmp_path):
+    """Makes OfferWorkFlowConfigs over member_data.csv writing their results and summaries to tmp_path."""
+    def make(name, api_url="http://127.0.0.1:1", **kwargs):
+        return OfferWorkFlowConfig(
+            name=name, description="Workflow test", csv_path="member_data.csv", ats_url=f"{api_url}/ml/ats/predict", resp_url=f"{api_url}/ml/resp/predict",
+            offer_url=f"{api_url}/offer/assign", result_output_path=str(tmp_path / f"{name}.csv"), performance_output_path=str(tmp_path / f"{name}.json"), **kwargs
+        )
+    return make
+
+@pytest.fixture
+def read_sorted():
+    """Reads a result file sorted by member. Runs that can't share a fixed_clock, such as shards in other processes, leave out the CLOCK_DEPENDENT_COLUMNS."""
+    def read(path, clock_dependent=True):
+        result = pl.read_csv(path)
+        return (result if clock_dependent else result.drop(CLOCK_DEPENDENT_COLUMNS)).sort("memberId")
+    return read
+
+@pytest.fixture
+def fixed_clock():
+    """Pins the time the transforms run at, so that runs made one after another compute the same features."""
+    with patch("src.user_functions.offer_workflow_functions.datetime") as mock_datetime:
+        mock_datetime.now.return_value = datetime(2024, 6, 1, 12, 0, 0)
+        yield
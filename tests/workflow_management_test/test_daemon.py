@@ -0,0 +1,49 @@
+import json
+import urllib.error
+import urllib.request
+import pytest
+from src.workflow_management import WorkFlowDaemon
+
+def write_config(tmp_path, name):
+    config = {
+        "name": name, "description": "Daemon test", "csv_path": "member_data.csv", "ats_url": "", "resp_url": "", "offer_url": "",
+        "result_output_path": str(tmp_path / f"{name}.csv"), "performance_output_path": str(tmp_path / f"{name}.json"),
+        "ats_mode": "local", "resp_mode": "local", "offer_mode": "local"
+    }
+    (tmp_path / f"{name}.config.json").write_text(json.dumps(config))
+    return str(tmp_path / f"{name}.config.json")
+
+def request(url, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+        return response.status, json.load(response)
+
+@pytest.fixture
+def daemon_url():
+    with WorkFlowDaemon(max_workers=4, max_concurrent_runs=2) as workflow_daemon:
+        yield workflow_daemon.start(port=0)
+
+def test_daemon_runs_submitted_workflows_and_returns_summaries(tmp_path, daemon_url):
+    """Test if a run submitted with wait returns its summary, and the daemon keeps serving runs of several configs"""
+    status, record = request(f"{daemon_url}/runs", {"config_path": write_config(tmp_path, "first"), "wait": True})
+
+    assert status == 200
+    assert record["status"] == "succeeded"
+    assert record["summary"]["tasks"]["Load"]["processed_item_count"] == 890
+    assert (tmp_path / "first.csv").exists()
+
+    queued = [request(f"{daemon_url}/runs", {"config_path": write_config(tmp_path, name)})[1] for name in ("first", "second")]
+    assert all(run["status"] == "queued" for run in queued)
+    finished = [request(f"{daemon_url}/runs/{run['run_id']}?wait=60")[1] for run in queued]
+    assert [run["status"] for run in finished] == ["succeeded", "succeeded"]
+    assert request(f"{daemon_url}/")[1]["runs"] == {"succeeded": 3}
+
+def test_daemon_rejects_invalid_submissions(tmp_path, daemon_url):
+    """Test if a missing config file is refused with a 400 and unknown runs get a 404"""
+    with pytest.raises(urllib.error.HTTPError) as error:
+        request(f"{daemon_url}/runs", {"config_path": str(tmp_path / "missing.json")})
+    assert error.value.code == 400
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        request(f"{daemon_url}/runs/unknown")
+    assert error.value.code == 404
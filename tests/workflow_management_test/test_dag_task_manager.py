@@ -0,0 +1,395 @@
+from functools import partial
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import polars as pl
+import pytest
+from src.workflow_management.checkpoint import CheckpointStore
+from src.workflow_management.dag_task_manager import DAGTaskManager
+from src.workflow_management.streaming import map_batches
+from src.workflow_management.task import AsyncTask, MapTask, SyncTask
+from src.user_functions.offer_workflow_functions import extract_task, lazy_transform_task
+
+def make_task(name, func, dependencies=None):
+    return SyncTask(name, func, dependencies=dependencies)
+
+def test_importing_the_dag_core_leaves_heavy_dependencies_unloaded():
+    """Test if importing DAGTaskManager loads neither polars nor aiohttp, which only the tasks and modes using them import"""
+    loaded = subprocess.run([sys.executable, "-c", "import sys; import src.workflow_management.dag_task_manager; "
+                             "print(sorted({'polars', 'aiohttp'} & set(sys.modules)))"], capture_output=True, text=True, check=True).stdout
+
+    assert loaded.strip() == "[]"
+
+def test_execute_passes_dependency_results():
+    """Test if each task receives its dependencies' results in declaration order"""
+    manager = DAGTaskManager()
+    manager.add_task(make_task("A", lambda: ([1, 2], 2, 0)))
+    manager.add_task(make_task("B", lambda: ([3], 1, 0)))
+    manager.add_task(make_task("C", lambda a, b: (a + b, len(a + b), 0), dependencies=["A", "B"]))
+
+    manager.execute()
+
+    assert manager.results["C"] == [1, 2, 3]
+    assert manager.tasks["C"].result_count == 3
+
+def test_successor_starts_before_slow_branch_finishes():
+    """Test if a task is dispatched as soon as its own dependencies finish"""
+    slow_branch_finished = threading.Event()
+    observed = {}
+
+    def slow():
+        time.sleep(0.3)
+        slow_branch_finished.set()
+        return "slow", 1, 0
+
+    def fast_successor(fast_result):
+        observed["slow_finished"] = slow_branch_finished.is_set()
+        return "fast successor", 1, 0
+
+    manager = DAGTaskManager()
+    manager.add_task(make_task("Root", lambda: ("root", 1, 0)))
+    manager.add_task(make_task("Slow", lambda root: slow(), dependencies=["Root"]))
+    manager.add_task(make_task("Fast", lambda root: ("fast", 1, 0), dependencies=["Root"]))
+    manager.add_task(make_task("Fast Successor", fast_successor, dependencies=["Fast"]))
+
+    manager.execute()
+
+    assert observed["slow_finished"] is False
+
+def test_ready_tasks_ordered_by_critical_path():
+    """Test if ready tasks with the longest remaining path are dispatched first"""
+    order = []
+
+    def record(name):
+        def func(*args):
+            order.append(name)
+            return name, 1, 0
+        return func
+
+    manager = DAGTaskManager(max_workers=1)
+    manager.add_task(make_task("Short", record("Short")))
+    manager.add_task(make_task("Long", record("Long")))
+    manager.add_task(make_task("Long Child", record("Long Child"), dependencies=["Long"]))
+
+    assert manager.critical_path_lengths() == {"Short": 1, "Long": 2, "Long Child": 1}
+
+    manager.execute()
+
+    assert order[0] == "Long"
+
+def test_add_task_rejects_unknown_dependency():
+    """Test if adding a task with an unregistered dependency fails"""
+    manager = DAGTaskManager()
+    with pytest.raises(ValueError):
+        manager.add_task(make_task("A", lambda b: (b, 1, 0), dependencies=["B"]))
+
+def test_streaming_passes_micro_batches_downstream():
+    """Test if streaming mode feeds row-wise tasks batch by batch and keeps batches aligned"""
+    seen_batch_sizes = []
+
+    def double(values):
+        seen_batch_sizes.append(len(values))
+        return [value * 2 for value in values], len(values), 0
+
+    collected = []
+
+    def sink(source_batches, doubled_batches):
+        for source, doubled in zip(source_batches, doubled_batches):
+            collected.extend(zip(source, doubled))
+            yield "sink", len(source), 0
+
+    manager = DAGTaskManager(streaming=True, stream_batch_size=4, stream_channel_capacity=1)
+    manager.add_task(make_task("Source", lambda: (list(range(10)), 10, 0)))
+    manager.add_task(SyncTask("Double", double, dependencies=["Source"], stream_func=map_batches(double)))
+    manager.add_task(SyncTask("Sink", lambda *args: None, dependencies=["Source", "Double"], stream_func=sink))
+
+    manager.execute()
+
+    assert seen_batch_sizes == [4, 4, 2]
+    assert collected == [(value, value * 2) for value in range(10)]
+    assert manager.tasks["Sink"].result_count == 10
+
+def test_streaming_stays_within_max_workers():
+    """Test if streaming mode runs its tasks on at most max_workers threads and still completes when they are fewer than the tasks"""
+    threads = set()
+
+    def double(values):
+        threads.add(threading.current_thread().name)
+        return [value * 2 for value in values], len(values), 0
+
+    def sink(source_batches, doubled_batches):
+        threads.add(threading.current_thread().name)
+        for source, _ in zip(source_batches, doubled_batches):
+            yield "sink", len(source), 0
+
+    manager = DAGTaskManager(max_workers=1, streaming=True, stream_batch_size=2, stream_channel_capacity=1)
+    manager.add_task(make_task("Source", lambda: (list(range(20)), 20, 0)))
+    manager.add_task(SyncTask("Double", double, dependencies=["Source"], stream_func=map_batches(double)))
+    manager.add_task(SyncTask("Sink", lambda *args: None, dependencies=["Source", "Double"], stream_func=sink))
+    runner = threading.Thread(target=manager.execute, daemon=True)
+    runner.start()
+    runner.join(timeout=10)
+
+    assert not runner.is_alive()
+    assert manager.tasks["Sink"].result_count == 20
+    assert len(threads) == 1
+
+def test_streaming_stage_failure_aborts_the_run():
+    """Test if a stage failing partway through a stream makes the run raise instead of truncating its consumers or hanging"""
+    def double(values):
+        if values[0] >= 4:
+            raise ValueError("bad batch")
+        return [value * 2 for value in values], len(values), 0
+
+    def sink(source_batches, doubled_batches):
+        for source, _ in zip(source_batches, doubled_batches):
+            yield "sink", len(source), 0
+
+    manager = DAGTaskManager(streaming=True, stream_batch_size=2, stream_channel_capacity=1)
+    manager.add_task(make_task("Source", lambda: (list(range(20)), 20, 0)))
+    manager.add_task(SyncTask("Double", double, dependencies=["Source"], stream_func=map_batches(double)))
+    manager.add_task(SyncTask("Sink", lambda *args: None, dependencies=["Source", "Double"], stream_func=sink))
+    errors = []
+
+    def run():
+        try:
+            manager.execute()
+        except Exception as e:
+            errors.append(e)
+
+    runner = threading.Thread(target=run, daemon=True)
+    runner.start()
+    runner.join(timeout=10)
+
+    assert not runner.is_alive()
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)
+
+def test_checkpoints_restore_unchanged_tasks(tmp_path):
+    """Test if a rerun restores unchanged tasks and reruns tasks whose inputs changed"""
+    calls = []
+
+    def source(file_path):
+        calls.append("Source")
+        return pl.read_csv(file_path), 1, 0
+
+    def count(df):
+        calls.append("Count")
+        return [len(df)], 1, 0
+
+    def build_manager(csv_path):
+        manager = DAGTaskManager(checkpoint_store=CheckpointStore(str(tmp_path / "checkpoints")))
+        manager.add_task(make_task("Source", partial(source, file_path=csv_path)))
+        manager.add_task(make_task("Count", count, dependencies=["Source"]))
+        return manager
+
+    csv_path = tmp_path / "data.csv"
+    pl.DataFrame({"a": [1, 2]}).write_csv(csv_path)
+
+    build_manager(str(csv_path)).execute()
+    rerun = build_manager(str(csv_path))
+    rerun.execute()
+
+    assert calls == ["Source", "Count"]
+    assert rerun.results["Count"] == [2]
+    assert rerun.restored_tasks == {"Source", "Count"}
+
+    pl.DataFrame({"a": [1, 2, 3]}).write_csv(csv_path)
+    changed = build_manager(str(csv_path))
+    changed.execute()
+
+    assert calls == ["Source", "Count", "Source", "Count"]
+    assert changed.results["Count"] == [3]
+
+def test_process_executor_hands_dataframes_over(tmp_path):
+    """Test if a SyncTask run in a worker process gets and returns DataFrames intact"""
+    csv_path = tmp_path / "data.csv"
+    pl.DataFrame({
+        'memberId': ['A', 'A', 'B'],
+        'lastTransactionUtcTs': ['2024-01-01 10:00:00', '2024-01-02 11:00:00', '2024-01-01 13:00:00'],
+        'lastTransactionPointsBought': [100, 200, 300],
+        'lastTransactionRevenueUSD': [10.0, 20.0, 30.0],
+        'lastTransactionType': ['buy', 'gift', 'redeem']
+    }).write_csv(csv_path)
+
+    manager = DAGTaskManager()
+    manager.add_task(SyncTask("Extract", partial(extract_task, file_path=str(csv_path)), executor="inline"))
+    manager.add_task(SyncTask("Transform", lazy_transform_task, dependencies=["Extract"], executor="process"))
+    manager.execute()
+
+    expected_df, _, _ = lazy_transform_task(extract_task(str(csv_path))[0])
+    assert manager.results["Transform"].drop("DAYS_SINCE_LAST_TRANSACTION").sort("memberId").equals(
+        expected_df.drop("DAYS_SINCE_LAST_TRANSACTION").sort("memberId")
+    )
+    assert manager.tasks["Transform"].result_count == 2
+
+def test_checkpoints_rerun_consumers_of_changed_results(tmp_path):
+    """Test if a task is rerun when an upstream task that was not checkpointed returns a different result"""
+    outputs = iter([([None, 2], 2, 1), ([1, 2], 2, 0)])
+
+    def build_manager():
+        manager = DAGTaskManager(checkpoint_store=CheckpointStore(str(tmp_path / "checkpoints")))
+        manager.add_task(make_task("Flaky", lambda: next(outputs)))
+        manager.add_task(make_task("Down", lambda values: (list(values), len(values), 0), dependencies=["Flaky"]))
+        return manager
+
+    build_manager().execute()
+    rerun = build_manager()
+    rerun.execute()
+
+    assert rerun.results["Down"] == [1, 2]
+    assert rerun.restored_tasks == set()
+
+def test_tasks_opted_out_of_checkpoints_always_run(tmp_path):
+    """Test if a task with checkpoint=False runs on every rerun, while its unchanged consumers are still restored"""
+    calls = []
+
+    def write(path):
+        calls.append("Write")
+        with open(path, "w") as f:
+            f.write("done")
+        return "write", 1, 0
+
+    output_path = tmp_path / "output.txt"
+
+    def build_manager():
+        manager = DAGTaskManager(checkpoint_store=CheckpointStore(str(tmp_path / "checkpoints")))
+        manager.add_task(SyncTask("Write", partial(write, path=str(output_path)), checkpoint=False))
+        manager.add_task(make_task("After", lambda result: (result, 1, 0), dependencies=["Write"]))
+        return manager
+
+    build_manager().execute()
+    output_path.unlink()
+    rerun = build_manager()
+    rerun.execute()
+
+    assert calls == ["Write", "Write"]
+    assert output_path.read_text() == "done"
+    assert rerun.restored_tasks == {"After"}
+
+def test_add_task_rejects_process_executor_for_async_tasks():
+    """Test if only SyncTasks may run in a worker process"""
+    manager = DAGTaskManager()
+    with pytest.raises(ValueError):
+        manager.add_task(AsyncTask("Async", lambda: None, executor="process"))
+
+def test_trace_records_task_wait_and_run_times():
+    """Test if the trace has one slice per task and a wait slice for tasks queued behind a busy pool"""
+    manager = DAGTaskManager(max_workers=1)
+    manager.add_task(make_task("A", lambda: (time.sleep(0.05), 1, 0)))
+    manager.add_task(make_task("B", lambda: (time.sleep(0.05), 1, 0)))
+
+    manager.execute()
+    events = manager.get_trace()["traceEvents"]
+
+    slices = {event["name"]: event for event in events if event["ph"] == "X"}
+    assert set(slices) == {"A", "B"}
+    assert slices["B"]["ts"] >= slices["A"]["ts"] + slices["A"]["dur"]
+    assert slices["B"]["args"]["processed_item_count"] == 1
+    wait_starts = {event["name"]: event["ts"] for event in events if event["ph"] == "b"}
+    wait_ends = {event["name"]: event["ts"] for event in events if event["ph"] == "e"}
+    assert wait_ends["B"] - wait_starts["B"] >= 0.05 * 1e6
+    assert manager.get_summary()["tasks"]["B"]["wait_time (sec)"] >= 0.05
+    assert manager.get_summary()["tasks"]["A"]["wait_time (sec)"] < 0.05
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_map_task_partitions_run_on_the_pool(max_workers):
+    """Test if map task partitions run on the task pool, and still complete when the task holds the pool's only worker"""
+    threads = set()
+
+    def record_thread(df):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+        return df, len(df), 0
+
+    manager = DAGTaskManager(max_workers=max_workers)
+    manager.add_task(make_task("Extract", lambda: (pl.DataFrame({"value": list(range(8))}), 8, 0)))
+    manager.add_task(MapTask(make_task("Transform", record_thread, dependencies=["Extract"]), partition_rows=2))
+
+    manager.execute()
+
+    assert manager.results["Transform"]["value"].to_list() == list(range(8))
+    assert manager.get_summary()["tasks"]["Transform"]["partitions"] == min(4, max_workers)
+    assert len(threads) == min(4, max_workers)
+
+def test_results_released_once_last_consumer_starts():
+    """Test if a result is dropped as soon as every task consuming it has started, and sink results are kept"""
+    held_by_last_consumer = {}
+
+    def last_consumer(source):
+        held_by_last_consumer["Source"] = "Source" in manager.results
+        return source + 1, 1, 0
+
+    manager = DAGTaskManager(max_workers=1)
+    manager.add_task(make_task("Source", lambda: (1, 1, 0)))
+    manager.add_task(make_task("Short", last_consumer, dependencies=["Source"]))
+    manager.add_task(make_task("Long", lambda source: (source, 1, 0), dependencies=["Source"]))
+    manager.add_task(make_task("Long Child", lambda long: (long, 1, 0), dependencies=["Long"]))
+
+    manager.execute()
+
+    assert held_by_last_consumer == {"Source": False}
+    assert set(manager.results) == {"Short", "Long Child"}
+    assert manager.tasks["Source"].result is None and manager.tasks["Long"].result is None
+    assert manager.tasks["Short"].result == 2
+
+def test_memory_budget_spills_results_waiting_for_consumers(tmp_path):
+    """Test if results over the memory budget are spilled while their consumer waits, and come back intact"""
+    frame = pl.DataFrame({"id": list(range(1000)), "name": [f"member {i}" for i in range(1000)]})
+    received = {}
+
+    def consume(df, series, _):
+        received.update(df=df, series=series)
+        return len(df), 1, 0
+
+    manager = DAGTaskManager(max_workers=2, memory_budget=0, spill_dir=str(tmp_path / "spill"))
+    manager.add_task(make_task("Frame", lambda: (frame, 1000, 0)))
+    manager.add_task(make_task("Series", lambda: (frame["id"].alias("score"), 1000, 0)))
+    manager.add_task(make_task("Slow", lambda: (time.sleep(0.2), 1, 0)))
+    manager.add_task(make_task("Consume", consume, dependencies=["Frame", "Series", "Slow"]))
+
+    manager.execute()
+
+    assert received["df"].equals(frame)
+    assert received["series"].equals(frame["id"].alias("score"))
+    summary = manager.get_summary()
+    assert summary["tasks"]["Frame"]["spilled"] and summary["tasks"]["Series"]["spilled"]
+    assert summary["peak_result_size (MB)"] > 0
+    assert list(manager.results) == ["Consume"]
+    assert not any(files for _, _, files in os.walk(tmp_path / "spill"))
+
+def test_profiled_tasks_report_cpu_and_memory(tmp_path):
+    """Test if only the profiled tasks get CPU and memory figures in the summary, and their CPU profiles are written"""
+    def allocate():
+        blocks = [bytearray(1024) for _ in range(2000)]
+        return blocks, len(blocks), 0
+
+    manager = DAGTaskManager(profile_tasks=["Allocate"], profile_top=3)
+    manager.add_task(make_task("Allocate", allocate))
+    manager.add_task(make_task("Count", lambda blocks: (len(blocks), 1, 0), dependencies=["Allocate"]))
+
+    manager.execute()
+    paths = manager.write_profiles(str(tmp_path / "profiles"))
+
+    tasks = manager.get_summary()["tasks"]
+    assert "profile" not in tasks["Count"]
+    profile = tasks["Allocate"]["profile"]
+    assert profile["traced_peak (MB)"] >= profile["traced_net (MB)"] >= 1.9
+    assert "test_dag_task_manager.py" in profile["top_allocations"][0]["location"]
+    assert 0 < len(profile["top_functions"]) <= 3
+    assert paths == [profile["cpu_profile"]] and os.path.getsize(paths[0]) > 0
+    assert not tracemalloc.is_tracing()
+
+def test_profile_without_memory_skips_tracemalloc():
+    """Test if every task is profiled with "*", without tracemalloc figures when memory profiling is off"""
+    manager = DAGTaskManager(profile_tasks=["*"], profile_memory=False)
+    manager.add_task(make_task("A", lambda: (sum(range(10000)), 1, 0)))
+    manager.add_task(make_task("B", lambda a: (a, 1, 0), dependencies=["A"]))
+
+    manager.execute()
+
+    for task in manager.get_summary()["tasks"].values():
+        assert "top_functions" in task["profile"] and "cpu_time (sec)" in task["profile"]
+        assert "traced_peak (MB)" not in task["profile"]
@@ -0,0 +1,41 @@
+import pickle
+import polars as pl
+from src.workflow_management.failures import FailureLog, RowFailure, read_failures
+
+def test_failure_log_summarises_errors_by_task():
+    """Test if the stats count failed rows once per key and errors per task"""
+    failure_log = FailureLog("memberId")
+    failure_log.record("ATS Predict", 1, RowFailure("HTTP 503", attempts=3))
+    failure_log.record("Offer Recommendation", 1, RowFailure("MissingInput", attempts=0))
+    failure_log.record("ATS Predict", 2, RowFailure("TimeoutError"))
+
+    assert failure_log.get_stats() == {
+        "failed_rows": 2,
+        "errors": {"ATS Predict": {"HTTP 503": 1, "TimeoutError": 1}, "Offer Recommendation": {"MissingInput": 1}}
+    }
+    assert len(pickle.loads(pickle.dumps(failure_log))) == 3
+
+def test_save_replaces_ledger_of_full_runs(tmp_path):
+    """Test if a run scoring every row replaces the ledger"""
+    path = str(tmp_path / "failures.csv")
+    first_run = FailureLog("memberId")
+    first_run.record("ATS Predict", 1, RowFailure("HTTP 503"))
+    first_run.save(path, pl.Int64)
+
+    FailureLog("memberId").save(path, pl.Int64)
+
+    assert read_failures(path, pl.Int64).height == 0
+
+def test_save_merges_ledger_of_partial_runs(tmp_path):
+    """Test if a run scoring some rows keeps the failures of the others and adds up the attempts of rows failing again"""
+    path = str(tmp_path / "failures.csv")
+    first_run = FailureLog("memberId")
+    for key in (1, 2, 3):
+        first_run.record("ATS Predict", key, RowFailure("HTTP 503", attempts=2))
+    first_run.save(path, pl.Int64)
+
+    repair_run = FailureLog("memberId")
+    repair_run.record("ATS Predict", 2, RowFailure("TimeoutError", attempts=1))
+    repair_run.save(path, pl.Int64, scored_keys=pl.Series([1, 2]))
+
+    assert read_failures(path, pl.Int64).sort("memberId").rows() == [(2, "ATS Predict", "TimeoutError", 3), (3, "ATS Predict", "HTTP 503", 2)]
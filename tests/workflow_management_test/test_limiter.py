@@ -0,0 +1,47 @@
+import asyncio
+import time
+from src.workflow_management.limiter import ConcurrencyLimiter, TokenBucket
+
+def test_adaptive_limit_follows_aimd():
+    """Test if the limit doubles per window of timely answers until the first decrease, then halves once per round trip and grows by one"""
+    limiter = ConcurrencyLimiter(max_limit=100, adaptive=True, initial_limit=10)
+    for _ in range(10):
+        limiter.observe(0.01)
+    assert limiter.limit == 20
+
+    limiter.observe(0.01, overloaded=True)
+    limiter.observe(0.01, overloaded=True)
+    assert (limiter.limit, limiter.decreases) == (10, 1)
+
+    for _ in range(10):
+        limiter.observe(0.01)
+    assert limiter.limit == 11
+
+def test_fixed_limit_bounds_slots():
+    """Test if a non-adaptive limiter lets max_limit callers in at once and ignores request outcomes"""
+    limiter = ConcurrencyLimiter(max_limit=2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with limiter:
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*[request() for _ in range(10)])
+
+    asyncio.run(run())
+    limiter.observe(1.0, overloaded=True)
+    assert (peak, limiter.in_flight, limiter.limit) == (2, 0, 2)
+
+def test_token_bucket_spaces_requests():
+    """Test if a token bucket lets a burst through at once and spaces the remaining requests out to its rate"""
+    bucket = TokenBucket(rate=100, burst=5)
+
+    async def run():
+        await asyncio.gather(*[bucket.take() for _ in range(25)])
+
+    start_time = time.perf_counter()
+    asyncio.run(run())
+    assert 0.18 <= time.perf_counter() - start_time < 0.5
@@ -0,0 +1,18 @@
+from src.workflow_management.metrics import LatencyHistogram
+
+def test_latency_histogram_percentiles_within_bucket_width():
+    """Test if histogram percentiles are within one bucket of the exact values"""
+    histogram = LatencyHistogram(growth=1.1)
+    for millisecond in range(1, 1001):
+        histogram.record(millisecond / 1000)
+
+    stats = histogram.get_stats()
+
+    assert stats["count"] == 1000
+    assert stats["max"] == 1.0
+    for quantile, exact in ((0.5, 0.5), (0.95, 0.95), (0.99, 0.99)):
+        assert exact <= histogram.percentile(quantile) <= exact * 1.1
+
+def test_latency_histogram_empty():
+    """Test if an empty histogram reports no percentiles"""
+    assert LatencyHistogram().get_stats() == {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
@@ -0,0 +1,66 @@
+import time
+import polars as pl
+from src.workflow_management.response_cache import CACHE_MISS, ResponseCache
+from src.workflow_management.task import RequestTask
+
+def test_key_is_canonical():
+    """Test if keys ignore dictionary ordering but depend on the endpoint"""
+    assert ResponseCache.make_key("/a", {"x": 1, "y": 2}) == ResponseCache.make_key("/a", {"y": 2, "x": 1})
+    assert ResponseCache.make_key("/a", {"x": 1}) != ResponseCache.make_key("/b", {"x": 1})
+
+def test_memory_lru_eviction():
+    """Test if the least recently used entry is evicted first"""
+    cache = ResponseCache(max_memory_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is CACHE_MISS
+    assert cache.get("a") == 1
+    assert cache.get_stats()["evictions"] == 1
+
+def test_disk_store_survives_restart_and_expires(tmp_path):
+    """Test if on-disk entries are reused by a new cache and expire after the TTL"""
+    disk_path = str(tmp_path / "cache.db")
+    cache = ResponseCache(disk_path=disk_path)
+    cache.put("a", 0.5)
+    cache.close()
+
+    reopened = ResponseCache(disk_path=disk_path, ttl=60)
+    assert reopened.get("a") == 0.5
+    reopened.close()
+
+    expired = ResponseCache(disk_path=disk_path, ttl=0.01)
+    time.sleep(0.05)
+    assert expired.get("a") is CACHE_MISS
+    expired.close()
+
+def test_disk_store_counts_rewritten_keys_once(tmp_path):
+    """Test if putting a stored key again replaces its value without adding to the disk entry count or evicting"""
+    cache = ResponseCache(disk_path=str(tmp_path / "cache.db"), max_disk_entries=2)
+    for value in range(5):
+        cache.put("a", value)
+    cache.put("b", 1)
+
+    assert cache.get_stats()["disk_entries"] == 2
+    assert cache.get_stats()["evictions"] == 0
+    cache.close()
+
+    reopened = ResponseCache(disk_path=str(tmp_path / "cache.db"))
+    assert reopened.get("a") == 4
+    reopened.close()
+
+def test_request_task_serves_hits_and_coalesces_duplicates(local_server):
+    """Test if identical rows are sent once and repeated runs are answered from the cache"""
+    cache = ResponseCache()
+    task = RequestTask("Predict", f"{local_server.url}/predict", response_cache=cache, request_fields=["value"])
+    data = pl.DataFrame({"memberId": ["A", "B", "C"], "value": [1, 1, 2]})
+
+    assert task.execute([data]) == [2, 2, 4]
+    assert local_server.request_count == 2
+    assert task.get_metrics()["cache"] == {"hits": 0, "misses": 2, "coalesced_requests": 1}
+
+    assert task.execute([data]) == [2, 2, 4]
+    assert local_server.request_count == 2
+    assert task.get_metrics()["cache"]["hits"] == 3
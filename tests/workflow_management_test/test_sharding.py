@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+import polars as pl
+from src.workflow_management import OfferWorkFlow, ShardedWorkFlow, run_shard_worker
+from src.workflow_management.sharding import _claim, merge_summaries, partition_csv, shard_path
+
+def test_partition_csv_keeps_members_within_one_shard(tmp_path):
+    """Test if partitioning keeps every row, places all rows of a member in the same shard and gives every shard a header"""
+    row_counts = partition_csv("member_data.csv", 4, str(tmp_path), batch_size=1000)
+
+    shards = [pl.read_csv(shard_path(str(tmp_path), shard, "input.csv"), infer_schema_length=0) for shard in range(4)]
+    original = pl.read_csv("member_data.csv", infer_schema_length=0)
+    assert row_counts == [shard.height for shard in shards]
+    assert sum(row_counts) == original.height
+    assert all(shard.columns == original.columns for shard in shards)
+    member_shards = pl.concat([shard.select("memberId").unique().with_columns(shard=pl.lit(index)) for index, shard in enumerate(shards)])
+    assert member_shards["memberId"].is_duplicated().sum() == 0
+    assert pl.concat(shards).sort(pl.all()).equals(original.sort(pl.all()))
+
+def test_merge_summaries_sums_counts_and_takes_slowest_shard():
+    """Test if task counts and status codes are summed across shards, times are those of the slowest shard and latency percentiles are dropped"""
+    def shard_summary(count, time, codes):
+        return {"tasks": {"ATS Predict": {"status": "Success", "execution_time (sec)": time, "processed_item_count": count, "item_failure_count": 0,
+                                          "throughput (item/sec)": count / time, "wait_time (sec)": 0.1,
+                                          "requests": {"latency (sec)": {"count": count, "p95": 0.2}, "bytes_sent": count * 10, "status_codes": codes}}}}
+
+    summary = merge_summaries([shard_summary(100, 2.0, {"200": 100}), shard_summary(50, 4.0, {"200": 48, "503": 2})])
+
+    task = summary["tasks"]["ATS Predict"]
+    assert task["execution_time (sec)"] == 4.0
+    assert task["processed_item_count"] == 150
+    assert task["throughput (item/sec)"] == 37.5
+    assert task["requests"] == {"bytes_sent": 1500, "status_codes": {"200": 148, "503": 2}}
+
+def test_claim_takes_over_stale_claims(tmp_path):
+    """Test if a shard claimed by a live worker can't be claimed again, unless its claim stopped being refreshed"""
+    os.makedirs(shard_path(str(tmp_path), 0))
+    assert _claim(str(tmp_path), 0, stale_after=60)
+    assert not _claim(str(tmp_path), 0, stale_after=60)
+
+    stale_time = time.time() - 120
+    os.utime(shard_path(str(tmp_path), 0, "claim"), (stale_time, stale_time))
+    assert _claim(str(tmp_path), 0, stale_after=60)
+
+LOCAL_MODES = {"ats_mode": "local", "resp_mode": "local", "offer_mode": "local"}
+
+def test_sharded_workflow_matches_unsharded_run(tmp_path, make_config, read_sorted):
+    """Test if a run over shards in worker processes writes the results of a single run and sums their counts"""
+    OfferWorkFlow(make_config("single", **LOCAL_MODES)).start()
+    workflow = ShardedWorkFlow(make_config("sharded", shard_count=3, shard_workers=2, **LOCAL_MODES))
+    workflow.start()
+
+    # The shards run in worker processes, out of reach of a fixed clock
+    assert read_sorted(tmp_path / "sharded.csv", clock_dependent=False).equals(read_sorted(tmp_path / "single.csv", clock_dependent=False))
+    assert sum(shard["input_row_count"] for shard in workflow.shard_summaries) == pl.read_csv("member_data.csv").height
+    assert workflow.summary["tasks"]["Load"]["processed_item_count"] == pl.read_csv(tmp_path / "single.csv").height
+    assert os.path.exists(tmp_path / "sharded.trace.json")
+
+def test_sharded_workflow_waits_for_external_workers(tmp_path, make_config):
+    """Test if a coordinator without local workers merges the shards run by a worker joining through the shard directory"""
+    workflow = ShardedWorkFlow(make_config("sharded", shard_count=2, shard_workers=0, shard_dir=str(tmp_path / "shards"), **LOCAL_MODES))
+    coordinator = threading.Thread(target=workflow.start)
+    coordinator.start()
+
+    assert run_shard_worker(str(tmp_path / "shards"), poll_interval=0.05) == 2
+    coordinator.join()
+    assert pl.read_csv(tmp_path / "sharded.csv").height == workflow.summary["tasks"]["Load"]["processed_item_count"]
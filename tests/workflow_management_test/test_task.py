@@ -0,0 +1,275 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+import polars as pl
+from src.workflow_management.failures import FailureLog
+from src.workflow_management.http_client import HttpClient
+from src.workflow_management.request_policy import RequestPolicy
+from src.workflow_management.task import ExpressionTask, MapTask, RequestTask, SyncTask
+
+def test_request_task_posts_every_row(local_server):
+    """Test if RequestTask returns one result per row in input order"""
+    task = RequestTask("Predict", f"{local_server.url}/predict")
+
+    result = task.execute([pl.DataFrame({"value": [1, 2, 3]})])
+
+    assert result == [2, 4, 6]
+    assert task.result_count == 3
+    assert task.failure_count == 0
+
+def test_request_task_counts_failures(local_server):
+    """Test if failed requests are counted and returned as None"""
+    task = RequestTask("Predict", f"{local_server.url}/missing")
+
+    result = task.execute([pl.DataFrame({"value": [1, 2]})])
+
+    assert result == [None, None]
+    assert task.failure_count == 2
+
+def test_request_task_returns_typed_series(local_server):
+    """Test if a RequestTask given a dtype returns a Series of that type with nulls for failed rows"""
+    task = RequestTask("Predict", f"{local_server.url}/predict/flaky", dtype=pl.Float64, max_concurrent_requests=1)
+    local_server.failures_left = 1
+
+    result = task.execute([pl.DataFrame({"value": [1, 2, 3]})])
+
+    assert result.dtype == pl.Float64
+    assert result.to_list() == [None, 4.0, 6.0]
+    assert task.failure_count == 1
+
+def test_request_task_counts_results_not_of_dtype_as_failures(local_server):
+    """Test if results that can't be converted to the task's dtype are nulls counted as failures"""
+    task = RequestTask("Predict", f"{local_server.url}/predict", dtype=pl.Int64)
+
+    result = task.execute([[{"value": 1}, {"value": "a"}]])
+
+    assert result.to_list() == [2, None]
+    assert task.failure_count == 1
+
+def test_request_task_encodes_dataframe_rows_as_json(local_server):
+    """Test if rows bulk encoded from a DataFrame reach the server as the same JSON objects, special characters included"""
+    rows = {"text": ["line\nbreak", None, "quote \" and \u2028"], "amount": [1.5, 2.0, None]}
+    task = RequestTask("Echo", f"{local_server.url}/echo", request_fields=["text", "amount"], response_key="echo")
+
+    result = task.execute([pl.DataFrame({**rows, "ignored": [1, 2, 3]})])
+
+    assert result == pl.DataFrame(rows).to_dicts()
+
+def test_request_task_reads_response_key(local_server):
+    """Test if results are read from the response key, or from the first key when no response key is given"""
+    assert RequestTask("Predict", f"{local_server.url}/predict", response_key="prediction").execute([pl.DataFrame({"value": [1, 2]})]) == [2, 4]
+    assert RequestTask("Batch", f"{local_server.url}/predict/batch", batch_size=2, response_key="predictions").execute([pl.DataFrame({"value": [1, 2, 3]})]) == [2, 4, 6]
+    assert RequestTask("Echo", f"{local_server.url}/echo").execute([[{"value": 1}]]) == [{"value": 1}]
+
+def test_request_tasks_share_http_client_connections(local_server):
+    """Test if request tasks sharing an HttpClient reuse its loop and keep-alive connections"""
+    http_client = HttpClient(connection_limit=1)
+    first = RequestTask("First", f"{local_server.url}/predict", http_client=http_client)
+    second = RequestTask("Second", f"{local_server.url}/predict", http_client=http_client)
+    try:
+        assert first.execute([pl.DataFrame({"value": [1, 2]})]) == [2, 4]
+        assert second.execute([pl.DataFrame({"value": [3]})]) == [6]
+    finally:
+        http_client.close()
+
+    assert local_server.request_count == 3
+    assert len(local_server.peers) == 1
+
+def test_request_task_batch_mode_chunks_rows(local_server):
+    """Test if batch mode sends batch_size rows per request and keeps results in row order"""
+    task = RequestTask("Predict", f"{local_server.url}/predict/batch", batch_size=2)
+
+    result = task.execute([pl.DataFrame({"value": [1, 2, 3, 4, 5]})])
+
+    assert result == [2, 4, 6, 8, 10]
+    assert local_server.request_count == 3
+
+def test_request_task_ndjson_batches_fail_rows_alone(local_server):
+    """Test if NDJSON batches are answered line by line and a line without a result fails only its row"""
+    task = RequestTask("Predict", f"{local_server.url}/predict/ndjson", batch_size=3, batch_format="ndjson", response_key="prediction", dtype=pl.Int64)
+
+    result = task.execute([pl.DataFrame({"value": [1, 2, -3, 4, 5]})])
+
+    assert result.to_list() == [2, 4, None, 8, 10]
+    assert (local_server.request_count, task.failure_count) == (2, 1)
+
+def test_request_task_records_request_stats(local_server):
+    """Test if RequestTask reports latency percentiles, payload sizes and status codes of its requests"""
+    task = RequestTask("Predict", f"{local_server.url}/predict/flaky", max_concurrent_requests=1)
+    local_server.failures_left = 1
+
+    task.execute([pl.DataFrame({"value": [1, 2, 3]})])
+    stats = task.get_metrics()["requests"]
+
+    assert stats["status_codes"] == {"200": 2, "503": 1}
+    assert stats["latency (sec)"]["count"] == 3
+    assert 0 < stats["latency (sec)"]["p50"] <= stats["latency (sec)"]["p99"] <= stats["latency (sec)"]["max"]
+    assert stats["queue_wait (sec)"]["count"] == 3
+    assert stats["bytes_sent"] == 3 * len('{"value":1}')
+    assert stats["bytes_received"] > 0
+
+def test_request_task_retries_server_errors(local_server):
+    """Test if 5xx answers are retried up to max_retries times"""
+    local_server.failures_left = 2
+    task = RequestTask("Predict", f"{local_server.url}/predict/flaky", policy=RequestPolicy(max_retries=2, backoff_base=0.01))
+
+    assert task.execute([pl.DataFrame({"value": [1]})]) == [2]
+    assert task.get_metrics()["requests"]["retries"] == 2
+
+    local_server.failures_left = 3
+    assert task.execute([pl.DataFrame({"value": [1]})]) == [None]
+    assert task.failure_count == 1
+
+def test_request_task_deadline_bounds_stuck_requests(local_server):
+    """Test if a stuck request fails once the task deadline has passed instead of holding up the stage"""
+    local_server.stalled_values = {2}
+    task = RequestTask("Predict", f"{local_server.url}/predict/slow", policy=RequestPolicy(deadline=0.3))
+
+    start_time = time.perf_counter()
+    result = task.execute([pl.DataFrame({"value": [1, 2, 3]})])
+
+    assert time.perf_counter() - start_time < 2
+    assert result == [2, None, 6]
+    assert task.failure_count == 1
+    assert task.get_metrics()["requests"]["timeouts"] == 1
+
+def test_streamed_request_task_deadline_bounds_the_whole_stream(local_server):
+    """Test if the micro-batches of a streamed RequestTask all end within one deadline instead of each getting their own"""
+    local_server.stalled_values = {1, 2, 3}
+    task = RequestTask("Predict", f"{local_server.url}/predict/slow", policy=RequestPolicy(deadline=0.4))
+
+    start_time = time.perf_counter()
+    batches = list(task.stream([[pl.DataFrame({"value": [value]}) for value in (1, 2, 3)]], batch_size=1))
+
+    assert time.perf_counter() - start_time < 1
+    assert batches == [[None]] * 3
+    assert task.failure_count == 3
+
+def test_request_task_hedges_slow_requests(local_server):
+    """Test if a request pending past the observed latency quantile is duplicated and the first answer is kept"""
+    local_server.stalled_values = {100}
+    task = RequestTask("Predict", f"{local_server.url}/predict/slow", max_concurrent_requests=1,
+                       policy=RequestPolicy(timeout=10, hedge_quantile=0.95, hedge_min_samples=5))
+    task.execute([pl.DataFrame({"value": list(range(10))})])
+    # Hedging starts during the warm-up, so a slow warm-up request may have been hedged as well
+    warm_up_counts = (task.hedged_requests, task.hedge_wins, task.retries)
+
+    start_time = time.perf_counter()
+    result = task.execute([pl.DataFrame({"value": [100]})])
+
+    assert time.perf_counter() - start_time < 2
+    assert result == [200]
+    counts = (task.hedged_requests, task.hedge_wins, task.retries)
+    assert tuple(count - warm_up_count for count, warm_up_count in zip(counts, warm_up_counts)) == (1, 1, 0)
+
+def test_request_task_limits_requests_in_flight(local_server):
+    """Test if at most max_concurrent_requests requests of a task are in flight at once"""
+    task = RequestTask("Predict", f"{local_server.url}/predict/busy", max_concurrent_requests=3)
+
+    assert task.execute([pl.DataFrame({"value": list(range(20))})]) == [value * 2 for value in range(20)]
+    assert local_server.max_in_flight == 3
+
+def test_request_tasks_share_a_limiter_per_host(local_server):
+    """Test if concurrent tasks sending to one host through a shared HttpClient stay within one concurrency limit together"""
+    http_client = HttpClient()
+    tasks = [RequestTask(name, f"{local_server.url}/predict/busy", max_concurrent_requests=4, http_client=http_client) for name in ("First", "Second")]
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(lambda task: task.execute([pl.DataFrame({"value": list(range(30))})]), tasks))
+    finally:
+        http_client.close()
+
+    assert results == [[value * 2 for value in range(30)]] * 2
+    assert tasks[0].limiter is tasks[1].limiter
+    assert local_server.max_in_flight == 4
+
+def test_request_task_adapts_concurrency_to_host_capacity(local_server):
+    """Test if an adaptive limit backs off when the host sheds load and every row still gets its answer through retries"""
+    local_server.capacity = 5
+    task = RequestTask("Predict", f"{local_server.url}/predict/busy", max_concurrent_requests=50,
+                       policy=RequestPolicy(max_retries=10, backoff_base=0.01, adaptive_concurrency=True))
+
+    assert task.execute([pl.DataFrame({"value": list(range(300))})]) == [value * 2 for value in range(300)]
+    request_metrics = task.get_metrics()["requests"]
+    assert request_metrics["limit_decreases"] >= 1
+    assert request_metrics["concurrency_limit"] < 50
+    assert request_metrics["status_codes"]["503"] < 150
+
+def test_expression_task_scores_rows_in_process():
+    """Test if ExpressionTask evaluates its expression per row over DataFrames and lists of dicts"""
+    task = ExpressionTask("Double", (pl.col("value") * 2).alias("doubled"))
+
+    assert task.execute([pl.DataFrame({"value": [1, 2, None]})]) == [2, 4, None]
+    assert task.failure_count == 1
+    assert task.execute([[{"value": 3}, {"value": 4}]]) == [6, 8]
+
+def test_expression_task_returns_typed_series():
+    """Test if an ExpressionTask given a dtype returns a Series of that type, also for empty inputs"""
+    task = ExpressionTask("Double", pl.col("value") * 2, dtype=pl.Float64)
+
+    result = task.execute([pl.DataFrame({"value": [1, None]})])
+
+    assert (result.name, result.dtype, result.to_list()) == ("Double", pl.Float64, [2.0, None])
+    assert task.failure_count == 1
+    assert task.execute([[]]).dtype == pl.Float64
+
+def test_map_task_concatenates_row_chunks_in_order():
+    """Test if a MapTask over row chunks returns the wrapped task's result for the whole input, in input order, with summed counts"""
+    task = MapTask(SyncTask("Double", lambda df, values: (df["value"] * 2 + pl.Series(values), len(df), 1)), partitions=3)
+
+    result = task.execute([pl.DataFrame({"value": list(range(10))}), [0] * 10])
+
+    assert result.to_list() == [value * 2 for value in range(10)]
+    assert task.result_count == 10
+    assert task.failure_count == 3
+    assert task.get_metrics() == {"partitions": 3}
+
+def test_map_task_keeps_keys_within_one_partition():
+    """Test if hash partitioning hands every row of a key to the same partition"""
+    def count_per_key(df):
+        counts = df.group_by("key").len()
+        return counts, len(counts), 0
+
+    task = MapTask(SyncTask("Count", count_per_key), partitions=4, partition_by="key")
+
+    result = task.execute([pl.DataFrame({"key": [index % 7 for index in range(100)]})])
+
+    assert result.sort("key")["len"].to_list() == [15, 15, 14, 14, 14, 14, 14]
+
+def test_map_task_splits_requests(local_server):
+    """Test if a RequestTask split into partitions posts every row and keeps row order"""
+    task = MapTask(RequestTask("Predict", f"{local_server.url}/predict", dtype=pl.Int64), partition_rows=2)
+    task.parallelism = 4
+
+    result = task.execute([pl.DataFrame({"value": [1, 2, 3, 4, 5]})])
+
+    assert result.to_list() == [2, 4, 6, 8, 10]
+    assert task.get_metrics()["partitions"] == 3
+    assert task.get_metrics()["requests"]["status_codes"] == {"200": 5}
+
+def test_map_task_partitions_share_the_request_deadline(local_server):
+    """Test if the partitions of a MapTask run, even one after another, all end within one request deadline"""
+    local_server.stalled_values = {1, 2, 3, 4}
+    task = MapTask(RequestTask("Predict", f"{local_server.url}/predict/slow", policy=RequestPolicy(deadline=0.4)), partitions=4)
+
+    start_time = time.perf_counter()
+    result = task.execute([pl.DataFrame({"value": [1, 2, 3, 4]})])
+
+    assert time.perf_counter() - start_time < 1
+    assert result == [None] * 4
+    assert task.failure_count == 4
+    assert task.get_metrics()["requests"]["timeouts"] == 1
+
+def test_request_task_records_failed_rows_by_key(local_server):
+    """Test if failed rows are recorded by key with their error and attempts, and rows with null fields are not sent"""
+    failure_log = FailureLog("memberId")
+    task = RequestTask("Predict", f"{local_server.url}/predict/flaky", max_concurrent_requests=1, request_fields=["value"], failure_log=failure_log,
+                       skip_null_rows=True, policy=RequestPolicy(max_retries=1, backoff_base=0.01))
+    local_server.failures_left = 3
+
+    result = task.execute([pl.DataFrame({"memberId": [10, 11, 12, 13], "value": [1, 2, None, 4]})])
+
+    assert result == [None, 4, None, 8]
+    assert task.failure_count == 2
+    assert local_server.request_count == 5
+    failures = failure_log.to_frame().sort("memberId")
+    assert failures.rows() == [(10, "Predict", "HTTP 503", 2), (12, "Predict", "MissingInput", 0)]
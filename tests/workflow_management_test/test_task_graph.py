@@ -0,0 +1,35 @@
+import pytest
+from src.workflow_management.task_graph import CycleError, TaskGraph
+
+def make_graph(edges):
+    graph = TaskGraph()
+    for source, target in edges:
+        graph.add_edge(source, target)
+    return graph
+
+def test_topological_order_keeps_insertion_order_between_independent_tasks():
+    """Test if every task comes after its dependencies and independent tasks keep the order they were added in"""
+    graph = TaskGraph()
+    for name in ["A", "B", "C", "D"]:
+        graph.add_node(name)
+    for source, target in [("C", "A"), ("A", "D"), ("B", "D")]:
+        graph.add_edge(source, target)
+
+    assert [graph.names[node] for node in graph.topological_order()] == ["B", "C", "A", "D"]
+    assert list(graph.successors("A")) == ["D"]
+    assert graph.in_degree("D") == 2
+
+def test_topological_order_reports_a_cycle():
+    """Test if a cycle raises a CycleError naming the tasks along it, and tasks feeding the cycle are left out"""
+    graph = make_graph([("Extract", "A"), ("A", "B"), ("B", "C"), ("C", "A"), ("C", "Load")])
+
+    with pytest.raises(CycleError, match="form a cycle") as error:
+        graph.topological_order()
+    assert error.value.cycle == ["A", "B", "C", "A"]
+    assert not graph.is_acyclic()
+
+def test_long_chain_is_ordered_without_recursion():
+    """Test if a chain far deeper than the recursion limit is ordered"""
+    graph = make_graph((f"t{index}", f"t{index + 1}") for index in range(50000))
+
+    assert graph.topological_order() == list(range(50001))
@@ -0,0 +1,56 @@
+import json
+import os
+import polars as pl
+from src.benchmark.stub_api import StubApi
+from src.workflow_management import OfferWorkFlow
+
+def test_fused_scoring_matches_staged_scoring(tmp_path, make_config, read_sorted, fixed_clock):
+    """Test if fused scoring replaces the three scoring stages and the combiner with one task writing the same results"""
+    local_modes = {"ats_mode": "local", "resp_mode": "local", "offer_mode": "local"}
+    OfferWorkFlow(make_config("staged", **local_modes)).start()
+    workflow = OfferWorkFlow(make_config("fused", scoring_mode="fused", **local_modes))
+    workflow.start()
+
+    assert list(workflow.task_manager.tasks) == ["Extract", "Transform", "Score", "Load"]
+    assert read_sorted(tmp_path / "fused.csv").equals(read_sorted(tmp_path / "staged.csv"))
+
+def test_stream_scoring_sends_ndjson_batches(tmp_path, make_config, read_sorted, fixed_clock):
+    """Test if stream scoring sends request_batch_size members per NDJSON request to the fused endpoint"""
+    OfferWorkFlow(make_config("local", ats_mode="local", resp_mode="local", offer_mode="local")).start()
+    with StubApi() as api:
+        OfferWorkFlow(make_config("stream", api_url=api.url, scoring_mode="stream", request_batch_size=300)).start()
+        request_count = api.request_count
+
+    result = read_sorted(tmp_path / "stream.csv")
+    assert request_count == -(-result.height // 300)
+    assert result.equals(read_sorted(tmp_path / "local.csv"))
+
+def test_profiles_written_alongside_summary(tmp_path, make_config):
+    """Test if profiled tasks get their CPU profiles written next to the summary, which points at them"""
+    workflow = OfferWorkFlow(make_config("profiled", ats_mode="local", resp_mode="local", offer_mode="local", profile_tasks=["Transform"]))
+    workflow.start()
+
+    with open(tmp_path / "profiled.json") as f:
+        tasks = json.load(f)["tasks"]
+    assert tasks["Transform"]["profile"]["cpu_profile"] == str(tmp_path / "profiled.profiles" / "Transform.prof")
+    assert tasks["Transform"]["profile"]["peak_rss (MB)"] > 0
+    assert os.listdir(tmp_path / "profiled.profiles") == ["Transform.prof"]
+
+def test_repair_rescores_only_failed_rows(tmp_path, make_config, read_sorted, fixed_clock):
+    """Test if failed rows are recorded in the ledger and a repair run scores only them, merging them into the results"""
+    OfferWorkFlow(make_config("local", ats_mode="local", resp_mode="local", offer_mode="local")).start()
+    with StubApi(error_rate=0.3) as api:
+        first_run = OfferWorkFlow(make_config("remote", api_url=api.url, request_batch_size=50))
+        first_run.start()
+        failures = pl.read_csv(tmp_path / "remote.failures.csv")
+        failed_members = failures["memberId"].n_unique()
+        assert 0 < failed_members == first_run.get_summary()["row_failures"]["failed_rows"]
+        assert set(failures.filter(pl.col("task") == "Offer Recommendation")["error"]) <= {"HTTP 503", "MissingInput"}
+
+        api.error_rate = 0
+        repair_run = OfferWorkFlow(make_config("remote", api_url=api.url, request_batch_size=50, repair=True))
+        repair_run.start()
+
+    assert repair_run.task_manager.tasks["Load"].result_count == failed_members
+    assert pl.read_csv(tmp_path / "remote.failures.csv").height == 0
+    assert read_sorted(tmp_path / "remote.csv").equals(read_sorted(tmp_path / "local.csv"))